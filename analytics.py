@@ -0,0 +1,270 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, date, timedelta
+import click
+from flask import current_app
+from sqlalchemy import event, inspect, select, insert, update, delete, func
+from app import db
+from models import Job, Application, JobDailyStat, CategoryDailyStat, APPLICATION_STATUSES
+from tasks import task_queue
+from sqlite_mode import sqlite_mode
+from history import old_value, track_old_values
+from imports import UPSERT_DIALECTS
+
+JOB_STAT = JobDailyStat.__table__
+CATEGORY_STAT = CategoryDailyStat.__table__
+
+# Dashboards show this many days of history
+WINDOW_DAYS = 30
+
+def _day(value):
+    return (value or datetime.utcnow()).date()
+
+def _as_date(value):
+    # func.date() gives a date on Postgres and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+class Rollup:
+    # Column deltas per rollup row, gathered during one flush
+    def __init__(self):
+        self.jobs = defaultdict(Counter)        # (job_id, day) -> JobDailyStat deltas
+        self.employers = {}                     # job_id -> employer_id
+        self.categories = defaultdict(Counter)  # (day, category, job_type) -> CategoryDailyStat deltas
+        self.deleted_jobs = set()
+
+    def count_job(self, posted_date, category, job_type, sign):
+        self.categories[(_day(posted_date), category, job_type)]['jobs_posted'] += sign
+
+    def count_application(self, job, applied_date, status, reviewed_date, sign):
+        day = _day(applied_date)
+        self.employers[job.id] = job.employer_id
+        row = self.jobs[(job.id, day)]
+        row['applications'] += sign
+        if (status or 'pending') in APPLICATION_STATUSES:
+            row[f'status_{status or "pending"}'] += sign
+        if reviewed_date is not None:
+            review = self.jobs[(job.id, _day(reviewed_date))]
+            review['reviews'] += sign
+            review['review_seconds'] += sign * int((reviewed_date - (applied_date or reviewed_date)).total_seconds())
+        self.categories[(day, job.category, job.job_type)]['applications'] += sign
+
+    def write(self, connection):
+        for (job_id, day), columns in self.jobs.items():
+            _increment(connection, JOB_STAT, {'job_id': job_id, 'day': day,
+                                              'employer_id': self.employers[job_id]}, columns)
+        for (day, category, job_type), columns in self.categories.items():
+            _increment(connection, CATEGORY_STAT, {'day': day, 'category': category, 'job_type': job_type}, columns)
+        if self.deleted_jobs:
+            connection.execute(delete(JOB_STAT).where(JOB_STAT.c.job_id.in_(self.deleted_jobs)))
+
+def _increment(connection, table, key, columns):
+    # Relative upsert, so concurrent writers add to a row rather than
+    # overwrite it
+    columns = {name: delta for name, delta in columns.items() if delta}
+    if not columns:
+        return
+    insert_ = UPSERT_DIALECTS.get(connection.dialect.name)
+    if insert_ is None:
+        primary_key = [column.name for column in table.primary_key]
+        updated = connection.execute(
+            update(table).where(*(table.c[name] == key[name] for name in primary_key))
+            .values({name: table.c[name] + delta for name, delta in columns.items()})
+        ).rowcount
+        if not updated:
+            connection.execute(insert(table).values(**key, **columns))
+        return
+    statement = insert_(table).values(**key, **columns)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(table.primary_key),
+        set_={name: table.c[name] + statement.excluded[name] for name in columns},
+    ))
+
+def _collect_changes(session, flush_context, instances):
+    # Old values of changed and deleted rows must be read before the flush;
+    # new rows are counted after it, once their defaults are filled in
+    rollup, new = session.info.setdefault('analytics_rollup', (Rollup(), []))
+    new.extend(obj for obj in session.new if isinstance(obj, (Job, Application)))
+    for obj in session.deleted:
+        if isinstance(obj, Job):
+            rollup.count_job(old_value(obj, 'posted_date'), old_value(obj, 'category'),
+                             old_value(obj, 'job_type'), -1)
+            rollup.deleted_jobs.add(obj.id)
+        elif isinstance(obj, Application):
+            rollup.count_application(obj.job, old_value(obj, 'applied_date'), old_value(obj, 'status'),
+                                     old_value(obj, 'reviewed_date'), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Job) and _changed(obj, 'posted_date', 'category', 'job_type'):
+            rollup.count_job(old_value(obj, 'posted_date'), old_value(obj, 'category'),
+                             old_value(obj, 'job_type'), -1)
+            rollup.count_job(obj.posted_date, obj.category, obj.job_type, 1)
+        elif isinstance(obj, Application) and _changed(obj, 'applied_date', 'status', 'reviewed_date'):
+            rollup.count_application(obj.job, old_value(obj, 'applied_date'), old_value(obj, 'status'),
+                                     old_value(obj, 'reviewed_date'), -1)
+            rollup.count_application(obj.job, obj.applied_date, obj.status, obj.reviewed_date, 1)
+
+def _apply_changes(session, flush_context):
+    pending = session.info.pop('analytics_rollup', None)
+    if pending is None:
+        return
+    rollup, new = pending
+    for obj in new:
+        if isinstance(obj, Job):
+            rollup.count_job(obj.posted_date, obj.category, obj.job_type, 1)
+        else:
+            rollup.count_application(session.get(Job, obj.job_id), obj.applied_date, obj.status,
+                                     obj.reviewed_date, 1)
+    # Same transaction as the rows themselves, so a rollback undoes both
+    rollup.write(session.connection())
+
+def recompute(connection, since=None):
+    # Rebuilds every rollup row for days >= since (all days when None)
+    # straight from the base tables. Rows are deleted first so no increment
+    # committed meanwhile can be lost between reading and rewriting
+    after = datetime.combine(since, datetime.min.time()) if since else None
+    for table in (JOB_STAT, CATEGORY_STAT):
+        connection.execute(delete(table).where(table.c.day >= since) if since else delete(table))
+
+    rollup = Rollup()
+    applied_day = func.date(Application.applied_date)
+    statement = select(Job.id, Job.employer_id, Job.category, Job.job_type, applied_day,
+                       Application.status, func.count(Application.id))\
+        .join(Job, Job.id == Application.job_id)\
+        .group_by(Job.id, Job.employer_id, Job.category, Job.job_type, applied_day, Application.status)
+    if after:
+        statement = statement.where(Application.applied_date >= after)
+    for job_id, employer_id, category, job_type, day, status, count in connection.execute(statement):
+        day = _as_date(day)
+        rollup.employers[job_id] = employer_id
+        rollup.jobs[(job_id, day)]['applications'] += count
+        if (status or 'pending') in APPLICATION_STATUSES:
+            rollup.jobs[(job_id, day)][f'status_{status or "pending"}'] += count
+        rollup.categories[(day, category, job_type)]['applications'] += count
+
+    # Review durations are summed here rather than in SQL, where date
+    # arithmetic differs between SQLite and Postgres
+    statement = select(Job.id, Job.employer_id, Application.applied_date, Application.reviewed_date)\
+        .join(Job, Job.id == Application.job_id).where(Application.reviewed_date.is_not(None))
+    if after:
+        statement = statement.where(Application.reviewed_date >= after)
+    for job_id, employer_id, applied_date, reviewed_date in connection.execution_options(yield_per=5000).execute(statement):
+        rollup.employers[job_id] = employer_id
+        row = rollup.jobs[(job_id, reviewed_date.date())]
+        row['reviews'] += 1
+        row['review_seconds'] += int((reviewed_date - (applied_date or reviewed_date)).total_seconds())
+
+    posted_day = func.date(Job.posted_date)
+    statement = select(posted_day, Job.category, Job.job_type, func.count(Job.id))\
+        .group_by(posted_day, Job.category, Job.job_type)
+    if after:
+        statement = statement.where(Job.posted_date >= after)
+    for day, category, job_type, count in connection.execute(statement):
+        if day is not None:
+            rollup.categories[(_as_date(day), category, job_type)]['jobs_posted'] += count
+
+    job_rows = [dict(columns, job_id=job_id, day=day, employer_id=rollup.employers[job_id])
+                for (job_id, day), columns in rollup.jobs.items()]
+    category_rows = [dict(columns, day=day, category=category, job_type=job_type)
+                     for (day, category, job_type), columns in rollup.categories.items()]
+    # executemany needs the same keys in every row
+    for rows, table, keys in ((job_rows, JOB_STAT, ('job_id', 'day', 'employer_id')),
+                              (category_rows, CATEGORY_STAT, ('day', 'category', 'job_type'))):
+        columns = [column.name for column in table.columns if column.name not in keys]
+        if rows:
+            connection.execute(insert(table), [dict({name: 0 for name in columns}, **row) for row in rows])
+    return len(job_rows), len(category_rows)
+
+def _daily_series(since, values):
+    # One entry per day from `since` to today, zero where nothing happened
+    return [(since + timedelta(days=offset), values.get(since + timedelta(days=offset), 0))
+            for offset in range((_day(None) - since).days + 1)]
+
+def _review_hours(reviews, seconds):
+    return round(seconds / reviews / 3600, 1) if reviews else None
+
+def employer_analytics(employer_id, job_ids, days=WINDOW_DAYS):
+    # Reads only the rollup: the employer's daily applications and review
+    # time over the window, and the all-time funnel of each job in job_ids
+    since = _day(None) - timedelta(days=days - 1)
+    daily = {}
+    reviews = review_seconds = 0
+    for day, applications, day_reviews, day_seconds in db.session.execute(
+        select(JOB_STAT.c.day, func.sum(JOB_STAT.c.applications), func.sum(JOB_STAT.c.reviews),
+               func.sum(JOB_STAT.c.review_seconds))
+        .where(JOB_STAT.c.employer_id == employer_id, JOB_STAT.c.day >= since).group_by(JOB_STAT.c.day)
+    ):
+        daily[day] = applications
+        reviews += day_reviews
+        review_seconds += day_seconds
+    funnels = {}
+    if job_ids:
+        statuses = [func.sum(JOB_STAT.c[f'status_{status}']) for status in APPLICATION_STATUSES]
+        for job_id, applications, job_reviews, job_seconds, *counts in db.session.execute(
+            select(JOB_STAT.c.job_id, func.sum(JOB_STAT.c.applications), func.sum(JOB_STAT.c.reviews),
+                   func.sum(JOB_STAT.c.review_seconds), *statuses)
+            .where(JOB_STAT.c.job_id.in_(job_ids)).group_by(JOB_STAT.c.job_id)
+        ):
+            funnels[job_id] = {'applications': applications, 'statuses': dict(zip(APPLICATION_STATUSES, counts)),
+                               'review_hours': _review_hours(job_reviews, job_seconds)}
+    series = _daily_series(since, daily)
+    return {
+        'days': days,
+        'daily': series,
+        'daily_max': max(count for day, count in series),
+        'applications': sum(daily.values()),
+        'review_hours': _review_hours(reviews, review_seconds),
+        'funnels': funnels,
+    }
+
+def platform_analytics(days=WINDOW_DAYS):
+    # Reads only the rollup: jobs posted and applications per category and
+    # job type over the window, plus daily applications
+    since = _day(None) - timedelta(days=days - 1)
+    by_category = defaultdict(Counter)
+    by_job_type = defaultdict(Counter)
+    daily = Counter()
+    for day, category, job_type, jobs_posted, applications in db.session.execute(
+        select(CATEGORY_STAT.c.day, CATEGORY_STAT.c.category, CATEGORY_STAT.c.job_type,
+               CATEGORY_STAT.c.jobs_posted, CATEGORY_STAT.c.applications)
+        .where(CATEGORY_STAT.c.day >= since)
+    ):
+        for totals, name in ((by_category, category), (by_job_type, job_type)):
+            totals[name]['jobs_posted'] += jobs_posted
+            totals[name]['applications'] += applications
+        daily[day] += applications
+    series = _daily_series(since, daily)
+    ranked = lambda totals: sorted(totals.items(), key=lambda item: -item[1]['applications'])  # noqa: E731
+    return {
+        'days': days,
+        'daily': series,
+        'daily_max': max(count for day, count in series),
+        'by_category': ranked(by_category),
+        'by_job_type': ranked(by_job_type),
+    }
+
+def init_app(app):
+    track_old_values(Job.posted_date, Job.category, Job.job_type,
+                     Application.applied_date, Application.status, Application.reviewed_date)
+    event.listen(db.session, 'before_flush', _collect_changes)
+    event.listen(db.session, 'after_flush', _apply_changes)
+
+    @app.cli.command('rebuild-analytics')
+    @click.option('--days', type=int, help='Only the most recent days (default: everything)')
+    def rebuild_analytics(days):
+        since = _day(None) - timedelta(days=days - 1) if days else None
+        with db.engine.begin() as connection:
+            job_rows, category_rows = recompute(connection, since)
+        print(f"Rebuilt {job_rows} job and {category_rows} category rollup rows")
+
+@task_queue.periodic('ANALYTICS_CATCHUP_INTERVAL', 900)
+def catch_up_analytics():
+    # Recomputes the most recent days from the base tables. This folds in
+    # writers that bypass the session (bulk imports)
+    # and corrects any drift in the incremental counts
+    days = current_app.config.get('ANALYTICS_CATCHUP_DAYS', 2)
+    with sqlite_mode.immediate(), db.engine.begin() as connection:
+        job_rows, category_rows = recompute(connection, _day(None) - timedelta(days=days - 1))
+    logging.info(f"Analytics catch-up rewrote {job_rows} job and {category_rows} category rows")
@@ -1,54 +1,121 @@
 import os
 import logging
 from flask import Flask
+from markupsafe import Markup, escape
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask import Flask
-
-app = Flask(__name__, template_folder='templates')
-
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from replicas import RoutingSession
+from config import CONFIGS, from_environment
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///job_portal.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Initialize the app with the extension
-db.init_app(app)
-
-# Initialize Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = "login"  # type: ignore
-
+login_manager.login_view = "main.login"  # type: ignore
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
-
-with app.app_context():
-    # Import models here to ensure they are registered
-    import models  # noqa: F401
-    db.create_all()
-    logging.info("Database tables created successfully")
\ No newline at end of file
+    from identity import identity_cache
+    return identity_cache.load(int(user_id))
+
+def nl2br(text):
+    # Escapes the text, then keeps its line breaks
+    return Markup('<br>\n').join(escape(text or '').splitlines())
+
+def configure_logging(app):
+    # basicConfig only acts once per process, so the first app's profile wins
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    # With the root logger at INFO or below SQLAlchemy would log every
+    # statement and pool checkout; SQLALCHEMY_ECHO is the way to ask for that
+    logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
+
+def create_app(config_name=None, **overrides):
+    # Builds the app without touching the schema: run `flask init-db` (or
+    # migrations.init_db()) once per deploy before starting workers
+    config_name = config_name or os.environ.get('APP_CONFIG', 'production')
+    # The templates sit next to the modules
+    app = Flask(__name__, template_folder=os.path.dirname(os.path.abspath(__file__)))
+    app.jinja_env.filters['nl2br'] = nl2br
+    app.config.update(from_environment(os.environ))
+    app.config.from_object(CONFIGS[config_name])
+    app.config.update(overrides)
+    # How many proxies set each X-Forwarded-* header. Trusting headers no
+    # proxy sets would let clients pick their own address (and so their
+    # rate limits); x_for gives rate limits the client's address rather
+    # than the proxy's
+    hops = {name: app.config.get(f'PROXY_FIX_{name.upper()}', 0) for name in ('x_for', 'x_proto', 'x_host')}
+    if any(hops.values()):
+        app.wsgi_app = ProxyFix(app.wsgi_app, **hops)
+    configure_logging(app)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    with app.app_context():
+        import models
+
+        from replicas import replica_router
+        replica_router.init_app(app, db)
+
+        from sqlite_mode import sqlite_mode, group_commit
+        sqlite_mode.init_app(app, db)
+        group_commit.init_app(app)
+
+        import migrations
+        migrations.init_app(app)
+
+        import query_plans
+        query_plans.init_app(app)
+
+        from search import job_search
+        job_search.init_app(app)
+
+        import pagination
+        pagination.init_app(app)
+
+        import counters
+        counters.init_app(app)
+
+        import analytics
+        analytics.init_app(app)
+
+        from cache import page_cache
+        page_cache.init_app(app)
+        page_cache.invalidate_on(models.Job, 'jobs')
+
+        from conditional import conditional_requests
+        conditional_requests.init_app(app)
+
+        from ratelimit import rate_limiter
+        rate_limiter.init_app(app)
+
+        from identity import identity_cache
+        identity_cache.init_app(app)
+
+        from hashing import password_hasher
+        password_hasher.init_app(app)
+
+        from instrumentation import sql_instrumentation
+        sql_instrumentation.init_app(app)
+
+        from imports import job_importer
+        job_importer.init_app(app)
+
+        from tasks import task_queue
+        task_queue.init_app(app)
+
+        from matching import job_matcher
+        job_matcher.init_app(app)
+
+        from autocomplete import autocomplete
+        autocomplete.init_app(app)
+
+    from routes import bp
+    app.register_blueprint(bp)
+    return app
@@ -0,0 +1,229 @@
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from heapq import nlargest
+from sqlalchemy import event, func, select
+from app import db
+from models import Job
+from history import old_value, track_old_values
+
+FIELDS = ('location', 'company', 'title')
+# 'keywords' suggestions come from job titles and company names together
+FIELD_GROUPS = {'location': ('location',), 'company': ('company',), 'title': ('title',),
+                'keywords': ('title', 'company')}
+MAX_SUGGESTIONS = 10
+WARM_PREFIX_LENGTH = 2
+
+def normalize(value):
+    # Lowercase words only, so "New York, NY" and "new  york ny" share a key
+    return ' '.join(re.findall(r'\w+', (value or '').lower()))
+
+class PrefixIndex:
+    # Sorted (key, value) pairs, where every value is filed under each of
+    # its word-start suffixes ("new york" and "york"), so a prefix is a
+    # contiguous bisect range. Weights are active job counts. adjust()
+    # and lookup() can run on different threads, so both hold _lock
+    def __init__(self):
+        self.keys = []
+        self.values = []
+        self.spellings = {}
+        self.weights = Counter()
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        for raw, count in rows:
+            value = normalize(raw)
+            if value:
+                index.spellings.setdefault(value, Counter())[raw.strip()] += count
+                index.weights[value] += count
+        pairs = sorted((' '.join(words[start:]), value)
+                       for value in index.spellings
+                       for words in [value.split(' ')]
+                       for start in range(len(words)))
+        index.keys = [key for key, value in pairs]
+        index.values = [value for key, value in pairs]
+        return index
+
+    def adjust(self, raw, delta):
+        # Returns the short prefixes whose cached answers are now out of date.
+        # They keep being served until refresh() recomputes them, since
+        # answering one from scratch is too slow for a request
+        value = normalize(raw)
+        if not value:
+            return set()
+        stale = set()
+        with self._lock:
+            if value not in self.spellings:
+                self.spellings[value] = Counter()
+                words = value.split(' ')
+                for start in range(len(words)):
+                    key = ' '.join(words[start:])
+                    position = bisect_left(self.keys, key)
+                    self.keys.insert(position, key)
+                    self.values.insert(position, value)
+            self.spellings[value][raw.strip()] += delta
+            self.weights[value] += delta
+            # Only cached answers for prefixes of this value can have changed
+            words = value.split(' ')
+            for start in range(len(words)):
+                key = ' '.join(words[start:])
+                for end in range(1, len(key) + 1):
+                    if end <= WARM_PREFIX_LENGTH:
+                        stale.add(key[:end])
+                    else:
+                        self._results.pop(key[:end], None)
+        return stale
+
+    def _compute(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        values = {value for value in self.values[start:end] if self.weights[value] > 0}
+        best = nlargest(MAX_SUGGESTIONS, values, key=lambda value: (self.weights[value], value))
+        return [(self.spellings[value].most_common(1)[0][0], self.weights[value]) for value in best]
+
+    def lookup(self, prefix, limit=MAX_SUGGESTIONS):
+        # [(display value, active job count)], heaviest first
+        with self._lock:
+            results = self._results.get(prefix)
+            if results is None:
+                results = self._results[prefix] = self._compute(prefix)
+        return results[:limit]
+
+    def refresh(self, prefixes):
+        # One prefix per lock hold, so lookups aren't held up for long
+        for prefix in prefixes:
+            with self._lock:
+                self._results[prefix] = self._compute(prefix)
+
+    def warm(self):
+        # Short prefixes span the most entries; answer them ahead of time
+        self.refresh({key[:end] for key in self.keys for end in range(1, WARM_PREFIX_LENGTH + 1)})
+
+class Autocomplete:
+    # One PrefixIndex per field, held in memory by every process. Lookups
+    # never query the database: the indexes are built in a background
+    # thread, adjusted from committed Job changes seen by this process, and
+    # rebuilt every AUTOCOMPLETE_REFRESH seconds to pick up other writers.
+    # Short prefixes made stale by a change are recomputed on another
+    # background thread, not the committing request's
+    def __init__(self):
+        self.app = None
+        self.indexes = None
+        self.refresh_interval = 300
+        self.built_at = 0
+        self._lock = threading.Lock()
+        self._building = False
+        self._stale = {}
+        self._warming = False
+
+    def init_app(self, app):
+        self.app = app
+        self.refresh_interval = app.config.get('AUTOCOMPLETE_REFRESH', 300)
+        track_old_values(Job.location, Job.company, Job.title)
+        event.listen(db.session, 'before_flush', self._collect_changes)
+        event.listen(db.session, 'after_commit', self._apply_changes)
+        event.listen(db.session, 'after_rollback', self._discard_changes)
+        app.before_request(self._refresh_if_stale)
+        app.extensions['autocomplete'] = self
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self.built_at < self.refresh_interval or self._building:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_in_context, name='autocomplete-rebuild', daemon=True).start()
+
+    def _rebuild_in_context(self):
+        try:
+            with self.app.app_context():
+                self.rebuild()
+        except Exception:
+            logging.exception("Autocomplete rebuild failed")
+        finally:
+            self._building = False
+
+    def rebuild(self):
+        indexes = {}
+        with db.engine.connect() as connection:
+            for field in FIELDS:
+                column = getattr(Job, field)
+                rows = connection.execute(select(column, func.count()).where(Job.is_active == True)  # noqa: E712
+                                          .group_by(column)).all()
+                indexes[field] = PrefixIndex.build(rows)
+                indexes[field].warm()
+        # Swapped in whole, so lookups never see a half-built index
+        self.indexes = indexes
+        self.built_at = time.monotonic()
+
+    def _collect_changes(self, session, flush_context, instances):
+        changes = session.info.setdefault('autocomplete_changes', [])
+        for obj in session.new:
+            if isinstance(obj, Job) and obj.is_active is not False:
+                changes.extend((field, getattr(obj, field), 1) for field in FIELDS)
+        for obj in session.deleted:
+            if isinstance(obj, Job) and old_value(obj, 'is_active') is not False:
+                changes.extend((field, old_value(obj, field), -1) for field in FIELDS)
+        for obj in session.dirty:
+            if not isinstance(obj, Job):
+                continue
+            was_active = old_value(obj, 'is_active') is not False
+            is_active = obj.is_active is not False
+            for field in FIELDS:
+                old, new = old_value(obj, field), getattr(obj, field)
+                if was_active and (not is_active or old != new):
+                    changes.append((field, old, -1))
+                if is_active and (not was_active or old != new):
+                    changes.append((field, new, 1))
+
+    def _apply_changes(self, session):
+        changes = session.info.pop('autocomplete_changes', None)
+        if not changes or self.indexes is None:
+            return
+        with self._lock:
+            for field, value, delta in changes:
+                index = self.indexes[field]
+                self._stale.setdefault(index, set()).update(index.adjust(value or '', delta))
+            if self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self._refresh_stale, name='autocomplete-warm', daemon=True).start()
+
+    def _refresh_stale(self):
+        # Runs until no stale prefixes are left; the indexes live in this
+        # process's memory, so this can't be a task_queue task (which any
+        # process may claim)
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._warming = False
+                    return
+                index, prefixes = self._stale.popitem()
+            try:
+                index.refresh(prefixes)
+            except Exception:
+                logging.exception("Autocomplete refresh failed")
+
+    def _discard_changes(self, session):
+        session.info.pop('autocomplete_changes', None)
+
+    def suggest(self, field, query, limit=MAX_SUGGESTIONS):
+        prefix = normalize(query)
+        if not prefix or self.indexes is None:
+            return []
+        if len(FIELD_GROUPS[field]) == 1:
+            return self.indexes[field].lookup(prefix, limit)
+        merged = Counter()
+        for name in FIELD_GROUPS[field]:
+            for value, count in self.indexes[name].lookup(prefix, limit):
+                merged[value] += count
+        return merged.most_common(limit)
+
+autocomplete = Autocomplete()
@@ -0,0 +1,634 @@
+"""Load and latency benchmark for every route in routes.py.
+
+Seeds a database with realistic volumes through the models, then drives the
+routes with concurrent simulated users and reports p50/p95/p99 latency,
+queries per request and throughput per endpoint.
+
+    python benchmark.py --database sqlite:////tmp/bench.db --seed --save-baseline baseline.json
+    python benchmark.py --database sqlite:////tmp/bench.db --compare baseline.json
+    python benchmark.py --database sqlite:////tmp/bench.db --gunicorn --workers 4
+    python benchmark.py --database sqlite:////tmp/bench.db --strict-budgets
+    python benchmark.py --database sqlite:////tmp/bench.db --startup --startup-budget-ms 1500
+    python benchmark.py --database sqlite:////tmp/bench.db --sqlite-scaling --scaling-workers 1 2 4 8
+    python benchmark.py --database sqlite:////tmp/bench.db --seed --jobs 100000 --matching
+
+With --strict-budgets every list view must stay within its fixed @query_budget
+however many rows its page holds; violations are counted as errors.
+
+Queries per request are only measured in-process (Flask test client).
+
+--startup measures worker cold start instead: fresh interpreters importing
+and building the app, their first request, and the mean cost of a request
+afterwards, under the production and development profiles. The gap between
+the two per-request numbers is mostly debug logging and SQL headers.
+
+--sqlite-scaling runs a read/write mix from 1, 2, 4... worker processes
+sharing one SQLite file, first with SQLite's defaults and then in production
+mode (WAL, pragmas, group commit; sqlite_mode.py). It reports read and write
+throughput, "database is locked" failures and the mean group commit batch.
+
+--matching rebuilds the job match index (matching.py) and times ranking every
+active job against one stored resume, uncached, and re-ranking the busiest
+job's applicants. It fails when the p95 of either is over --match-budget-ms.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import contextlib
+import sqlite3
+import multiprocessing
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+WORDS = ['python', 'java', 'senior', 'junior', 'engineer', 'developer', 'manager', 'analyst', 'nurse',
+         'designer', 'sales', 'marketing', 'data', 'cloud', 'support', 'teacher', 'finance', 'remote']
+CITIES = ['New York, NY', 'San Francisco, CA', 'Austin, TX', 'Chicago, IL', 'Seattle, WA', 'Boston, MA',
+          'London, UK', 'Berlin, Germany', 'Toronto, Canada', 'Remote']
+CATEGORIES = ['technology', 'healthcare', 'finance', 'education', 'marketing', 'sales', 'engineering',
+              'design', 'customer_service', 'other']
+JOB_TYPES = ['full-time', 'part-time', 'contract', 'internship']
+STATUSES = ['pending', 'reviewed', 'accepted', 'rejected']
+PASSWORD = 'benchmark-password'
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def seed(users, employers, jobs, applications, seed_value=1):
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import User, Job, Application
+    import counters
+
+    rng = random.Random(seed_value)
+    # One hash shared by every seeded account keeps seeding fast
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.utcnow()
+
+    def user(username, role):
+        return User(username=username, email=f'{username}@example.com', password_hash=password_hash,
+                    first_name=username.title(), last_name='Bench', role=role,
+                    company_name=f'{username.title()} Inc' if role == 'employer' else None,
+                    location=rng.choice(CITIES), created_at=now - timedelta(days=rng.randint(0, 720)))
+
+    db.session.add(user('bench_admin', 'admin'))
+    db.session.add_all(user(f'bench_employer{i}', 'employer') for i in range(employers))
+    db.session.add_all(user(f'bench_seeker{i}', 'job_seeker') for i in range(users))
+    db.session.commit()
+    employer_ids = [row.id for row in User.query.filter_by(role='employer').with_entities(User.id)]
+    seeker_ids = [row.id for row in User.query.filter_by(role='job_seeker').with_entities(User.id)]
+
+    for start in range(0, jobs, 1000):
+        db.session.add_all(Job(
+            title=f'{sentence(rng, 2).title()} {rng.choice(["Engineer", "Manager", "Specialist", "Associate"])}',
+            company=f'Company {rng.randint(1, 500)}', description=sentence(rng, 120), requirements=sentence(rng, 30),
+            salary_min=rng.choice([None, 40000, 60000, 80000]), salary_max=rng.choice([None, 90000, 120000, 160000]),
+            location=rng.choice(CITIES), category=rng.choice(CATEGORIES), job_type=rng.choice(JOB_TYPES),
+            posted_date=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)), is_active=rng.random() > 0.1,
+            employer_id=rng.choice(employer_ids),
+        ) for _ in range(min(1000, jobs - start)))
+        db.session.commit()
+    job_ids = [row.id for row in Job.query.with_entities(Job.id)]
+
+    pairs = set()
+    while len(pairs) < min(applications, len(seeker_ids) * len(job_ids)):
+        pairs.add((rng.choice(seeker_ids), rng.choice(job_ids)))
+    pairs = list(pairs)
+    for start in range(0, len(pairs), 1000):
+        db.session.add_all(Application(
+            user_id=user_id, job_id=job_id, cover_letter=sentence(rng, 80), resume_text=sentence(rng, 200),
+            status=rng.choice(STATUSES), applied_date=now - timedelta(minutes=rng.randint(0, 60 * 24 * 180)),
+        ) for user_id, job_id in pairs[start:start + 1000])
+        db.session.commit()
+
+    with db.engine.begin() as connection:
+        counters.repair(connection)
+    print(f"Seeded {len(seeker_ids)} job seekers, {len(employer_ids)} employers, "
+          f"{len(job_ids)} jobs, {len(pairs)} applications")
+
+class Fixtures:
+    # Ids and names the scenarios pick from, loaded once from the seeded data
+    def __init__(self):
+        from models import User, Job, Application
+        self.job_ids = [row.id for row in Job.query.filter_by(is_active=True).with_entities(Job.id).limit(5000)]
+        self.seekers = [row.username for row in User.query.filter_by(role='job_seeker').with_entities(User.username).limit(500)]
+        employers = User.query.filter_by(role='employer').limit(200).all()
+        self.employers = [user.username for user in employers]
+        self.employer_jobs = {}
+        for job in Job.query.filter(Job.employer_id.in_([user.id for user in employers])).with_entities(Job.id, Job.employer_id):
+            self.employer_jobs.setdefault(job.employer_id, []).append(job.id)
+        self.employer_ids = {user.username: user.id for user in employers}
+        self.application_ids = {}
+        for application in Application.query.join(Job).filter(Job.employer_id.in_(list(self.employer_ids.values())))\
+                .with_entities(Application.id, Job.employer_id).limit(20000):
+            self.application_ids.setdefault(application.employer_id, []).append(application.id)
+
+# name: (role, method, path builder, form builder)
+SCENARIOS = {
+    'index': (None, 'GET', lambda f, u, rng: '/', None),
+    'search_keywords': (None, 'GET', lambda f, u, rng: '/jobs?' + urllib.parse.urlencode(
+        {'keywords': rng.choice(WORDS), 'page': rng.randint(1, 3)}), None),
+    'search_filters': (None, 'GET', lambda f, u, rng: '/jobs?' + urllib.parse.urlencode(
+        {'category': rng.choice(CATEGORIES), 'job_type': rng.choice(JOB_TYPES), 'location': rng.choice(CITIES)[:4]}), None),
+    'search_deep_page': (None, 'GET', lambda f, u, rng: f'/jobs?page={rng.randint(20, 50)}', None),
+    'job_detail': (None, 'GET', lambda f, u, rng: f'/job/{rng.choice(f.job_ids)}', None),
+    'seeker_dashboard': ('job_seeker', 'GET', lambda f, u, rng: '/dashboard', None),
+    'seeker_applications': ('job_seeker', 'GET', lambda f, u, rng: '/my-applications', None),
+    'seeker_apply': ('job_seeker', 'POST', lambda f, u, rng: f'/apply/{rng.choice(f.job_ids)}',
+                     lambda f, u, rng: {'cover_letter': sentence(rng, 60), 'resume_text': sentence(rng, 150)}),
+    'employer_dashboard': ('employer', 'GET', lambda f, u, rng: '/dashboard', None),
+    'employer_jobs': ('employer', 'GET', lambda f, u, rng: '/my-jobs', None),
+    'employer_job_applications': ('employer', 'GET', lambda f, u, rng: f'/job/{rng.choice(f.employer_jobs.get(f.employer_ids[u], f.job_ids))}/applications', None),
+    'employer_update_status': ('employer', 'GET', lambda f, u, rng: f'/application/{rng.choice(f.application_ids.get(f.employer_ids[u], [0]))}/update-status/{rng.choice(STATUSES)}', None),
+    'admin_dashboard': ('admin', 'GET', lambda f, u, rng: '/dashboard', None),
+    'admin_panel': ('admin', 'GET', lambda f, u, rng: f'/admin?jobs_page={rng.randint(1, 5)}', None),
+}
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+class QueryCounter:
+    # Counts statements per thread via SQLAlchemy engine events
+    def __init__(self, engines):
+        from sqlalchemy import event
+        self._local = threading.local()
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as error:
+            return error.code, error.read().decode('utf-8', 'replace')
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def with_csrf(session, path, data):
+    # Forms carry a CSRF token when CSRF protection is on (always over HTTP)
+    status, body = session.request('GET', path)
+    match = CSRF_PATTERN.search(body)
+    if match:
+        data = dict(data, csrf_token=match.group(1))
+    return data
+
+def log_in(session, username):
+    data = with_csrf(session, '/login', {'username': username, 'password': PASSWORD})
+    status, body = session.request('POST', '/login', data)
+    return status == 302
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def smoke_check(make_session, fixtures, usernames, names):
+    # One request per scenario before anything is timed: a page that
+    # errors would otherwise be timed as a very fast one
+    failures = []
+    sessions = {}
+    for name in names:
+        role, method, path_for, form_for = SCENARIOS[name]
+        rng = random.Random(f'smoke-{name}')
+        username = usernames[role][0] if role else None
+        if role not in sessions:
+            sessions[role] = make_session()
+            if username and not log_in(sessions[role], username):
+                failures.append(f"{name}: could not log in as {username}")
+                continue
+        session = sessions[role]
+        path = path_for(fixtures, username, rng)
+        data = form_for(fixtures, username, rng) if form_for else None
+        if data is not None:
+            data = with_csrf(session, path, data)
+        status, body = session.request(method, path, data)
+        if not 200 <= status < 400:
+            failures.append(f"{name}: {method} {path} returned {status}")
+    return failures
+
+def run_scenario(name, make_session, fixtures, usernames, requests, concurrency, query_counter=None):
+    role, method, path_for, form_for = SCENARIOS[name]
+    latencies, queries, errors = [], [], 0
+    lock = threading.Lock()
+
+    def simulated_user(worker):
+        nonlocal errors
+        rng = random.Random(f'{name}-{worker}')
+        session = make_session()
+        username = usernames[role][worker % len(usernames[role])] if role else None
+        if username and not log_in(session, username):
+            with lock:
+                errors += 1
+            return
+        for _ in range(requests // concurrency):
+            path = path_for(fixtures, username, rng)
+            data = form_for(fixtures, username, rng) if form_for else None
+            if data is not None:
+                data = with_csrf(session, path, data)
+            if query_counter:
+                query_counter.reset()
+            started = time.perf_counter()
+            status, body = session.request(method, path, data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if query_counter:
+                    queries.append(query_counter.count)
+                if status >= 400 and status != 404:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(simulated_user, range(concurrency)))
+    wall = time.perf_counter() - started
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        'throughput_rps': round(len(latencies) / wall, 1),
+    }
+
+def start_gunicorn(database, workers, port):
+    # Every simulated user comes from one address, so rate limits are off
+    env = dict(os.environ, DATABASE_URL=database, RATELIMIT_ENABLED='0')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', '4',
+         '--bind', f'127.0.0.1:{port}', 'main:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1)
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+# Runs in a fresh interpreter per sample, so imports are really cold
+STARTUP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1], PAGE_CACHE_TTL=0, TASK_WORKERS=0)
+created = time.perf_counter()
+client = app.test_client()
+client.get('/')
+first = time.perf_counter()
+requests = int(sys.argv[2])
+for _ in range(requests):
+    client.get('/')
+done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'cold_start_ms': (first - started) * 1000,
+    'per_request_ms': (done - first) * 1000 / requests,
+}))
+'''
+
+def measure_startup(database, profile, runs, requests):
+    env = dict(os.environ, DATABASE_URL=database)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_PROBE, profile, str(requests)], env=env, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {key: round(statistics.median(sample[key] for sample in samples), 2) for key in samples[0]}
+
+def run_startup(database, runs, requests, startup_budget_ms, request_budget_ms):
+    results = {profile: measure_startup(database, profile, runs, requests)
+               for profile in ('production', 'development')}
+    for profile, result in results.items():
+        print(f"{profile:28} " + ' '.join(f"{key}={value}" for key, value in result.items()))
+    production = results['production']
+    over = []
+    if startup_budget_ms and production['cold_start_ms'] > startup_budget_ms:
+        over.append(f"cold start {production['cold_start_ms']}ms > {startup_budget_ms}ms")
+    if request_budget_ms and production['per_request_ms'] > request_budget_ms:
+        over.append(f"per request {production['per_request_ms']}ms > {request_budget_ms}ms")
+    return results, over
+
+SCALING_READS = ('index', 'search_keywords', 'search_filters')
+SCALING_WRITES = ('seeker_apply', 'employer_update_status')
+
+def scaling_worker(database, production_mode, threads, duration, write_ratio, number, ready, start, results):
+    # Stands in for one gunicorn worker: its own app, pool and writer
+    # thread, sharing nothing with the others but the database file
+    os.environ['DATABASE_URL'] = database
+    from app import create_app
+    from sqlite_mode import group_commit
+    # Logins happen before timing starts, so they can hash inline
+    app = create_app('production', WTF_CSRF_ENABLED=False, TASK_WORKERS=0, PAGE_CACHE_TTL=0,
+                     PASSWORD_HASH_WORKERS=0, RATELIMIT_ENABLED=False, SQLITE_PRODUCTION_MODE=production_mode)
+    with app.app_context():
+        fixtures = Fixtures()
+    counts = Counter()
+    latencies = {'read': [], 'write': []}
+    lock = threading.Lock()
+    clients = []
+    for thread in range(threads):
+        rng = random.Random(f'scaling-{number}-{thread}')
+        users = {None: None, 'job_seeker': rng.choice(fixtures.seekers), 'employer': rng.choice(fixtures.employers)}
+        sessions = {role: TestClientSession(app) for role in users}
+        for role in ('job_seeker', 'employer'):
+            log_in(sessions[role], users[role])
+        clients.append((rng, users, sessions))
+
+    def simulated_user(client):
+        rng, users, sessions = client
+        while time.perf_counter() < stop_at:
+            kind = 'write' if rng.random() < write_ratio else 'read'
+            role, method, path_for, form_for = SCENARIOS[rng.choice(SCALING_WRITES if kind == 'write' else SCALING_READS)]
+            path = path_for(fixtures, users[role], rng)
+            data = form_for(fixtures, users[role], rng) if form_for else None
+            started = time.perf_counter()
+            status, body = sessions[role].request(method, path, data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status >= 500:
+                    counts[f'{kind}_errors'] += 1
+                else:
+                    counts[kind] += 1
+                    latencies[kind].append(elapsed)
+
+    ready.put(number)
+    start.wait()
+    stop_at = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(simulated_user, clients))
+    results.put(dict(counts, latencies=latencies, avg_batch=group_commit.metrics()['avg_batch']))
+
+def run_sqlite_scaling(database, worker_counts, threads, duration, write_ratio):
+    path = database.split('sqlite:///', 1)[1]
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for production_mode in (False, True):
+        if not production_mode:
+            # WAL is recorded in the database file, so the baseline has to switch it back off
+            with contextlib.closing(sqlite3.connect(path)) as connection:
+                mode = connection.execute('PRAGMA journal_mode = DELETE').fetchone()[0]
+            if mode != 'delete':
+                raise RuntimeError(f"could not leave {mode} journal mode; is the database in use?")
+        for workers in worker_counts:
+            ready, start, queue = context.Queue(), context.Event(), context.Queue()
+            processes = [context.Process(target=scaling_worker, args=(database, production_mode, threads, duration,
+                                                                      write_ratio, number, ready, start, queue))
+                         for number in range(workers)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                ready.get()
+            start.set()
+            samples = [queue.get() for _ in processes]
+            for process in processes:
+                process.join()
+            reads = [value for sample in samples for value in sample['latencies']['read']]
+            writes = [value for sample in samples for value in sample['latencies']['write']]
+            label = f"{'production' if production_mode else 'default'} x{workers}"
+            results[label] = {
+                'reads_per_s': round(len(reads) / duration, 1),
+                'writes_per_s': round(len(writes) / duration, 1),
+                'read_errors': sum(sample.get('read_errors', 0) for sample in samples),
+                'write_errors': sum(sample.get('write_errors', 0) for sample in samples),
+                'read_p95_ms': round(percentile(reads, 95) * 1000, 2) if reads else None,
+                'write_p95_ms': round(percentile(writes, 95) * 1000, 2) if writes else None,
+                'avg_batch': round(statistics.mean(sample['avg_batch'] for sample in samples), 2),
+            }
+            print(f"{label:28} " + ' '.join(f"{key}={value}" for key, value in results[label].items()))
+    return results
+
+def run_matching(runs, budget_ms):
+    from sqlalchemy import func, select
+    from app import db
+    from matching import job_matcher
+    from models import Application, Job
+
+    if not job_matcher.available:
+        print("NumPy/SciPy not installed; nothing to measure")
+        return {}, []
+    started = time.perf_counter()
+    indexed = job_matcher.rebuild()
+    print(f"Indexed {indexed} active jobs in {time.perf_counter() - started:.1f}s")
+    resumes = db.session.execute(select(Application.resume_text).limit(runs)).scalars().all()
+    job_id = db.session.execute(
+        select(Application.job_id).group_by(Application.job_id).order_by(func.count().desc()).limit(1)
+    ).scalar()
+    if not resumes:
+        print("No applications to take resumes from")
+        return {}, []
+    job = db.session.get(Job, job_id)
+    job_matcher.index.top(resumes[0])
+
+    timings = {'rank_jobs': [], 'rank_applicants': []}
+    for resume in resumes:
+        started = time.perf_counter()
+        job_matcher.index.top(resume, 10)
+        timings['rank_jobs'].append(time.perf_counter() - started)
+    for _ in range(min(runs, 20)):
+        started = time.perf_counter()
+        job_matcher.rank_applications(job)
+        timings['rank_applicants'].append(time.perf_counter() - started)
+
+    results, over = {}, []
+    for name, latencies in timings.items():
+        results[name] = {
+            'runs': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+        print(f"{name:28} " + ' '.join(f"{key}={value}" for key, value in results[name].items()))
+        if results[name]['p95_ms'] > budget_ms:
+            over.append(f"{name} p95 {results[name]['p95_ms']}ms > {budget_ms}ms")
+    results['rank_jobs']['jobs'] = indexed
+    results['rank_applicants']['applicants'] = db.session.execute(
+        select(func.count()).where(Application.job_id == job_id)
+    ).scalar()
+    return results, over
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'endpoint':28} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'q/req base':>10} {'q/req now':>10}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not result.get('requests') or not before.get('requests'):
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        print(f"{name:28} {before['p95_ms']:>10} {result['p95_ms']:>10} {change:>+8.0%} "
+              f"{str(before.get('queries_per_request')):>10} {str(result.get('queries_per_request')):>10}")
+        more_queries = (result.get('queries_per_request') or 0) > (before.get('queries_per_request') or 0)
+        if change > tolerance or more_queries:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='sqlite:////tmp/job_portal_bench.db')
+    parser.add_argument('--seed', action='store_true', help='populate the database first')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--employers', type=int, default=200)
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--applications', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--only', nargs='*', choices=sorted(SCENARIOS), help='endpoints to run')
+    parser.add_argument('--gunicorn', action='store_true', help='drive a real gunicorn server over HTTP')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown vs baseline')
+    parser.add_argument('--strict-budgets', action='store_true',
+                        help='fail requests that exceed their @query_budget or repeat a statement (N+1)')
+    parser.add_argument('--startup', action='store_true', help='measure worker cold start and per-request overhead')
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--startup-budget-ms', type=float, help='fail if a production cold start is slower')
+    parser.add_argument('--request-budget-ms', type=float, help='fail if a production request of / is slower')
+    parser.add_argument('--sqlite-scaling', action='store_true',
+                        help='compare read/write throughput by worker count with and without SQLite production mode')
+    parser.add_argument('--scaling-workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--scaling-threads', type=int, default=4, help='request threads per worker')
+    parser.add_argument('--scaling-seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--matching', action='store_true', help='time job and applicant ranking against the match index')
+    parser.add_argument('--match-runs', type=int, default=200)
+    parser.add_argument('--match-budget-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    from app import create_app, db
+    import migrations
+
+    app = create_app(os.environ.get('APP_CONFIG', 'production'), RATELIMIT_ENABLED=False)
+    with app.app_context():
+        migrations.init_db()
+        if args.seed:
+            seed(args.users, args.employers, args.jobs, args.applications)
+        fixtures = Fixtures()
+
+    if args.startup:
+        results, over = run_startup(args.database, args.startup_runs, args.requests,
+                                    args.startup_budget_ms, args.request_budget_ms)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+        if over:
+            print(f"\nOver budget: {'; '.join(over)}")
+            sys.exit(1)
+        return
+
+    if args.matching:
+        with app.app_context():
+            results, over = run_matching(args.match_runs, args.match_budget_ms)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+        if over:
+            print(f"\nOver budget: {'; '.join(over)}")
+            sys.exit(1)
+        return
+
+    if args.sqlite_scaling:
+        if not args.database.startswith('sqlite:///'):
+            parser.error('--sqlite-scaling needs a sqlite:/// database')
+        with app.app_context():
+            db.engine.dispose()
+        results = run_sqlite_scaling(args.database, args.scaling_workers, args.scaling_threads,
+                                     args.scaling_seconds, args.write_ratio)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+        return
+
+    usernames = {'job_seeker': fixtures.seekers, 'employer': fixtures.employers, 'admin': ['bench_admin']}
+
+    process = None
+    if args.gunicorn:
+        process, base_url = start_gunicorn(args.database, args.workers, args.port)
+        make_session, query_counter = (lambda: HttpSession(base_url)), None
+    else:
+        app.config['WTF_CSRF_ENABLED'] = False
+        if args.strict_budgets:
+            from instrumentation import sql_instrumentation
+            sql_instrumentation.strict = True
+        with app.app_context():
+            query_counter = QueryCounter(db.engines.values())
+        make_session = lambda: TestClientSession(app)  # noqa: E731
+
+    results = {}
+    try:
+        failures = smoke_check(make_session, fixtures, usernames, args.only or SCENARIOS)
+        if failures:
+            print('Smoke check failed:\n  ' + '\n  '.join(failures))
+            sys.exit(1)
+        for name in args.only or SCENARIOS:
+            results[name] = run_scenario(name, make_session, fixtures, usernames,
+                                         args.requests, args.concurrency, query_counter)
+            result = results[name]
+            print(f"{name:28} " + ' '.join(f"{key}={value}" for key, value in result.items()))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
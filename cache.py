@@ -0,0 +1,201 @@
+import time
+import pickle
+import logging
+import threading
+from functools import wraps
+from itertools import chain
+from collections import OrderedDict
+from flask import g, request, session, make_response, Response
+from flask_login import current_user
+from sqlalchemy import event
+from app import db
+
+class TTLCache:
+    # Small bounded in-process cache; entries expire after ttl seconds and
+    # the least recently used entry is evicted once maxsize is reached
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class LocalCacheBackend:
+    # Per-process LRU; invalidation only reaches the worker that made the
+    # change, other workers fall back to the TTL
+    def __init__(self, maxsize=512, ttl=300):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value, ttl):
+        self._entries.set(key, value, ttl)
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCacheBackend:
+    # Shared across workers and hosts; tag versions live in Redis so one
+    # bump invalidates every worker's view at once
+    def __init__(self, url, prefix='page-cache:'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, pickle.dumps(value), ex=ttl)
+
+    def version(self, tag):
+        return int(self._client.get(f'{self._prefix}version:{tag}') or 0)
+
+    def bump(self, tag):
+        self._client.incr(f'{self._prefix}version:{tag}')
+
+    def __len__(self):
+        return self._client.dbsize()
+
+class PageCache:
+    def __init__(self):
+        self.backend = LocalCacheBackend()
+        self.ttl = 300
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._watched = {}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        url = app.config.get('PAGE_CACHE_REDIS_URL')
+        if url:
+            try:
+                self.backend = RedisCacheBackend(url)
+            except ImportError:
+                logging.warning("PAGE_CACHE_REDIS_URL is set but redis is not installed; using the local page cache")
+        if not isinstance(self.backend, RedisCacheBackend):
+            self.backend = LocalCacheBackend(app.config.get('PAGE_CACHE_SIZE', 512), self.ttl)
+        app.extensions['page_cache'] = self
+
+    def _count(self, tag, outcome):
+        with self._stats_lock:
+            self.stats.setdefault(tag, {'hits': 0, 'misses': 0, 'bypassed': 0})[outcome] += 1
+
+    def _cacheable_request(self):
+        # Only anonymous GETs with no pending flash messages share a rendering
+        return (request.method == 'GET'
+                and not current_user.is_authenticated
+                and '_flashes' not in session)
+
+    def cached(self, tag):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable_request():
+                    self._count(tag, 'bypassed')
+                    return view(*args, **kwargs)
+                # g.etag is set when conditional_requests validated the
+                # request; it tracks the data more closely than the tag version
+                key = f'{tag}:{self.backend.version(tag)}:{g.get("etag", "")}:{request.full_path}'
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count(tag, 'hits')
+                    body, status, mimetype = entry
+                    return Response(body, status=status, mimetype=mimetype)
+                self._count(tag, 'misses')
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, (response.get_data(), response.status_code, response.mimetype), self.ttl)
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, tag):
+        self.backend.bump(tag)
+
+    def invalidate_on(self, model, tag):
+        # Drop pages tagged `tag` once a transaction that inserted, changed
+        # or deleted a `model` row commits
+        self._watched[model] = tag
+        if len(self._watched) == 1:
+            event.listen(db.session, 'after_flush', self._note_changes)
+            event.listen(db.session, 'after_commit', self._invalidate_changed)
+            event.listen(db.session, 'after_rollback', self._discard_changes)
+
+    def _note_changes(self, session, flush_context):
+        tags = session.info.setdefault('page_cache_tags', set())
+        for obj in chain(session.new, session.dirty, session.deleted):
+            tag = self._watched.get(type(obj))
+            if tag:
+                tags.add(tag)
+
+    def _invalidate_changed(self, session):
+        for tag in session.info.pop('page_cache_tags', ()):
+            self.invalidate(tag)
+
+    def _discard_changes(self, session):
+        session.info.pop('page_cache_tags', None)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = {tag: dict(counts) for tag, counts in self.stats.items()}
+        for counts in stats.values():
+            served = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = round(counts['hits'] / served, 3) if served else None
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'ttl': self.ttl,
+            'tags': stats,
+        }
+
+page_cache = PageCache()
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import Counter
+from datetime import timezone
+from functools import wraps
+from flask import g, request, session, make_response, Response
+from sqlalchemy import func, select
+from app import db
+from models import Job, StatCounter
+from cache import page_cache
+
+class ConditionalRequests:
+    # ETag / Last-Modified for public pages. Validators come from one cheap
+    # query made before the view runs, so a matching If-None-Match or
+    # If-Modified-Since is answered with 304 without rendering anything
+    def __init__(self):
+        self.salt = ''
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        # Change HTTP_ETAG_SALT when templates change, so clients holding
+        # pages rendered by the old ones refetch them
+        self.salt = app.config.get('HTTP_ETAG_SALT', '')
+        app.extensions['conditional_requests'] = self
+
+    def _count(self, endpoint, outcome):
+        with self._stats_lock:
+            self.stats.setdefault(endpoint, Counter())[outcome] += 1
+
+    def conditional(self, validator, max_age=60):
+        # validator(**view_args) returns (state, last_modified), or None to
+        # leave the request to the view (e.g. a job that doesn't exist)
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Same rule as the page cache: only renderings it may share
+                # with anyone are public
+                if not page_cache._cacheable_request():
+                    self._count(request.endpoint, 'private')
+                    response = make_response(view(*args, **kwargs))
+                    # Per-user content: browsers may keep it, shared caches may not
+                    response.cache_control.private = True
+                    response.cache_control.no_cache = True
+                    return response
+                validators = validator(**kwargs)
+                if validators is None:
+                    return view(*args, **kwargs)
+                state, last_modified = validators
+                etag = hashlib.sha1(repr((self.salt, request.endpoint, state)).encode()).hexdigest()
+                if last_modified is not None:
+                    last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+                if self._not_modified(etag, last_modified):
+                    self._count(request.endpoint, 'not_modified')
+                    response = Response(status=304)
+                else:
+                    self._count(request.endpoint, 'rendered')
+                    # Part of the page cache key, so a body cached before
+                    # the data changed is never sent under the new ETag
+                    g.etag = etag
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.vary.add('Cookie')
+                if session.modified:
+                    # The response sets a cookie, so it must not be shared
+                    response.cache_control.private = True
+                else:
+                    response.cache_control.public = True
+                response.cache_control.max_age = max_age
+                return response
+            return wrapper
+        return decorator
+
+    def _not_modified(self, etag, last_modified):
+        # If-None-Match wins when both are sent (RFC 9110 13.2.2)
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        since = request.if_modified_since
+        return since is not None and last_modified is not None and last_modified <= since
+
+    def metrics(self):
+        with self._stats_lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+
+conditional_requests = ConditionalRequests()
+
+def listing_validators(**view_args):
+    # Any insert, edit or deactivation moves max(updated_at) (an index
+    # lookup); the job total also catches rows deleted outright
+    updated_at, total = db.session.execute(select(
+        func.max(Job.updated_at),
+        select(StatCounter.value).where(StatCounter.name == 'jobs').scalar_subquery(),
+    )).one()
+    return (updated_at, total), updated_at
+
+def job_validators(job_id):
+    row = db.session.execute(select(Job.updated_at, Job.posted_date).where(Job.id == job_id)).first()
+    if row is None:
+        return None
+    updated_at = row.updated_at or row.posted_date
+    return (job_id, updated_at), updated_at
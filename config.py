@@ -0,0 +1,69 @@
+from replicas import pool_options, REPLICA_PREFIX
+
+# Profiles for create_app(); APP_CONFIG picks one, production by default.
+# Anything not set here falls back to the default each module documents
+
+class Config:
+    DEBUG = False
+    TESTING = False
+    # Level for the root logger. SQLAlchemy's own loggers stay at WARNING
+    # whatever this says; SQLALCHEMY_ECHO turns statement logging on
+    LOG_LEVEL = 'INFO'
+    SQL_INSTRUMENTATION = 'log'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+class ProductionConfig(Config):
+    # Deployed behind one reverse proxy, which sets X-Forwarded-For,
+    # -Proto and -Host (see PROXY_FIX_* in app.py)
+    PROXY_FIX_X_FOR = 1
+    PROXY_FIX_X_PROTO = 1
+    PROXY_FIX_X_HOST = 1
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    LOG_LEVEL = 'DEBUG'
+    SQL_INSTRUMENTATION = 'headers'
+
+class TestingConfig(Config):
+    TESTING = True
+    LOG_LEVEL = 'WARNING'
+    # A private in-memory database; call migrations.init_db() to create it
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_BINDS = {}
+    WTF_CSRF_ENABLED = False
+    SQL_STRICT_BUDGETS = True
+    # Everything runs inline or on demand, nothing in the background
+    TASK_WORKERS = 0
+    PASSWORD_HASH_WORKERS = 0
+    SQLITE_GROUP_COMMIT = False
+    # Every test client shares one address
+    RATELIMIT_ENABLED = False
+
+CONFIGS = {
+    'production': ProductionConfig,
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+}
+
+def from_environment(environ):
+    # Settings that come from the deployment; profiles may override them
+    engine_options = pool_options(environ)
+    return {
+        'SECRET_KEY': environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production'),
+        'SQLALCHEMY_DATABASE_URI': environ.get('DATABASE_URL', 'sqlite:///job_portal.db'),
+        # WAL, tuned pragmas and group commit for file-backed SQLite
+        # (sqlite_mode.py); SQLITE_PRODUCTION_MODE=0 leaves SQLite at its defaults
+        'SQLITE_PRODUCTION_MODE': environ.get('SQLITE_PRODUCTION_MODE', '1') != '0',
+        # Token bucket limits on search, login and apply (ratelimit.py)
+        'RATELIMIT_ENABLED': environ.get('RATELIMIT_ENABLED', '1') != '0',
+        # Pool sizing comes from DB_POOL_SIZE, DB_MAX_OVERFLOW,
+        # DB_POOL_TIMEOUT and DB_POOL_RECYCLE; the same options apply to
+        # every replica
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options,
+        # Comma-separated read replica URLs; GET requests read from these (replicas.py)
+        'SQLALCHEMY_BINDS': {
+            f'{REPLICA_PREFIX}{number}': dict(engine_options, url=url.strip())
+            for number, url in enumerate(environ.get('DATABASE_REPLICA_URLS', '').split(','))
+            if url.strip()
+        },
+    }
@@ -0,0 +1,161 @@
+import logging
+from collections import Counter
+from sqlalchemy import event, inspect, update, select, func, case
+from app import db
+from models import User, Job, Application, StatCounter, APPLICATION_STATUSES
+from history import old_value, track_old_values
+
+COUNTER_NAMES = (
+    ['users', 'users_active', 'jobs', 'jobs_active', 'applications']
+    + [f'applications_{status}' for status in APPLICATION_STATUSES]
+)
+
+def _change(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if history.deleted and history.added and history.deleted[0] != history.added[0]:
+        return history.deleted[0], history.added[0]
+    return None
+
+def _is_active(value):
+    # Columns default to True at INSERT time
+    return value is not False
+
+def _collect_deltas(session, flush_context, instances):
+    # Runs before the flush so that rows about to be deleted can still be
+    # read; the deltas are applied once the flush has assigned ids
+    deltas = Counter()
+    job_deltas = Counter()
+    new_applications = []
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            deltas['users'] += 1
+            deltas['users_active'] += _is_active(obj.is_active)
+        elif isinstance(obj, Job):
+            deltas['jobs'] += 1
+            deltas['jobs_active'] += _is_active(obj.is_active)
+        elif isinstance(obj, Application):
+            deltas['applications'] += 1
+            deltas[f'applications_{obj.status or "pending"}'] += 1
+            new_applications.append(obj)
+
+    deleted_job_ids = {obj.id for obj in session.deleted if isinstance(obj, Job)}
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            deltas['users'] -= 1
+            deltas['users_active'] -= _is_active(old_value(obj, 'is_active'))
+        elif isinstance(obj, Job):
+            deltas['jobs'] -= 1
+            deltas['jobs_active'] -= _is_active(old_value(obj, 'is_active'))
+        elif isinstance(obj, Application):
+            deltas['applications'] -= 1
+            deltas[f'applications_{old_value(obj, "status")}'] -= 1
+            job_id = old_value(obj, 'job_id')
+            if job_id not in deleted_job_ids:
+                job_deltas[job_id] -= 1
+
+    for obj in session.dirty:
+        if isinstance(obj, (User, Job)):
+            change = _change(obj, 'is_active')
+            if change:
+                key = 'users_active' if isinstance(obj, User) else 'jobs_active'
+                deltas[key] += 1 if _is_active(change[1]) else -1
+        elif isinstance(obj, Application):
+            change = _change(obj, 'status')
+            if change:
+                deltas[f'applications_{change[0]}'] -= 1
+                deltas[f'applications_{change[1]}'] += 1
+
+    session.info['counter_deltas'] = (deltas, job_deltas, new_applications)
+
+def _apply_deltas(session, flush_context):
+    pending = session.info.pop('counter_deltas', None)
+    if pending is None:
+        return
+    deltas, job_deltas, new_applications = pending
+    for application in new_applications:
+        job_deltas[application.job_id] += 1
+    connection = session.connection()
+    apply_deltas(connection, deltas)
+    # An application is not an edit of its job: updated_at stays as it is
+    for job_id, delta in job_deltas.items():
+        if delta:
+            connection.execute(update(Job.__table__)
+                               .where(Job.__table__.c.id == job_id)
+                               .values(application_count=Job.__table__.c.application_count + delta,
+                                       updated_at=Job.__table__.c.updated_at))
+
+def apply_deltas(connection, deltas):
+    # Relative UPDATEs in the same transaction as the rows themselves, so
+    # concurrent workers never overwrite each other's increments. Also used
+    # by writers that bypass the ORM session (imports.py)
+    for name, delta in deltas.items():
+        if delta and name in COUNTER_NAMES:
+            connection.execute(update(StatCounter.__table__)
+                               .where(StatCounter.__table__.c.name == name)
+                               .values(value=StatCounter.__table__.c.value + delta))
+
+def _recompute(connection):
+    # Every counter from scratch, in a handful of aggregate queries
+    values = dict.fromkeys(COUNTER_NAMES, 0)
+    users, users_active = connection.execute(select(
+        func.count(User.id), func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0)  # noqa: E712
+    )).one()
+    jobs, jobs_active = connection.execute(select(
+        func.count(Job.id), func.coalesce(func.sum(case((Job.is_active == True, 1), else_=0)), 0)  # noqa: E712
+    )).one()
+    values.update(users=users, users_active=users_active, jobs=jobs, jobs_active=jobs_active)
+    for status, count in connection.execute(
+        select(Application.status, func.count(Application.id)).group_by(Application.status)
+    ):
+        values['applications'] += count
+        if f'applications_{status}' in values:
+            values[f'applications_{status}'] = count
+    return values
+
+def repair(connection):
+    table = StatCounter.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert(), [
+        {'name': name, 'value': value} for name, value in _recompute(connection).items()
+    ])
+    per_job = select(func.count(Application.id))\
+        .where(Application.job_id == Job.__table__.c.id).scalar_subquery()
+    # Keeping updated_at as it is stops the onupdate default from changing
+    # every job's HTTP validators when no count moved
+    connection.execute(update(Job.__table__).values(application_count=per_job,
+                                                    updated_at=Job.__table__.c.updated_at))
+
+def _needs_repair(connection):
+    # Fresh databases, and ones migrated to application_count, start empty
+    present = connection.execute(select(func.count()).select_from(StatCounter.__table__)).scalar()
+    return present != len(COUNTER_NAMES)
+
+def get_counts(*names):
+    rows = db.session.query(StatCounter.name, StatCounter.value)\
+        .filter(StatCounter.name.in_(names)).all()
+    counts = dict.fromkeys(names, 0)
+    counts.update(rows)
+    return counts
+
+def get_count(name):
+    return get_counts(name)[name]
+
+def repair_if_needed(connection):
+    # Run by `flask init-db`
+    if _needs_repair(connection):
+        logging.info("Recomputing stat counters")
+        repair(connection)
+
+def init_app(app):
+    # Load the previous value on assignment so toggles of expired rows are
+    # still seen as changes
+    track_old_values(User.is_active, Job.is_active, Application.status)
+    event.listen(db.session, 'before_flush', _collect_deltas)
+    event.listen(db.session, 'after_flush', _apply_deltas)
+
+    @app.cli.command('repair-counters')
+    def repair_counters():
+        with db.engine.begin() as connection:
+            repair(connection)
+        print("Counters recomputed: " + ', '.join(f'{name}={value}' for name, value in get_counts(*COUNTER_NAMES).items()))
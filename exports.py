@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy import select
+from app import db
+from models import User, Job, Application
+
+# Rows are read in keyset chunks of CHUNK_SIZE, each in its own short
+# transaction that ends before any of its rows is sent, so a slow client
+# never holds a connection or a snapshot, and memory stays bounded however
+# many rows an export has
+CHUNK_SIZE = 2000
+
+# Text applicants typed themselves. A spreadsheet would run a cell starting
+# with one of FORMULA_PREFIXES as a formula, so CSV exports quote it
+FREE_TEXT_COLUMNS = {'cover_letter', 'resume_text'}
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+APPLICATION_COLUMNS = [
+    Application.id, Application.job_id, Job.title.label('job_title'), Application.status,
+    Application.applied_date, Application.reviewed_date,
+    User.first_name, User.last_name, User.email, User.phone, User.location,
+    Application.cover_letter, Application.resume_text,
+]
+
+JOB_COLUMNS = [
+    Job.id, Job.title, Job.company, Job.location, Job.category, Job.job_type,
+    Job.salary_min, Job.salary_max, Job.posted_date, Job.deadline, Job.is_active,
+    Job.application_count, Job.employer_id, Job.external_ref, Job.description, Job.requirements,
+]
+
+USER_COLUMNS = [
+    User.id, User.username, User.email, User.first_name, User.last_name, User.role,
+    User.company_name, User.phone, User.location, User.created_at, User.is_active,
+]
+
+def job_applications_export(job_id):
+    statement = select(*APPLICATION_COLUMNS).join(User, User.id == Application.user_id)\
+        .join(Job, Job.id == Application.job_id).where(Application.job_id == job_id)
+    return statement, Application.id
+
+def employer_jobs_export(employer_id):
+    return select(*JOB_COLUMNS).where(Job.employer_id == employer_id), Job.id
+
+ADMIN_EXPORTS = {
+    'users': lambda: (select(*USER_COLUMNS), User.id),
+    'jobs': lambda: (select(*JOB_COLUMNS), Job.id),
+    'applications': lambda: (select(*APPLICATION_COLUMNS).join(User, User.id == Application.user_id)
+                             .join(Job, Job.id == Application.job_id), Application.id),
+}
+
+def iter_rows(statement, key_column, chunk_size=CHUNK_SIZE):
+    last_key = None
+    while True:
+        chunk = statement.order_by(key_column).limit(chunk_size)
+        if last_key is not None:
+            chunk = chunk.where(key_column > last_key)
+        with db.engine.connect() as connection:
+            rows = connection.execute(chunk).all()
+        if rows:
+            last_key = rows[-1][0]
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _neutralise(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def encode_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    free_text = [column in FREE_TEXT_COLUMNS for column in columns]
+    for row in rows:
+        writer.writerow([_neutralise(value) if text else _value(value) for value, text in zip(row, free_text)])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def encode_jsonl(rows, columns):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(dict(zip(columns, (_value(value) for value in row)))))
+        if len(batch) >= 500:
+            yield ('\n'.join(batch) + '\n').encode('utf-8')
+            batch = []
+    if batch:
+        yield ('\n'.join(batch) + '\n').encode('utf-8')
+
+ENCODERS = {'csv': encode_csv, 'jsonl': encode_jsonl}
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_export(statement, key_column, filename, fmt, gzip=False):
+    columns = [column.name for column in statement.selected_columns]
+    chunks = ENCODERS[fmt](iter_rows(statement, key_column), columns)
+    filename = f'{filename}.{fmt}'
+    mimetype = FORMATS[fmt]
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    # No Content-Length, so the body goes out chunked as it is produced
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
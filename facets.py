@@ -0,0 +1,47 @@
+from collections import Counter
+from sqlalchemy import func
+from app import db
+from models import Job
+from cache import TTLCache
+from search import job_search, parse_terms
+
+# Facet counts are slightly stale at worst; every page of the same search
+# shares one aggregate query
+FACET_CACHE_TTL = 60
+facet_cache = TTLCache(maxsize=512, ttl=FACET_CACHE_TTL)
+
+def normalize_location(location):
+    return ' '.join((location or '').split())
+
+def facet_key(keywords, location):
+    return (tuple(parse_terms(keywords)), normalize_location(location))
+
+def grouped_counts_query(keywords, location):
+    # One GROUP BY over (category, job_type) under the keyword and location
+    # filters; both facets are derived from these rows
+    query = db.session.query(Job.category, Job.job_type, func.count(Job.id))\
+        .filter(Job.is_active == True)  # noqa: E712
+    location = normalize_location(location)
+    if location:
+        query = query.filter(Job.location.contains(location))
+    query = job_search.apply(query, keywords, ranked=False)
+    return query.group_by(Job.category, Job.job_type)
+
+def _grouped_counts(keywords, location):
+    rows = grouped_counts_query(keywords, location).all()
+    return tuple((category, job_type, count) for category, job_type, count in rows)
+
+def facet_counts(keywords=None, location=None, category=None, job_type=None):
+    rows = facet_cache.get_or_set(
+        facet_key(keywords, location), lambda: _grouped_counts(keywords, location)
+    )
+    # Each facet is counted under the other facet's selection, so the user
+    # can see what switching to a different value would return
+    categories = Counter()
+    job_types = Counter()
+    for row_category, row_job_type, count in rows:
+        if not job_type or row_job_type == job_type:
+            categories[row_category] += count
+        if not category or row_category == category:
+            job_types[row_job_type] += count
+    return {'category': dict(categories), 'job_type': dict(job_types)}
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, TextAreaField, SelectField, IntegerField, PasswordField, DateField
 from wtforms.validators import DataRequired, Email, Length, EqualTo, Optional, NumberRange
 from wtforms.widgets import TextArea
@@ -47,13 +48,16 @@ class JobForm(FlaskForm):
     ], validators=[DataRequired()], render_kw={"class": "form-select"})
     deadline = DateField('Application Deadline', validators=[Optional()], render_kw={"class": "form-control"})
 
+class JobImportForm(FlaskForm):
+    feed = FileField('Job Feed (CSV or JSONL)', validators=[FileRequired(), FileAllowed(['csv', 'jsonl'], 'Upload a .csv or .jsonl file')], render_kw={"class": "form-control"})
+
 class ApplicationForm(FlaskForm):
     cover_letter = TextAreaField('Cover Letter', validators=[DataRequired()], render_kw={"class": "form-control", "rows": "8"})
     resume_text = TextAreaField('Resume/CV (Text)', validators=[DataRequired()], render_kw={"class": "form-control", "rows": "10"})
 
 class SearchForm(FlaskForm):
-    keywords = StringField('Keywords', validators=[Optional()], render_kw={"class": "form-control", "placeholder": "Job title, company, or skills"})
-    location = StringField('Location', validators=[Optional()], render_kw={"class": "form-control", "placeholder": "City, state, or country"})
+    keywords = StringField('Keywords', validators=[Optional()], render_kw={"class": "form-control", "placeholder": "Job title, company, or skills", "data-autocomplete": "keywords"})
+    location = StringField('Location', validators=[Optional()], render_kw={"class": "form-control", "placeholder": "City, state, or country", "data-autocomplete": "location"})
     category = SelectField('Category', choices=[
         ('', 'All Categories'),
         ('technology', 'Technology'),
@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from cache import TTLCache
+
+class HashingBusy(Exception):
+    # Every hashing slot stayed taken for PASSWORD_HASH_QUEUE_TIMEOUT seconds
+    pass
+
+class PasswordHasher:
+    # Runs Werkzeug's hash/check functions in a process pool so the CPU cost
+    # of a login storm is capped at `workers` cores instead of every request
+    # thread, and at most `max_pending` calls wait for a slot
+    def __init__(self):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.max_pending = 0
+        self.queue_timeout = 5
+        self.max_failures = 5
+        self.failures = TTLCache(maxsize=10000, ttl=300)
+        self._prefix = None
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.workers * 4)
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5)
+        self.max_failures = app.config.get('LOGIN_MAX_FAILURES', 5)
+        self.failures = TTLCache(maxsize=10000, ttl=app.config.get('LOGIN_FAILURE_WINDOW', 300))
+        self._slots = threading.BoundedSemaphore(max(1, self.max_pending))
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # The pool is created lazily in each (possibly forked) worker process
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        try:
+            started = time.monotonic()
+            result = self._get_executor().submit(fn, *args).result()
+            logging.debug(f"{fn.__name__} took {time.monotonic() - started:.3f}s")
+            return result
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    @property
+    def prefix(self):
+        # Werkzeug hashes start with the full parameter string, e.g.
+        # 'scrypt:32768:8:1$salt$hash'; hashing once reveals that prefix
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    # Failed-login throttle: after max_failures misses for a username within
+    # the window, further attempts are rejected without hashing anything
+    def is_throttled(self, username):
+        return self.failures.get(username.lower(), 0) >= self.max_failures
+
+    def record_failure(self, username):
+        key = username.lower()
+        self.failures.set(key, self.failures.get(key, 0) + 1)
+
+    def reset_failures(self, username):
+        self.failures.delete(username.lower())
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,18 @@
+from sqlalchemy import event, inspect
+
+def old_value(obj, attr):
+    # Value as last loaded from the database (before any pending change)
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, attr)
+
+def track_old_values(*attributes):
+    # Load the previous value on assignment, so old_value() still sees it
+    # when the row was expired before it changed
+    for attribute in attributes:
+        event.listen(attribute, 'set', _load_old_value, active_history=True)
+
+def _load_old_value(target, value, oldvalue, initiator):
+    # Registered only for its active_history side effect
+    pass
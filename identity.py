@@ -0,0 +1,106 @@
+import logging
+from itertools import chain
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from app import db
+from models import User
+from cache import TTLCache, RedisCacheBackend, page_cache
+
+USER_CACHE_TTL = 30
+USER_CACHE_SIZE = 4096
+
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'role',
+                   'company_name', 'phone', 'location', 'created_at', 'is_active')
+
+class UserSnapshot(UserMixin):
+    # Read-only copy of the User columns that requests read from current_user;
+    # use db.session.get(User, current_user.id) to modify the row
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only')
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+class IdentityCache:
+    # Snapshots are cached per process, each with the user's version, which
+    # every change bumps; a worker reuses its snapshot only while the
+    # version matches, so a change reaches every worker on its next request.
+    # With the Redis page cache the versions are kept there. Without it the
+    # version is user.identity_version, checked with a primary key lookup
+    def __init__(self):
+        self._cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self._versions = None
+
+    def init_app(self, app):
+        self._cache = TTLCache(maxsize=app.config.get('USER_CACHE_SIZE', USER_CACHE_SIZE),
+                               ttl=app.config.get('USER_CACHE_TTL', USER_CACHE_TTL))
+        # page_cache is set up first (app.py)
+        self._versions = page_cache.backend if isinstance(page_cache.backend, RedisCacheBackend) else None
+        event.listen(db.session, 'before_flush', self._bump_versions)
+        event.listen(db.session, 'after_flush', self._note_changes)
+        event.listen(db.session, 'after_commit', self._invalidate_changed)
+        event.listen(db.session, 'after_rollback', self._discard_changes)
+
+    def _version(self, user_id):
+        try:
+            return self._versions.version(f'user:{user_id}')
+        except Exception:
+            logging.exception("Could not read the user version; loading the user from the database")
+            return None
+
+    def load(self, user_id):
+        entry = self._cache.get(user_id)
+        if self._versions is not None:
+            version = self._version(user_id)
+        elif entry is not None:
+            version = db.session.execute(select(User.identity_version).where(User.id == user_id)).scalar()
+        else:
+            # Nothing to check; the version is read with the row below
+            version = None
+        if entry is not None and version is not None and entry[0] == version:
+            snapshot = entry[1]
+        else:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot(user)
+            if self._versions is None:
+                version = user.identity_version
+            if version is not None:
+                self._cache.set(user_id, (version, snapshot))
+        # Deactivated accounts lose their session on the next request
+        return snapshot if snapshot.is_active else None
+
+    def invalidate(self, user_id):
+        self._cache.delete(user_id)
+        if self._versions is not None:
+            try:
+                self._versions.bump(f'user:{user_id}')
+            except Exception:
+                logging.exception(f"Could not invalidate user {user_id} in other workers")
+
+    def _bump_versions(self, session, flush_context, instances):
+        for obj in session.dirty:
+            if isinstance(obj, User) and session.is_modified(obj):
+                obj.identity_version = User.identity_version + 1
+
+    def _note_changes(self, session, flush_context):
+        changed = session.info.setdefault('identity_changes', set())
+        for obj in chain(session.dirty, session.deleted):
+            if isinstance(obj, User):
+                changed.add(obj.id)
+
+    def _invalidate_changed(self, session):
+        for user_id in session.info.pop('identity_changes', ()):
+            self.invalidate(user_id)
+
+    def _discard_changes(self, session):
+        session.info.pop('identity_changes', None)
+
+identity_cache = IdentityCache()
@@ -0,0 +1,268 @@
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta
+import click
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MultiDict
+from app import db
+from models import User, Job, JobImport
+from forms import JobForm
+import counters
+from search import job_search
+from cache import page_cache
+from matching import job_matcher
+from sqlite_mode import sqlite_mode
+from tasks import task_queue
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns a feed row may set; everything except external_ref goes through JobForm
+FIELDS = ['title', 'company', 'description', 'requirements', 'salary_min', 'salary_max',
+          'location', 'category', 'job_type', 'deadline']
+EXTERNAL_REF_LENGTH = 100
+
+# Only the first errors are kept on the JobImport row; the rest are counted
+MAX_REPORTED_ERRORS = 200
+
+# A pending or running import with no update for this long is marked failed
+# (its process died or was restarted). Running imports update their row
+# after every batch, so only a lost one goes this long without
+IMPORT_STALE_AFTER = 1800
+
+UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+def read_records(stream, fmt):
+    # Yields (row number, dict of raw values) from a binary stream
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(text), start=1)
+            return
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                record = {'__error__': f'Invalid JSON: {error}'}
+            if not isinstance(record, dict):
+                record = {'__error__': 'Each line must be a JSON object'}
+            yield number, record
+    finally:
+        # Leave the caller's stream open
+        text.detach()
+
+def validate_record(record):
+    # Same rules as the post_job form; returns (values, None) or (None, errors)
+    if '__error__' in record:
+        return None, {'row': [record['__error__']]}
+    formdata = MultiDict({
+        name: str(record[name]).strip() for name in FIELDS if record.get(name) not in (None, '')
+    })
+    form = JobForm(formdata=formdata, meta={'csrf': False})
+    errors = {} if form.validate() else dict(form.errors)
+    external_ref = str(record.get('external_ref') or '').strip() or None
+    if external_ref and len(external_ref) > EXTERNAL_REF_LENGTH:
+        errors['external_ref'] = [f'Field cannot be longer than {EXTERNAL_REF_LENGTH} characters.']
+    if errors:
+        return None, errors
+    values = {name: form[name].data for name in FIELDS}
+    if isinstance(values['deadline'], date):
+        values['deadline'] = datetime.combine(values['deadline'], time())
+    values['external_ref'] = external_ref
+    return values, None
+
+def _upsert_statement(dialect):
+    table = Job.__table__
+    insert_ = UPSERT_DIALECTS.get(dialect.name)
+    if insert_ is None:
+        # No ON CONFLICT support: a repeated external_ref fails its batch
+        return insert(table)
+    statement = insert_(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.employer_id, table.c.external_ref],
+        set_=dict({name: statement.excluded[name] for name in FIELDS}, updated_at=statement.excluded.updated_at),
+    )
+
+def write_batch(connection, employer_id, rows):
+    # One multi-row upsert for the batch; returns (inserted, updated).
+    # Counters, the search index and cached pages are kept in step here
+    # because Core statements skip the ORM session events
+    table = Job.__table__
+    refs = [row['external_ref'] for row in rows if row['external_ref']]
+    existing = 0
+    if refs:
+        existing = len(connection.execute(select(table.c.id).where(
+            table.c.employer_id == employer_id, table.c.external_ref.in_(refs)
+        )).all())
+    now = datetime.utcnow()
+    parameters = [dict(row, employer_id=employer_id, posted_date=now, updated_at=now,
+                       is_active=True, application_count=0)
+                  for row in rows]
+    jobs = connection.execute(
+        _upsert_statement(connection.dialect).returning(
+            table.c.id, table.c.title, table.c.company, table.c.description, table.c.is_active
+        ),
+        parameters,
+    ).all()
+    inserted = len(rows) - existing
+    counters.apply_deltas(connection, {'jobs': inserted, 'jobs_active': inserted})
+    job_search.index_jobs(connection, jobs)
+    job_matcher.queue_update(connection, [job.id for job in jobs])
+    return inserted, existing
+
+def import_jobs(stream, fmt, employer_id, batch_size=None, progress=None):
+    # Streams a feed through validation into batched upserts, each batch in
+    # its own short transaction. Invalid rows are reported, never fatal
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 1000)
+    stats = {'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    batch = []
+    refs = set()
+
+    def flush():
+        if batch:
+            with sqlite_mode.immediate(), db.engine.begin() as connection:
+                inserted, updated = write_batch(connection, employer_id, batch)
+            page_cache.invalidate('jobs')
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            batch.clear()
+            refs.clear()
+        if progress:
+            progress(stats)
+
+    for number, record in read_records(stream, fmt):
+        values, errors = validate_record(record)
+        if errors:
+            stats['failed'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append({'row': number, 'errors': errors})
+            continue
+        # ON CONFLICT can't touch the same row twice in one statement, so a
+        # repeated reference starts a new batch (the later row wins)
+        if values['external_ref'] in refs:
+            flush()
+        batch.append(values)
+        if values['external_ref']:
+            refs.add(values['external_ref'])
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+class JobImporter:
+    def __init__(self):
+        self.app = None
+        self.upload_folder = None
+        self.stale_after = timedelta(seconds=IMPORT_STALE_AFTER)
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+        self.upload_folder = app.config.get('IMPORT_UPLOAD_FOLDER') or tempfile.gettempdir()
+        self.stale_after = timedelta(seconds=app.config.get('IMPORT_STALE_AFTER', IMPORT_STALE_AFTER))
+        # Imports run one at a time per process by default, so a big feed
+        # can't starve the request threads of database connections
+        self._executor = ThreadPoolExecutor(max_workers=app.config.get('IMPORT_WORKERS', 1),
+                                            thread_name_prefix='job-import')
+        app.extensions['job_importer'] = self
+
+        @app.cli.command('import-jobs')
+        @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+        @click.option('--employer', required=True, help='Username that will own the imported jobs')
+        @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension')
+        def import_jobs_command(path, employer, fmt):
+            user = User.query.filter_by(username=employer).first()
+            if user is None:
+                sys.exit(f"No user named {employer}")
+            fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+            if fmt not in FORMATS:
+                sys.exit("Pass --format csv or --format jsonl")
+
+            def report(stats):
+                click.echo(f"\r{stats['inserted']} inserted, {stats['updated']} updated, "
+                           f"{stats['failed']} failed", nl=False)
+
+            with open(path, 'rb') as stream:
+                stats = import_jobs(stream, fmt, user.id, progress=report)
+            click.echo()
+            for error in stats['errors']:
+                click.echo(f"row {error['row']}: {json.dumps(error['errors'])}")
+
+    def save_upload(self, upload):
+        # Spool the upload to disk so the request can return right away
+        handle, path = tempfile.mkstemp(prefix='job-import-', dir=self.upload_folder)
+        with os.fdopen(handle, 'wb') as destination:
+            upload.save(destination)
+        return path
+
+    def submit(self, job_import_id, path):
+        self._executor.submit(self._run, job_import_id, path)
+
+    def _set(self, job_import_id, status_was=None, **values):
+        # Returns whether the row was updated; with status_was, only if the
+        # import still has that status
+        table = JobImport.__table__
+        statement = update(table).where(table.c.id == job_import_id)
+        if status_was is not None:
+            statement = statement.where(table.c.status == status_was)
+        with sqlite_mode.immediate(), db.engine.begin() as connection:
+            return connection.execute(statement.values(**values)).rowcount > 0
+
+    def fail_stale(self):
+        # Imports left pending or running by a process that died would
+        # otherwise show as in progress forever
+        table = JobImport.__table__
+        now = datetime.utcnow()
+        error = {'row': None, 'errors': {'import': ['The import was interrupted. Upload the feed again to finish it.']}}
+        with sqlite_mode.immediate(), db.engine.begin() as connection:
+            return connection.execute(
+                update(table).where(table.c.status.in_(['pending', 'running']),
+                                    table.c.updated_at < now - self.stale_after)
+                .values(status='failed', finished_at=now, errors=json.dumps([error]))
+            ).rowcount
+
+    def _run(self, job_import_id, path):
+        with self.app.app_context():
+            try:
+                job_import = db.session.get(JobImport, job_import_id)
+                employer_id, fmt = job_import.employer_id, job_import.format
+                db.session.remove()
+                if not self._set(job_import_id, status_was='pending', status='running',
+                                 total_bytes=os.path.getsize(path)):
+                    # Failed as stale while it waited for a worker
+                    return
+                with open(path, 'rb') as stream:
+                    def report(stats):
+                        self._set(job_import_id, processed_bytes=stream.tell(),
+                                  rows_inserted=stats['inserted'], rows_updated=stats['updated'],
+                                  rows_failed=stats['failed'])
+
+                    stats = import_jobs(stream, fmt, employer_id, progress=report)
+                self._set(job_import_id, status='finished', finished_at=datetime.utcnow(),
+                          errors=json.dumps(stats['errors']) if stats['errors'] else None)
+            except Exception as error:
+                logging.exception(f"Job import {job_import_id} failed")
+                self._set(job_import_id, status='failed', finished_at=datetime.utcnow(),
+                          errors=json.dumps([{'row': None, 'errors': {'import': [str(error)]}}]))
+            finally:
+                os.remove(path)
+
+job_importer = JobImporter()
+
+@task_queue.periodic('IMPORT_MAINTENANCE_INTERVAL', 300)
+def fail_stale_imports():
+    failed = job_importer.fail_stale()
+    if failed:
+        logging.warning(f"Marked {failed} stalled job imports as failed")
@@ -0,0 +1,141 @@
+import json
+import re
+import time
+import logging
+import threading
+from collections import Counter
+from flask import g, request, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from app import db
+
+# Same statement shape this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 5
+SLOWEST_STATEMENTS = 3
+
+logger = logging.getLogger('sql')
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def query_budget(max_queries):
+    # Marks a view with the most statements one request may run
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+def statement_shape(statement):
+    # Collapse literal lists and whitespace so "IN (?, ?, ?)" and
+    # "IN (?, ?)" count as the same statement
+    shape = re.sub(r'\((\s*(\?|%\(\w+\)s|:\w+)\s*,?)+\)', '(?)', statement)
+    return ' '.join(shape.split())
+
+class SQLInstrumentation:
+    def __init__(self):
+        self.mode = 'off'
+        self.strict = False
+        self.default_budget = None
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        # 'headers' exposes per-request numbers on the response (development),
+        # 'log' writes structured log lines for problem requests (production)
+        self.mode = app.config.get('SQL_INSTRUMENTATION', 'headers' if app.debug else 'log')
+        self.strict = app.config.get('SQL_STRICT_BUDGETS', False)
+        self.default_budget = app.config.get('SQL_QUERY_BUDGET')
+        if self.mode == 'off':
+            return
+        # Every engine, so statements sent to read replicas are counted too
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['sql_instrumentation'] = self
+
+    def _start_request(self):
+        g.sql_statements = []
+        g.sql_template = None
+
+    def _template_started(self, sender, template, context, **extra):
+        g.sql_template = template.name
+
+    def _template_finished(self, sender, template, context, **extra):
+        g.sql_template = None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['sql_started'].pop()
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements.append((statement_shape(statement), elapsed, g.sql_template))
+
+    def summarize(self, statements):
+        shapes = Counter(shape for shape, elapsed, template in statements)
+        templates = {}
+        for shape, elapsed, template in statements:
+            templates.setdefault(shape, set()).add(template or 'view')
+        repeated = [
+            {'statement': shape, 'count': count, 'source': sorted(templates[shape])}
+            for shape, count in shapes.most_common() if count >= N_PLUS_ONE_THRESHOLD
+        ]
+        slowest = sorted(statements, key=lambda item: item[1], reverse=True)[:SLOWEST_STATEMENTS]
+        return {
+            'queries': len(statements),
+            'db_time_ms': round(sum(elapsed for shape, elapsed, template in statements) * 1000, 2),
+            'slowest': [{'statement': shape, 'ms': round(elapsed * 1000, 2)} for shape, elapsed, template in slowest],
+            'n_plus_one': repeated,
+        }
+
+    def _finish_request(self, response):
+        statements = g.pop('sql_statements', None)
+        if statements is None:
+            return response
+        summary = self.summarize(statements)
+        endpoint = request.endpoint or request.path
+        # functools.wraps copies the attribute onto decorating wrappers
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', self.default_budget)
+        over_budget = budget is not None and summary['queries'] > budget
+        self._record(endpoint, summary, over_budget)
+
+        if self.strict and (over_budget or summary['n_plus_one']):
+            raise QueryBudgetExceeded(
+                f"{endpoint} ran {summary['queries']} queries (budget {budget}); "
+                f"repeated: {[item['statement'] for item in summary['n_plus_one']]}"
+            )
+        if self.mode == 'headers':
+            response.headers['X-DB-Query-Count'] = str(summary['queries'])
+            response.headers['X-DB-Time-Ms'] = str(summary['db_time_ms'])
+            if summary['n_plus_one']:
+                top = summary['n_plus_one'][0]
+                response.headers['X-DB-N-Plus-One'] = f"{top['count']}x from {', '.join(top['source'])}"
+        elif self.mode == 'log' and (over_budget or summary['n_plus_one']):
+            logger.warning(json.dumps(dict(summary, endpoint=endpoint, path=request.path, budget=budget)))
+        return response
+
+    def _record(self, endpoint, summary, over_budget):
+        with self._lock:
+            stats = self.metrics.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time_ms': 0.0,
+                'over_budget': 0, 'n_plus_one': 0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += summary['queries']
+            stats['max_queries'] = max(stats['max_queries'], summary['queries'])
+            stats['db_time_ms'] = round(stats['db_time_ms'] + summary['db_time_ms'], 2)
+            stats['over_budget'] += over_budget
+            stats['n_plus_one'] += bool(summary['n_plus_one'])
+
+    def snapshot(self):
+        with self._lock:
+            metrics = {endpoint: dict(stats) for endpoint, stats in self.metrics.items()}
+        for stats in metrics.values():
+            stats['avg_queries'] = round(stats['queries'] / stats['requests'], 2)
+        return metrics
+
+sql_instrumentation = SQLInstrumentation()
@@ -0,0 +1,382 @@
+import importlib.util
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from app import db
+from models import Job, Application
+from cache import TTLCache
+from tasks import task_queue
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, where index writers are only serialized per process
+    fcntl = None
+
+# Matching is optional; without NumPy/SciPy it is switched off. They take a
+# few hundred milliseconds to import, so that happens on first use rather
+# than in every worker at boot
+NUMERIC_AVAILABLE = all(importlib.util.find_spec(name) for name in ('numpy', 'scipy'))
+np = sparse = None
+
+def _load_numeric():
+    global np, sparse
+    if np is None:
+        import numpy
+        from scipy import sparse as scipy_sparse
+        np, sparse = numpy, scipy_sparse
+
+# Terms are hashed into a fixed feature space, so the index never needs a
+# shared vocabulary and new jobs can be added without re-vectorizing old ones
+N_FEATURES = 2 ** 18
+MIN_TERM_LENGTH = 2
+STOP_WORDS = frozenset(
+    'a an and are as at be been but by can do for from has have in into is it its of on or our '
+    'that the their this to was we were will with you your'.split()
+)
+TOKEN = re.compile(r'[a-z0-9][a-z0-9+#]*')
+
+# Applicants are vectorized and scored this many resumes at a time
+RANK_BATCH_SIZE = 2000
+
+# Fields of Job that feed its vector; changes to them reindex the job
+JOB_TEXT_FIELDS = ('title', 'description', 'requirements', 'is_active')
+
+@lru_cache(maxsize=4096)
+def term_counts(text):
+    # Hashed term -> count. Cached, since the same resumes are re-ranked on
+    # every view of a job's applicants; callers must not modify the result
+    counts = Counter()
+    for token, count in Counter(TOKEN.findall((text or '').lower())).items():
+        if len(token) >= MIN_TERM_LENGTH and token not in STOP_WORDS:
+            counts[zlib.crc32(token.encode('utf-8')) % N_FEATURES] += count
+    return counts
+
+def job_document(title, description, requirements):
+    # The title counts twice: it is the best short summary of the role
+    return ' '.join([title or '', title or '', description or '', requirements or ''])
+
+def _raw_matrix(counts_list):
+    indices, data, indptr = array('i'), array('f'), array('i', [0])
+    for counts in counts_list:
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.frombuffer(data, dtype=np.float32), np.frombuffer(indices, dtype=np.int32),
+         np.frombuffer(indptr, dtype=np.int32)),
+        shape=(len(indptr) - 1, N_FEATURES),
+    )
+
+def weigh(matrix, idf):
+    # Sublinear tf * idf, then unit-length rows, so a dot product is a
+    # cosine similarity
+    matrix = matrix.astype(np.float32)
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+def vectorize(texts, idf):
+    return weigh(_raw_matrix(term_counts(text) for text in texts), idf)
+
+class MatchIndex:
+    # A base segment (CSC, one column per hashed term, built by rebuild())
+    # plus a small delta segment of jobs changed since. Segments are
+    # directories of .npy arrays opened with mmap_mode='r'; manifest.json
+    # names the live ones and is swapped atomically, so readers in every
+    # process pick up a new version without ever seeing a partial one
+    def __init__(self, path, delta_limit=5000):
+        self.path = path
+        self.delta_limit = delta_limit
+        self._state = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _writing(self):
+        # One writer at a time across threads and processes
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(os.path.join(self.path, 'lock'), 'w') as handle:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _save_segment(self, name, matrix, ids, **arrays):
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+        for key, value in dict(arrays, data=matrix.data, indices=matrix.indices,
+                               indptr=matrix.indptr, ids=ids).items():
+            np.save(os.path.join(directory, f'{key}.npy'), value)
+
+    def _load_segment(self, name, csc):
+        directory = os.path.join(self.path, name)
+        load = lambda key: np.load(os.path.join(directory, f'{key}.npy'), mmap_mode='r')  # noqa: E731
+        ids = load('ids')
+        matrix_class = sparse.csc_matrix if csc else sparse.csr_matrix
+        matrix = matrix_class((load('data'), load('indices'), load('indptr')),
+                              shape=(len(ids), N_FEATURES), copy=False)
+        return matrix, ids, directory
+
+    def _publish(self, manifest):
+        temporary = self.manifest_path + '.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(manifest, handle)
+        os.replace(temporary, self.manifest_path)
+        # Old segments stay readable through existing mmaps after unlinking
+        live = {manifest['base'], manifest['delta']}
+        for name in os.listdir(self.path):
+            if name not in live and name.startswith(('base-', 'delta-')):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def state(self):
+        # The loaded index, reloaded when another process has published a new one
+        _load_numeric()
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            manifest = self.manifest()
+            base, base_ids, directory = self._load_segment(manifest['base'], csc=True)
+            delta, delta_ids, _ = self._load_segment(manifest['delta'], csc=False)
+            replaced = np.load(os.path.join(self.path, manifest['delta'], 'replaced.npy'))
+            self._state = {
+                'manifest': manifest,
+                'idf': np.load(os.path.join(directory, 'idf.npy'), mmap_mode='r'),
+                'base': base,
+                'base_ids': base_ids,
+                # Base rows superseded by the delta, or removed, never score
+                'base_live': ~np.isin(base_ids, replaced),
+                'delta': delta.tocsc(),
+                'delta_ids': np.asarray(delta_ids),
+                'delta_csr': delta,
+                'replaced': replaced,
+            }
+            self._mtime = mtime
+        return self._state
+
+    def rebuild(self, documents):
+        # documents yields (job id, text) for every active job
+        _load_numeric()
+        ids = array('q')
+
+        def counts():
+            for job_id, text in documents:
+                ids.append(job_id)
+                yield term_counts(text)
+
+        raw = _raw_matrix(counts())
+        # Each row holds a term once, so column counts are document frequencies
+        df = np.bincount(raw.indices, minlength=N_FEATURES)
+        idf = (np.log((1 + raw.shape[0]) / (1 + df)) + 1).astype(np.float32)
+        base = weigh(raw, idf).tocsc()
+        ids = np.frombuffer(ids, dtype=np.int64)
+        with self._writing():
+            version = (self.manifest() or {}).get('version', 0) + 1
+            self._save_segment(f'base-{version}', base, ids, idf=idf)
+            self._save_segment(f'delta-{version}', sparse.csr_matrix((0, N_FEATURES), dtype=np.float32),
+                               np.zeros(0, dtype=np.int64), replaced=np.zeros(0, dtype=np.int64))
+            self._publish({'version': version, 'base': f'base-{version}', 'delta': f'delta-{version}',
+                           'documents': len(ids), 'built_at': time.time()})
+        return len(ids)
+
+    def update(self, documents, removed_ids):
+        # Reindex changed jobs into the delta segment. Returns False when the
+        # index is missing or the delta has outgrown delta_limit, in which
+        # case the caller should rebuild
+        with self._writing():
+            state = self.state()
+            if state is None:
+                return False
+            documents = list(documents)
+            changed = {job_id for job_id, text in documents} | set(removed_ids)
+            keep = ~np.isin(state['delta_ids'], list(changed))
+            rows = vectorize([text for job_id, text in documents], state['idf'])
+            delta = sparse.vstack([state['delta_csr'][keep], rows], format='csr')
+            delta_ids = np.concatenate([state['delta_ids'][keep],
+                                        np.array([job_id for job_id, text in documents], dtype=np.int64)])
+            replaced = np.union1d(state['replaced'], np.array(sorted(changed), dtype=np.int64))
+            if len(delta_ids) + len(replaced) > self.delta_limit:
+                return False
+            manifest = dict(state['manifest'])
+            manifest['version'] += 1
+            manifest['delta'] = f"delta-{manifest['version']}"
+            self._save_segment(manifest['delta'], delta.astype(np.float32), delta_ids, replaced=replaced)
+            self._publish(manifest)
+        return True
+
+    def score(self, text):
+        # Cosine similarity of `text` against every live job, as (ids, scores).
+        # Only the columns of the query's terms are touched
+        state = self.state()
+        if state is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = vectorize([text], state['idf'])
+        columns, weights = query.indices, query.data
+        base_scores = state['base'][:, columns] @ weights
+        base_scores[~state['base_live']] = 0
+        delta_scores = state['delta'][:, columns] @ weights
+        return (np.concatenate([state['base_ids'], state['delta_ids']]),
+                np.concatenate([base_scores, delta_scores]))
+
+    def top(self, text, limit=10, exclude=()):
+        ids, scores = self.score(text)
+        if exclude:
+            scores[np.isin(ids, list(exclude))] = 0
+        if len(scores) > limit:
+            candidates = np.argpartition(-scores, limit)[:limit]
+        else:
+            candidates = np.arange(len(scores))
+        best = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(ids[i]), float(scores[i])) for i in best if scores[i] > 0]
+
+class JobMatcher:
+    def __init__(self):
+        self.index = None
+        self.available = False
+        self.recommendations = TTLCache(maxsize=2048, ttl=300)
+
+    def init_app(self, app):
+        self.available = NUMERIC_AVAILABLE
+        if not self.available:
+            logging.info("NumPy/SciPy not installed; job matching disabled")
+            return
+        path = app.config.get('MATCH_INDEX_DIR') or os.path.join(app.instance_path, 'match_index')
+        self.index = MatchIndex(path, app.config.get('MATCH_DELTA_LIMIT', 5000))
+        self.recommendations = TTLCache(app.config.get('MATCH_CACHE_SIZE', 2048), app.config.get('MATCH_CACHE_TTL', 300))
+        event.listen(db.session, 'after_flush', self._queue_changed_jobs)
+        app.extensions['job_matcher'] = self
+
+        @app.cli.command('rebuild-match-index')
+        def rebuild_match_index_command():
+            print(f"Indexed {self.rebuild()} active jobs")
+
+    def _queue_changed_jobs(self, session, flush_context):
+        changed = [obj.id for obj in session.new if isinstance(obj, Job)]
+        changed += [obj.id for obj in session.deleted if isinstance(obj, Job)]
+        for obj in session.dirty:
+            if isinstance(obj, Job):
+                state = inspect(obj)
+                if any(state.attrs[field].history.has_changes() for field in JOB_TEXT_FIELDS):
+                    changed.append(obj.id)
+        if changed:
+            self.queue_update(session.connection(), changed)
+
+    def queue_update(self, connection, job_ids):
+        # Also called by writers that bypass the session (imports.py)
+        if self.available:
+            task_queue.enqueue_on(connection, 'update_match_index', job_ids=sorted(set(job_ids)))
+
+    def _documents(self, job_ids=None):
+        statement = select(Job.id, Job.title, Job.description, Job.requirements).where(Job.is_active == True)  # noqa: E712
+        if job_ids is not None:
+            statement = statement.where(Job.id.in_(job_ids))
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=2000).execute(statement)
+            for job_id, title, description, requirements in result:
+                yield job_id, job_document(title, description, requirements)
+
+    def rebuild(self):
+        return self.index.rebuild(self._documents())
+
+    def update(self, job_ids):
+        documents = list(self._documents(job_ids))
+        active = {job_id for job_id, text in documents}
+        if not self.index.update(documents, [job_id for job_id in job_ids if job_id not in active]):
+            self.rebuild()
+
+    def recommend_jobs(self, user_id, limit=5):
+        # Active jobs closest to the user's latest resume, skipping ones
+        # already applied to; ids are cached per index version
+        if not self.available or self.index.state() is None:
+            return []
+        version = self.index.state()['manifest']['version']
+
+        def compute():
+            resume = db.session.execute(
+                select(Application.resume_text).where(Application.user_id == user_id)
+                .order_by(Application.applied_date.desc()).limit(1)
+            ).scalar()
+            if not resume:
+                return []
+            applied = db.session.execute(select(Application.job_id).where(Application.user_id == user_id)).scalars().all()
+            return [job_id for job_id, score in self.index.top(resume, limit, exclude=applied)]
+
+        job_ids = self.recommendations.get_or_set((user_id, version, limit), compute)
+        if not job_ids:
+            return []
+        jobs = {job.id: job for job in Job.query.filter(Job.id.in_(job_ids), Job.is_active == True)}  # noqa: E712
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def rank_texts(self, query_text, texts):
+        # Similarity of each text to query_text in one sparse product
+        _load_numeric()
+        state = self.index.state() if self.index else None
+        idf = state['idf'] if state else np.ones(N_FEATURES, dtype=np.float32)
+        query = vectorize([query_text], idf)
+        matrix = vectorize(texts, idf)
+        return np.asarray((matrix @ query.T).todense()).ravel()
+
+    def rank_applications(self, job):
+        # (application id, score) for every application to `job`, best first.
+        # Resumes are loaded and scored RANK_BATCH_SIZE at a time, so only
+        # one batch of them is held in memory
+        query_text = job_document(job.title, job.description, job.requirements)
+        result = db.session.execute(
+            select(Application.id, Application.resume_text).where(Application.job_id == job.id),
+            execution_options={'yield_per': RANK_BATCH_SIZE},
+        )
+        ids, scores = [], []
+        for rows in result.partitions():
+            ids.extend(application_id for application_id, resume in rows)
+            scores.append(self.rank_texts(query_text, [resume for application_id, resume in rows]))
+        if not ids:
+            return []
+        scores = np.concatenate(scores)
+        order = np.argsort(-scores, kind='stable')
+        return [(ids[i], float(scores[i])) for i in order]
+
+job_matcher = JobMatcher()
+
+@task_queue.task()
+def update_match_index(job_ids):
+    if job_matcher.available:
+        job_matcher.update(job_ids)
+
+@task_queue.periodic('MATCH_INDEX_REBUILD_INTERVAL', 3600)
+def rebuild_match_index():
+    # Full rebuilds refresh the idf weights and fold the delta into the base
+    if not job_matcher.available:
+        return
+    manifest = job_matcher.index.manifest()
+    interval = current_app.config.get('MATCH_INDEX_REBUILD_INTERVAL', 3600)
+    if manifest and time.time() - manifest['built_at'] < interval / 2:
+        return
+    job_matcher.rebuild()
@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+from app import db
+from models import User, Job, Application, JobDailyStat, CategoryDailyStat
+
+# Applied versions are recorded here; everything else lives in the models
+migration_metadata = MetaData()
+schema_migration = Table(
+    'schema_migration', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+def _add_column(connection, table, name, ddl):
+    columns = {column['name'] for column in inspect(connection).get_columns(table)}
+    if name not in columns:
+        # quote() leaves plain names alone, but "user" is reserved on Postgres
+        table = connection.dialect.identifier_preparer.quote(table)
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+def _create_indexes(connection, model, names=None):
+    # IF NOT EXISTS keeps this idempotent for databases built by create_all;
+    # on Postgres CONCURRENTLY builds the index without blocking writes
+    for index in model.__table__.indexes:
+        if names is not None and index.name not in names:
+            continue
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+        if connection.dialect.name == 'postgresql':
+            ddl = ddl.replace('CREATE INDEX ', 'CREATE INDEX CONCURRENTLY ', 1)
+        connection.execute(text(ddl))
+
+def add_application_count(connection):
+    _add_column(connection, 'job', 'application_count', 'INTEGER NOT NULL DEFAULT 0')
+
+# Indexes added by later migrations are left to those migrations, since
+# their columns may not exist yet when this one runs
+ROUTE_INDEXES = {
+    'ix_user_created_at', 'ix_job_active_posted', 'ix_job_active_facets', 'ix_job_employer_posted',
+    'ix_job_posted', 'ix_application_user_applied', 'ix_application_job_applied', 'ix_application_applied',
+}
+
+def add_route_indexes(connection):
+    for model in (User, Job, Application):
+        _create_indexes(connection, model, ROUTE_INDEXES)
+
+def add_external_ref(connection):
+    _add_column(connection, 'job', 'external_ref', 'VARCHAR(100)')
+
+def add_external_ref_index(connection):
+    _create_indexes(connection, Job, {'ux_job_employer_external_ref'})
+
+def add_deadline_index(connection):
+    _create_indexes(connection, Job, {'ix_job_active_deadline'})
+
+def add_updated_at(connection):
+    _add_column(connection, 'job', 'updated_at', 'TIMESTAMP')
+    connection.execute(text("UPDATE job SET updated_at = posted_date WHERE updated_at IS NULL"))
+
+def add_updated_at_index(connection):
+    _create_indexes(connection, Job, {'ix_job_updated_at'})
+
+def add_analytics_rollups(connection):
+    # Backfilled in full here; analytics.py keeps them current from then on
+    import analytics
+    for model in (JobDailyStat, CategoryDailyStat):
+        model.__table__.create(connection, checkfirst=True)
+    analytics.recompute(connection)
+
+def add_identity_version(connection):
+    _add_column(connection, 'user', 'identity_version', 'INTEGER NOT NULL DEFAULT 0')
+
+def add_job_import_updated_at(connection):
+    _add_column(connection, 'job_import', 'updated_at', 'TIMESTAMP')
+    connection.execute(text("UPDATE job_import SET updated_at = COALESCE(finished_at, created_at) WHERE updated_at IS NULL"))
+
+# (version, description, function, runs inside a transaction)
+MIGRATIONS = [
+    (1, 'Add job.application_count', add_application_count, True),
+    (2, 'Add composite indexes for route queries', add_route_indexes, False),
+    (3, 'Add job.external_ref', add_external_ref, True),
+    (4, 'Add unique index on job (employer_id, external_ref)', add_external_ref_index, False),
+    (5, 'Add index on job (is_active, deadline)', add_deadline_index, False),
+    (6, 'Add job.updated_at', add_updated_at, True),
+    (7, 'Add index on job (updated_at)', add_updated_at_index, False),
+    (8, 'Add and backfill analytics rollup tables', add_analytics_rollups, True),
+    (9, 'Add user.identity_version', add_identity_version, True),
+    (10, 'Add job_import.updated_at', add_job_import_updated_at, True),
+]
+
+def applied_versions(engine):
+    with engine.begin() as connection:
+        schema_migration.create(connection, checkfirst=True)
+        return set(connection.execute(select(schema_migration.c.version)).scalars())
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def upgrade(engine=None):
+    engine = engine or db.engine
+    applied = []
+    for version, description, function, transactional in pending_migrations(engine):
+        logging.info(f"Applying migration {version}: {description}")
+        if transactional:
+            with engine.begin() as connection:
+                function(connection)
+        else:
+            # Online index builds can't run inside a transaction block
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                function(connection)
+        with engine.begin() as connection:
+            connection.execute(schema_migration.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+def init_db():
+    # Tables, pending migrations, the search index and the stat counters.
+    # Safe to re-run, so deploys can run it unconditionally before workers
+    # start; workers themselves never create or alter schema
+    from search import job_search
+    import counters
+    db.create_all()
+    applied = upgrade()
+    job_search.setup()
+    with db.engine.begin() as connection:
+        counters.repair_if_needed(connection)
+    return applied
+
+def init_app(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        applied = init_db()
+        print(f"Database ready; applied migrations: {applied or 'none'}")
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        applied = upgrade()
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+
+    @app.cli.command('db-status')
+    def db_status():
+        applied = applied_versions(db.engine)
+        for version, description, function, transactional in MIGRATIONS:
+            print(f"{'x' if version in applied else ' '} {version:4d} {description}")
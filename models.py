@@ -1,7 +1,9 @@
 from datetime import datetime
+from sqlalchemy.orm import configure_mappers
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+
+APPLICATION_STATUSES = ['pending', 'reviewed', 'accepted', 'rejected']
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,16 +18,24 @@ class User(UserMixin, db.Model):
     location = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped by every change to the row, so each worker's cached copy of
+    # the user (identity.py) can tell it is out of date
+    identity_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Indexes matching the query shapes in routes.py (see migrations.py)
+    __table_args__ = (db.Index('ix_user_created_at', 'created_at', 'id'),)
 
     # Relationships
     jobs_posted = db.relationship('Job', backref='poster', lazy='dynamic', foreign_keys='Job.employer_id')
     applications = db.relationship('Application', backref='applicant', lazy='dynamic', foreign_keys='Application.user_id')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from hashing import password_hasher
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from hashing import password_hasher
+        return password_hasher.verify(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -45,6 +55,20 @@ class Job(db.Model):
     deadline = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     employer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    application_count = db.Column(db.Integer, nullable=False, default=0)  # Maintained by counters.py
+    external_ref = db.Column(db.String(100), nullable=True)  # Employer's own id for jobs from bulk imports
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # HTTP validators (conditional.py)
+
+    __table_args__ = (
+        db.Index('ix_job_active_posted', 'is_active', 'posted_date', 'id'),
+        db.Index('ix_job_active_facets', 'is_active', 'category', 'job_type'),
+        db.Index('ix_job_employer_posted', 'employer_id', 'posted_date', 'id'),
+        db.Index('ix_job_posted', 'posted_date', 'id'),
+        # Upsert key for imports.py; NULLs never conflict, so posted jobs are unaffected
+        db.Index('ux_job_employer_external_ref', 'employer_id', 'external_ref', unique=True),
+        db.Index('ix_job_active_deadline', 'is_active', 'deadline'),
+        db.Index('ix_job_updated_at', 'updated_at'),
+    )
 
     # Relationships
     applications = db.relationship('Application', backref='job', lazy='dynamic', cascade='all, delete-orphan')
@@ -68,12 +92,112 @@ class Application(db.Model):
     job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=False)
     cover_letter = db.Column(db.Text, nullable=True)
     resume_text = db.Column(db.Text, nullable=True)
-    status = db.Column(db.String(20), default='pending')  # pending, reviewed, accepted, rejected
+    status = db.Column(db.String(20), default='pending')  # One of APPLICATION_STATUSES
     applied_date = db.Column(db.DateTime, default=datetime.utcnow)
     reviewed_date = db.Column(db.DateTime, nullable=True)
 
     # Unique constraint to prevent duplicate applications
-    __table_args__ = (db.UniqueConstraint('user_id', 'job_id', name='unique_user_job_application'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'job_id', name='unique_user_job_application'),
+        db.Index('ix_application_user_applied', 'user_id', 'applied_date', 'id'),
+        db.Index('ix_application_job_applied', 'job_id', 'applied_date', 'id'),
+        db.Index('ix_application_applied', 'applied_date', 'id'),
+    )
 
     def __repr__(self):
-        return f'<Application {self.id} for Job {self.job_id}>'
\ No newline at end of file
+        return f'<Application {self.id} for Job {self.job_id}>'
+
+class JobImport(db.Model):
+    # A bulk job feed uploaded by an employer and processed by imports.py
+    id = db.Column(db.Integer, primary_key=True)
+    employer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # csv, jsonl
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, finished, failed
+    total_bytes = db.Column(db.Integer, nullable=False, default=0)
+    processed_bytes = db.Column(db.Integer, nullable=False, default=0)
+    rows_inserted = db.Column(db.Integer, nullable=False, default=0)
+    rows_updated = db.Column(db.Integer, nullable=False, default=0)
+    rows_failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True)  # JSON list of {"row": n, "errors": {field: [messages]}}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Moves with every status or progress update, so an import whose process died can be told apart
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_job_import_employer_created', 'employer_id', 'created_at'),)
+
+    @property
+    def progress(self):
+        if self.status == 'finished' or not self.total_bytes:
+            return 100 if self.status == 'finished' else 0
+        return min(99, int(self.processed_bytes * 100 / self.total_bytes))
+
+    def __repr__(self):
+        return f'<JobImport {self.id} {self.status}>'
+
+class Task(db.Model):
+    # A unit of background work run by tasks.py, e.g. 'delete_job'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_task_status_run_at', 'status', 'run_at'),
+        db.Index('ix_task_name_status', 'name', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<Task {self.id} {self.name} {self.status}>'
+
+class JobDailyStat(db.Model):
+    # Per-job funnel rollup maintained by analytics.py. Applications and
+    # their current status are counted on the day they were applied;
+    # reviews (and their applied -> reviewed seconds) on the review day
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    employer_id = db.Column(db.Integer, nullable=False)
+    applications = db.Column(db.Integer, nullable=False, default=0)
+    status_pending = db.Column(db.Integer, nullable=False, default=0)
+    status_reviewed = db.Column(db.Integer, nullable=False, default=0)
+    status_accepted = db.Column(db.Integer, nullable=False, default=0)
+    status_rejected = db.Column(db.Integer, nullable=False, default=0)
+    reviews = db.Column(db.Integer, nullable=False, default=0)
+    review_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_job_daily_stat_employer_day', 'employer_id', 'day'),)
+
+    def __repr__(self):
+        return f'<JobDailyStat job {self.job_id} {self.day}>'
+
+class CategoryDailyStat(db.Model):
+    # Platform-wide rollup maintained by analytics.py: jobs by posting day
+    # and applications by application day, per category and job type
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    job_type = db.Column(db.String(30), primary_key=True)
+    jobs_posted = db.Column(db.Integer, nullable=False, default=0)
+    applications = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CategoryDailyStat {self.day} {self.category}/{self.job_type}>'
+
+class StatCounter(db.Model):
+    # Site-wide totals kept current by counters.py, e.g. 'jobs_active'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
+
+# Set up the backrefs (Job.poster, Application.job, Application.applicant)
+# now, so loader options can refer to them at import time
+configure_mappers()
\ No newline at end of file
@@ -0,0 +1,145 @@
+from datetime import datetime
+from flask import request, current_app, abort, url_for
+from flask_sqlalchemy.pagination import Pagination
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import tuple_, func, select
+
+# Page-number (OFFSET) links are served up to this page; deeper pages are
+# only reachable through keyset cursors
+MAX_OFFSET_PAGE = 50
+
+# Keyset pages don't need a total; 'capped' counts at most COUNT_CAP rows
+# and reports the total as "COUNT_CAP+" beyond that
+COUNT_CAP = 1000
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='pagination-cursor')
+
+def encode_cursor(item, columns, direction):
+    key = []
+    for column in columns:
+        value = getattr(item, column.key)
+        key.append(value.isoformat() if isinstance(value, datetime) else value)
+    return _serializer().dumps([direction] + key)
+
+def decode_cursor(token, columns):
+    try:
+        direction, *key = _serializer().loads(token)
+    except (BadSignature, ValueError, TypeError):
+        abort(400)
+    if direction not in ('next', 'prev') or len(key) != len(columns):
+        abort(400)
+    values = []
+    for column, value in zip(columns, key):
+        if column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        values.append(value)
+    return direction, values
+
+class KeysetPage:
+    # Quacks enough like Flask-SQLAlchemy's Pagination for the list templates
+    is_keyset = True
+
+    def __init__(self, items, has_prev, has_next, prev_cursor, next_cursor, total=None, total_is_estimate=False):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def pages(self):
+        return 2 if self.has_prev or self.has_next else 1
+
+def count_rows(query, mode):
+    if mode == 'exact':
+        return query.order_by(None).count(), False
+    if mode == 'capped':
+        capped = query.order_by(None).with_entities(query.column_descriptions[0]['entity'].id)\
+            .limit(COUNT_CAP + 1).subquery()
+        total = query.session.execute(select(func.count()).select_from(capped)).scalar()
+        return min(total, COUNT_CAP), total > COUNT_CAP
+    return None, False
+
+def keyset_paginate(query, columns, cursor=None, per_page=10, count='none'):
+    # columns is the descending sort key, e.g. (Job.posted_date, Job.id);
+    # the id column makes the key unique so pages never skip or repeat rows
+    key = tuple_(*columns)
+    total, total_is_estimate = count_rows(query, count)
+    direction, values = decode_cursor(cursor, columns) if cursor else ('next', None)
+
+    if direction == 'next':
+        if values is not None:
+            query = query.filter(key < tuple_(*values))
+        query = query.order_by(*[column.desc() for column in columns])
+    else:
+        query = query.filter(key > tuple_(*values))
+        query = query.order_by(*[column.asc() for column in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if direction == 'prev':
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = values is not None, has_more
+
+    prev_cursor = encode_cursor(items[0], columns, 'prev') if items and has_prev else None
+    next_cursor = encode_cursor(items[-1], columns, 'next') if items and has_next else None
+    return KeysetPage(items, has_prev, has_next, prev_cursor, next_cursor, total, total_is_estimate)
+
+def paginate_listing(query, columns, per_page=10):
+    # ?cursor=... selects keyset mode; plain ?page=N keeps OFFSET pagination
+    # for shallow pages and hands over to a cursor at MAX_OFFSET_PAGE
+    cursor = request.args.get('cursor')
+    if cursor:
+        count = current_app.config.get('PAGINATION_KEYSET_COUNT', 'capped')
+        return keyset_paginate(query, columns, cursor, per_page, count)
+
+    page = request.args.get('page', 1, type=int)
+    if page > MAX_OFFSET_PAGE:
+        abort(404)
+    pagination = query.order_by(*[column.desc() for column in columns])\
+        .paginate(page=page, per_page=per_page, error_out=False)
+    if page == MAX_OFFSET_PAGE and pagination.has_next and pagination.items:
+        pagination.next_cursor = encode_cursor(pagination.items[-1], columns, 'next')
+    return pagination
+
+class RankedPagination(Pagination):
+    # OFFSET pages over ids already put in order in Python (e.g. by match
+    # score); only the current page's rows are loaded, by load(ids)
+    def _query_items(self):
+        ids = self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]
+        rows = {row.id: row for row in self._query_args['load'](ids)} if ids else {}
+        return [rows[row_id] for row_id in ids if row_id in rows]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+def paginate_ranked(ids, load, per_page=10):
+    page = request.args.get('page', 1, type=int)
+    if page > MAX_OFFSET_PAGE:
+        abort(404)
+    return RankedPagination(page=page, per_page=per_page, error_out=False, ids=ids, load=load)
+
+def page_url(page):
+    # Current URL, route arguments and filters included, at another page
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    args['page'] = page
+    return url_for(request.endpoint, **request.view_args, **args)
+
+def cursor_url(cursor):
+    # Current URL with ?page= replaced by the given cursor
+    args = request.args.to_dict()
+    args.pop('page', None)
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **request.view_args, **args)
+
+def init_app(app):
+    app.jinja_env.globals['cursor_url'] = cursor_url
+    app.jinja_env.globals['page_url'] = page_url
+    app.jinja_env.globals['max_offset_page'] = MAX_OFFSET_PAGE
@@ -0,0 +1,100 @@
+import json
+import re
+import sys
+from sqlalchemy import text
+from app import db
+from models import User, Job, Application, StatCounter
+from search import job_search
+from facets import grouped_counts_query
+
+def route_queries():
+    # The statements each route in routes.py runs, with representative
+    # parameters; keep in step with the routes when their queries change.
+    # The last field allows walking a whole index in order, which is what an
+    # unfiltered "newest N" listing does under its LIMIT
+    active_jobs = Job.query.filter_by(is_active=True)
+    return [
+        ('index', 'recent jobs', active_jobs.order_by(Job.posted_date.desc(), Job.id.desc()).limit(6), False),
+        ('index', 'active job count', StatCounter.query.filter(StatCounter.name.in_(['jobs_active'])), False),
+        ('load_user', 'user by id', User.query.filter(User.id == 1), False),
+        ('login', 'user by username', User.query.filter(User.username == 'someone'), False),
+        ('search_jobs', 'filtered listing', active_jobs.filter(Job.category == 'technology', Job.job_type == 'full-time')
+            .order_by(Job.posted_date.desc(), Job.id.desc()).limit(10), False),
+        ('search_jobs', 'facet counts', grouped_counts_query(None, None), False),
+        # Built by the same code as the route, so they follow the search backend
+        ('search_jobs', 'keyword search', job_search.apply(active_jobs, 'engineer').limit(10), False),
+        ('search_jobs', 'keyword facet counts', grouped_counts_query('engineer', None), False),
+        ('search_jobs', 'location listing', active_jobs.filter(Job.location.contains('New York'))
+            .order_by(Job.posted_date.desc(), Job.id.desc()).limit(10), False),
+        ('search_jobs', 'location facet counts', grouped_counts_query(None, 'New York'), False),
+        ('job_detail', 'job by id', Job.query.filter(Job.id == 1), False),
+        ('job_detail', 'own application', Application.query.filter_by(user_id=1, job_id=1), False),
+        ('my_jobs', 'employer listing', Job.query.filter_by(employer_id=1)
+            .order_by(Job.posted_date.desc(), Job.id.desc()).limit(10), False),
+        ('my_applications', 'applicant listing', Application.query.filter_by(user_id=1)
+            .order_by(Application.applied_date.desc(), Application.id.desc()).limit(10), False),
+        ('job_applications', 'job listing', Application.query.filter_by(job_id=1)
+            .order_by(Application.applied_date.desc(), Application.id.desc()).limit(10), False),
+        ('dashboard', 'employer recent applications', Application.query.join(Job)
+            .filter(Job.employer_id == 1).order_by(Application.applied_date.desc()).limit(5), False),
+        ('dashboard', 'recent users', User.query.order_by(User.created_at.desc()).limit(5), True),
+        ('admin_panel', 'users page', User.query.order_by(User.created_at.desc(), User.id.desc()).limit(25), True),
+        ('admin_panel', 'jobs page', Job.query.order_by(Job.posted_date.desc(), Job.id.desc()).limit(25), True),
+        ('admin_panel', 'recent applications', Application.query.order_by(Application.applied_date.desc()).limit(20), True),
+    ]
+
+def _compile(query, dialect):
+    statement = query.statement if hasattr(query, 'statement') else query
+    return str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+def _sqlite_full_scans(connection, sql, allow_index_scan):
+    plan = [row[-1] for row in connection.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+    # "SEARCH" seeks into an index; "SCAN" reads a whole table or index.
+    # A full-text table is scanned through its own index when it has a
+    # MATCH constraint ("VIRTUAL TABLE INDEX 0:M3"); with none ("INDEX 0:")
+    # it reads every row
+    scans = [step for step in plan if step.startswith('SCAN ')
+             and not re.search(r'VIRTUAL TABLE INDEX \d+:\S', step)
+             and not (allow_index_scan and 'USING' in step and 'INDEX' in step)]
+    return scans, plan
+
+def _postgres_full_scans(connection, sql, allow_index_scan):
+    # With sequential scans disabled the planner only picks one when no
+    # index can serve the query at all
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    plan = connection.execute(text('EXPLAIN (FORMAT JSON) ' + sql)).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans = []
+
+    def walk(node):
+        node_type = node.get('Node Type')
+        if node_type == 'Seq Scan' or (node_type in ('Index Scan', 'Index Only Scan')
+                                       and not allow_index_scan and 'Index Cond' not in node):
+            scans.append(f"{node_type} on {node.get('Relation Name')}")
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return scans, plan
+
+def check_query_plans(engine=None):
+    engine = engine or db.engine
+    explain = _postgres_full_scans if engine.dialect.name == 'postgresql' else _sqlite_full_scans
+    failures = []
+    with engine.connect() as connection:
+        for route, label, query, allow_index_scan in route_queries():
+            with connection.begin():
+                scans, plan = explain(connection, _compile(query, engine.dialect), allow_index_scan)
+            if scans:
+                failures.append((route, label, scans, plan))
+    return failures
+
+def init_app(app):
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        failures = check_query_plans()
+        for route, label, scans, plan in failures:
+            print(f"FAIL {route}: {label}: {', '.join(scans)}")
+        if failures:
+            sys.exit(1)
+        print(f"All {len(route_queries())} route queries use indexes")
@@ -0,0 +1,213 @@
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from collections import Counter
+from flask import request, abort
+from flask_login import current_user
+
+# Per limit and scope: (burst capacity, tokens refilled per second). A
+# request spends `cost` tokens from every bucket that applies to it: one
+# for its client IP, one for its user when logged in, and one shared by
+# the whole route, which sheds load once all clients together ask too much.
+# RATELIMITS in the config overrides entries here
+DEFAULT_LIMITS = {
+    'search': {'ip': (120, 2), 'user': (240, 4), 'route': (2000, 200)},
+    'login': {'ip': (10, 0.2), 'route': (300, 20)},
+    'apply': {'ip': (30, 0.1), 'user': (20, 0.05)},
+}
+
+class LocalRateLimitBackend:
+    # Token buckets in this process, spread over shards with a lock each so
+    # concurrent requests rarely wait on one another. Limits apply per
+    # worker: with N workers a client gets up to N times the rate
+    def __init__(self, shards=16, max_keys=10000):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._max_keys = max_keys
+
+    def take(self, buckets, cost, now):
+        # buckets: [(key, capacity, rate)]. Spends cost from all of them, or
+        # from none; returns (seconds to wait, index of the limiting bucket)
+        shards = sorted({hash(key) % len(self._shards) for key, capacity, rate in buckets})
+        locks = [self._shards[shard][1] for shard in shards]
+        for lock in locks:  # always in shard order, so never deadlocks
+            lock.acquire()
+        try:
+            levels = []
+            wait, blocked = 0.0, None
+            for index, (key, capacity, rate) in enumerate(buckets):
+                state = self._shards[hash(key) % len(self._shards)][0].get(key)
+                tokens = capacity if state is None else min(capacity, state[0] + (now - state[1]) * rate)
+                levels.append(tokens)
+                needed = min(cost, capacity) - tokens
+                if needed > 0 and needed / rate > wait:
+                    wait, blocked = needed / rate, index
+            if blocked is not None:
+                return wait, blocked
+            for (key, capacity, rate), tokens in zip(buckets, levels):
+                tokens -= min(cost, capacity)
+                states = self._shards[hash(key) % len(self._shards)][0]
+                states.pop(key, None)
+                # (tokens, updated, when the bucket is full again)
+                states[key] = (tokens, now, now + (capacity - tokens) / rate)
+                if len(states) > self._max_keys:
+                    self._prune(states, now)
+            return 0.0, None
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _prune(self, states, now):
+        # A full bucket is the same as no bucket; failing that, forget the
+        # least recently used half
+        for key in [key for key, state in states.items() if state[2] <= now]:
+            del states[key]
+        if len(states) > self._max_keys:
+            for key in list(states)[:len(states) - self._max_keys // 2]:
+                del states[key]
+
+    def __len__(self):
+        return sum(len(states) for states, lock in self._shards)
+
+# Same algorithm as LocalRateLimitBackend.take, atomically in Redis.
+# KEYS are the buckets; ARGV is cost, now, then capacity and rate per bucket
+TAKE_SCRIPT = """
+local cost, now = tonumber(ARGV[1]), tonumber(ARGV[2])
+local levels, wait, blocked = {}, 0, -1
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[1 + 2 * i]), tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = capacity
+    if state[1] then
+        tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    levels[i] = tokens
+    local needed = math.min(cost, capacity) - tokens
+    if needed > 0 and needed / rate > wait then
+        wait, blocked = needed / rate, i - 1
+    end
+end
+if blocked >= 0 then
+    return {tostring(wait), blocked}
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[1 + 2 * i]), tonumber(ARGV[2 + 2 * i])
+    local tokens = levels[i] - math.min(cost, capacity)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', key, math.ceil((capacity - tokens) / rate) + 1)
+end
+return {'0', -1}
+"""
+
+class RedisRateLimitBackend:
+    # Shared by every worker and host, so limits hold for the deployment
+    # as a whole. Buckets expire from Redis once they would be full again
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+        self._prefix = prefix
+
+    def take(self, buckets, cost, now):
+        arguments = [cost, now]
+        for key, capacity, rate in buckets:
+            arguments.extend((capacity, rate))
+        wait, blocked = self._take(keys=[self._prefix + key for key, capacity, rate in buckets], args=arguments)
+        return float(wait), (None if blocked < 0 else blocked)
+
+    def __len__(self):
+        return len(self._client.keys(self._prefix + '*'))
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = True
+        self.backend = LocalRateLimitBackend()
+        self.limits = dict(DEFAULT_LIMITS)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.limits = dict(DEFAULT_LIMITS, **app.config.get('RATELIMITS', {}))
+        # Checked here rather than on the first request, where a zero rate
+        # would be a ZeroDivisionError
+        for name, scopes in self.limits.items():
+            for scope, (capacity, rate) in scopes.items():
+                if not (capacity > 0 and rate > 0):
+                    raise ValueError(f"RATELIMITS[{name!r}][{scope!r}] must have a capacity and rate above 0, "
+                                     f"not ({capacity!r}, {rate!r})")
+        url = app.config.get('RATELIMIT_REDIS_URL')
+        if url:
+            try:
+                self.backend = RedisRateLimitBackend(url)
+            except ImportError:
+                logging.warning("RATELIMIT_REDIS_URL is set but redis is not installed; using local rate limits")
+        if not isinstance(self.backend, RedisRateLimitBackend):
+            self.backend = LocalRateLimitBackend(app.config.get('RATELIMIT_SHARDS', 16))
+        app.extensions['rate_limiter'] = self
+
+    def _identity(self, scope):
+        if scope == 'ip':
+            return request.remote_addr
+        if scope == 'user':
+            return current_user.get_id() if current_user.is_authenticated else None
+        return '*'
+
+    def _count(self, name, cost, blocked_scope=None):
+        with self._stats_lock:
+            counts = self.stats.setdefault(name, Counter())
+            if blocked_scope is None:
+                counts['served'] += 1
+                counts['tokens'] += cost
+            else:
+                counts['throttled'] += 1
+                counts[f'throttled_{blocked_scope}'] += 1
+
+    def limit(self, name, cost=1, methods=None):
+        # cost is a number of tokens, or a function of the current request
+        # returning one, so expensive variants of a route spend more.
+        # Requests over the limit get 429 with Retry-After
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled and (methods is None or request.method in methods):
+                    self._check(name, cost() if callable(cost) else cost)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _check(self, name, cost):
+        scopes, buckets = [], []
+        for scope, (capacity, rate) in self.limits[name].items():
+            identity = self._identity(scope)
+            if identity is not None:
+                scopes.append(scope)
+                buckets.append((f'{name}:{scope}:{identity}', capacity, rate))
+        try:
+            wait, blocked = self.backend.take(buckets, cost, time.time())
+        except Exception:
+            # A limiter outage must not take the site down with it
+            logging.exception(f"Rate limit check for {name} failed; letting the request through")
+            return
+        if blocked is None:
+            self._count(name, cost)
+            return
+        self._count(name, cost, scopes[blocked])
+        abort(429, retry_after=max(1, math.ceil(wait)))
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = {name: dict(counts) for name, counts in self.stats.items()}
+        for counts in stats.values():
+            total = counts.get('served', 0) + counts.get('throttled', 0)
+            counts['throttled_ratio'] = round(counts.get('throttled', 0) / total, 3) if total else None
+        return {
+            'enabled': self.enabled,
+            'backend': type(self.backend).__name__,
+            'buckets': len(self.backend),
+            'limits': self.limits,
+            'routes': stats,
+        }
+
+rate_limiter = RateLimiter()
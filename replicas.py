@@ -0,0 +1,151 @@
+import time
+import threading
+from collections import Counter, deque
+from flask import current_app, request, session, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Replicas are the SQLALCHEMY_BINDS entries named replica_<n>; app.py
+# builds them from DATABASE_REPLICA_URLS
+REPLICA_PREFIX = 'replica_'
+
+def pool_options(environ):
+    # SQLALCHEMY_ENGINE_OPTIONS for the primary and every replica. Sizes
+    # left unset keep SQLAlchemy's defaults (5 + 10 overflow, 30s timeout)
+    options = {
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 300)),
+        'pool_pre_ping': True,
+        'poolclass': MeteredQueuePool,
+    }
+    for variable, option, convert in (('DB_POOL_SIZE', 'pool_size', int),
+                                      ('DB_MAX_OVERFLOW', 'max_overflow', int),
+                                      ('DB_POOL_TIMEOUT', 'pool_timeout', float)):
+        if environ.get(variable):
+            options[option] = convert(environ[variable])
+    return options
+
+class MeteredQueuePool(QueuePool):
+    # QueuePool that times every checkout, including the wait for a free
+    # connection when the pool is exhausted
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        self.capacity = pool_size + max_overflow if max_overflow >= 0 else None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.waits = deque(maxlen=1000)
+        self._stats_lock = threading.Lock()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeout:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.waits.append(wait)
+            self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+        return connection
+
+    def metrics(self):
+        with self._stats_lock:
+            waits = sorted(self.waits)
+            checkouts, timeouts, peak = self.checkouts, self.timeouts, self.peak_checked_out
+        checked_out = self.checkedout()
+        return {
+            'size': self.size(),
+            'capacity': self.capacity,
+            'checked_out': checked_out,
+            'peak_checked_out': peak,
+            'saturation': round(checked_out / self.capacity, 3) if self.capacity else None,
+            'checkouts': checkouts,
+            'timeouts': timeouts,
+            'avg_wait_ms': round(sum(waits) / len(waits) * 1000, 3) if waits else 0,
+            'p95_wait_ms': round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0,
+            'max_wait_ms': round(waits[-1] * 1000, 3) if waits else 0,
+        }
+
+class RoutingSession(Session):
+    # Sends SELECTs to the replica chosen for this request, if any. Once the
+    # session flushes, it stays on the primary so the request reads its
+    # own writes
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None:
+            if self._flushing:
+                del self.info['replica']
+            elif isinstance(clause, Select):
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class ReplicaRouter:
+    # GET and HEAD requests read from a replica, round robin. A request
+    # that commits a write keeps its client on the primary for
+    # REPLICA_STICKY_SECONDS, so users see their own changes straight away
+    def __init__(self):
+        self.db = None
+        self.replicas = []
+        self.sticky_seconds = 10
+        self.stats = Counter()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.replicas = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+                               if key.startswith(REPLICA_PREFIX))
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        app.extensions['replica_router'] = self
+        if not self.replicas:
+            return
+        with app.app_context():
+            # Core writes through db.engine count as much as session commits
+            event.listen(db.engine, 'commit', self._note_write)
+        app.before_request(self._route_request)
+        app.after_request(self._stick_after_write)
+
+    def primary(self, view):
+        # For GET views that must see writes made moments ago by anyone
+        view.use_primary = True
+        return view
+
+    def _route_request(self):
+        if request.method not in ('GET', 'HEAD'):
+            self.stats['primary.write'] += 1
+            return
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'use_primary', False):
+            self.stats['primary.pinned'] += 1
+            return
+        if session.get('_read_primary_until', 0) > time.time():
+            self.stats['primary.sticky'] += 1
+            return
+        with self._lock:
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+        self.db.session.info['replica'] = replica
+        self.stats[replica] += 1
+
+    def _note_write(self, connection):
+        if has_request_context():
+            g.database_written = True
+
+    def _stick_after_write(self, response):
+        if g.get('database_written'):
+            session['_read_primary_until'] = time.time() + self.sticky_seconds
+        return response
+
+    def metrics(self):
+        pools = {}
+        for key, engine in self.db.engines.items():
+            if isinstance(engine.pool, MeteredQueuePool):
+                pools[key or 'primary'] = engine.pool.metrics()
+        return {'replicas': self.replicas, 'requests': dict(self.stats), 'pools': pools}
+
+replica_router = ReplicaRouter()
@@ -1,44 +1,102 @@
+import json
 from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from sqlalchemy import or_, and_
-from app import app, db
-from models import User, Job, Application
-from forms import LoginForm, RegisterForm, JobForm, ApplicationForm, SearchForm
+from sqlalchemy.orm import joinedload, contains_eager
+from app import db
+from models import User, Job, Application, JobImport, APPLICATION_STATUSES
+from forms import LoginForm, RegisterForm, JobForm, ApplicationForm, SearchForm, JobImportForm
+from search import job_search
+from facets import facet_counts, normalize_location
+from pagination import paginate_listing, paginate_ranked, MAX_OFFSET_PAGE
+from counters import get_count, get_counts
+from cache import page_cache
+from ratelimit import rate_limiter
+from replicas import replica_router
+from sqlite_mode import sqlite_mode, group_commit, GroupCommitTimeout
+from conditional import conditional_requests, listing_validators, job_validators
+from hashing import password_hasher, HashingBusy
+from instrumentation import sql_instrumentation, query_budget
+import exports
+from imports import job_importer
+from tasks import task_queue, notify
+from matching import job_matcher
+from autocomplete import autocomplete, FIELD_GROUPS, MAX_SUGGESTIONS
+from analytics import employer_analytics, platform_analytics
 
-@app.route('/')
+# Every page of the site; registered by create_app() in app.py
+bp = Blueprint('main', __name__)
+
+ADMIN_PER_PAGE = 25
+
+# Loading plans for list views: many-to-one rows are joined into the page
+# query, so a page costs the same number of queries whatever its length.
+# Per-job application counts come from Job.application_count (counters.py)
+APPLICATION_JOB = joinedload(Application.job)
+APPLICATION_APPLICANT = joinedload(Application.applicant)
+JOB_POSTER = joinedload(Job.poster)
+
+@bp.route('/')
+@conditional_requests.conditional(listing_validators, max_age=60)
+@page_cache.cached('jobs')
+@query_budget(4)
 def index():
     # Get recent jobs for the homepage
     recent_jobs = Job.query.filter_by(is_active=True).order_by(Job.posted_date.desc()).limit(6).all()
-    job_count = Job.query.filter_by(is_active=True).count()
+    job_count = get_count('jobs_active')
     return render_template('index.html', recent_jobs=recent_jobs, job_count=job_count)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('login', methods=('POST',))
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = LoginForm()
     if form.validate_on_submit():
+        if password_hasher.is_throttled(form.username.data):
+            flash('Too many failed login attempts. Please try again in a few minutes.', 'error')
+            return render_template('login.html', form=form), 429
+        
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html', form=form), 503
+        
+        if valid:
             if not user.is_active:
                 flash('Your account has been deactivated. Please contact support.', 'error')
                 return render_template('login.html', form=form)
             
+            password_hasher.reset_failures(form.username.data)
+            # Upgrade hashes made with older parameters while the password is at hand
+            if password_hasher.needs_rehash(user.password_hash):
+                try:
+                    password_hash = password_hasher.hash(form.password.data)
+                except HashingBusy:
+                    password_hash = None
+                if password_hash:
+                    with sqlite_mode.immediate(db.session):
+                        user.password_hash = password_hash
+                        db.session.commit()
+            
             login_user(user)
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.first_name}!', 'success')
-            return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+            return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
         else:
+            password_hasher.record_failure(form.username.data)
             flash('Invalid username or password', 'error')
     
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = RegisterForm()
     if form.validate_on_submit():
@@ -61,102 +119,179 @@ def register():
             phone=form.phone.data if form.phone.data else None,
             location=form.location.data if form.location.data else None
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('register.html', form=form), 503
         
-        db.session.add(user)
-        db.session.commit()
+        with sqlite_mode.immediate(db.session):
+            db.session.add(user)
+            db.session.commit()
         
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out successfully.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@query_budget(5)
 def dashboard():
     if current_user.role == 'job_seeker':
         # Get recent applications for job seekers
-        recent_applications = Application.query.filter_by(user_id=current_user.id)\
+        recent_applications = Application.query.options(APPLICATION_JOB)\
+            .filter_by(user_id=current_user.id)\
             .order_by(Application.applied_date.desc()).limit(5).all()
-        return render_template('dashboard.html', recent_applications=recent_applications)
+        recommended_jobs = job_matcher.recommend_jobs(current_user.id)
+        return render_template('dashboard.html', recent_applications=recent_applications,
+                               recommended_jobs=recommended_jobs)
     
     elif current_user.role == 'employer':
         # Get posted jobs and recent applications for employers
         posted_jobs = Job.query.filter_by(employer_id=current_user.id)\
             .order_by(Job.posted_date.desc()).limit(5).all()
         recent_applications = Application.query.join(Job)\
+            .options(contains_eager(Application.job), APPLICATION_APPLICANT)\
             .filter(Job.employer_id == current_user.id)\
             .order_by(Application.applied_date.desc()).limit(5).all()
-        return render_template('dashboard.html', posted_jobs=posted_jobs, recent_applications=recent_applications)
+        # Funnels and trends come from the daily rollups, never the applications table
+        analytics = employer_analytics(current_user.id, [job.id for job in posted_jobs])
+        return render_template('dashboard.html', posted_jobs=posted_jobs, recent_applications=recent_applications,
+                               analytics=analytics, statuses=APPLICATION_STATUSES)
     
     elif current_user.role == 'admin':
         # Admin dashboard with statistics
-        total_users = User.query.count()
-        total_jobs = Job.query.count()
-        total_applications = Application.query.count()
+        totals = get_counts('users', 'jobs', 'applications')
         recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
         return render_template('dashboard.html', 
-                               total_users=total_users, 
-                               total_jobs=total_jobs, 
-                               total_applications=total_applications,
-                               recent_users=recent_users)
+                               total_users=totals['users'], 
+                               total_jobs=totals['jobs'], 
+                               total_applications=totals['applications'],
+                               recent_users=recent_users,
+                               analytics=platform_analytics())
     
     return render_template('dashboard.html')
 
-@app.route('/post-job', methods=['GET', 'POST'])
+def _busy(message, endpoint, **values):
+    # A write that timed out in group_commit may still be committed, so
+    # send the user to where they can see whether it was, not to retry it
+    flash(f'The server is busy. {message}', 'error')
+    return redirect(url_for(endpoint, **values))
+
+def _create_job(**fields):
+    job = Job(**fields)
+    db.session.add(job)
+    db.session.flush()
+    return job.id
+
+@bp.route('/post-job', methods=['GET', 'POST'])
 @login_required
 def post_job():
     if current_user.role not in ['employer', 'admin']:
         flash('You need to be an employer to post jobs.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = JobForm()
     if form.validate_on_submit():
-        job = Job(
-            title=form.title.data,
-            company=form.company.data,
-            description=form.description.data,
-            requirements=form.requirements.data,
-            salary_min=form.salary_min.data,
-            salary_max=form.salary_max.data,
-            location=form.location.data,
-            category=form.category.data,
-            job_type=form.job_type.data,
-            deadline=form.deadline.data,
-            employer_id=current_user.id
-        )
-        
-        db.session.add(job)
-        db.session.commit()
+        try:
+            group_commit.run(
+                _create_job,
+                title=form.title.data,
+                company=form.company.data,
+                description=form.description.data,
+                requirements=form.requirements.data,
+                salary_min=form.salary_min.data,
+                salary_max=form.salary_max.data,
+                location=form.location.data,
+                category=form.category.data,
+                job_type=form.job_type.data,
+                deadline=form.deadline.data,
+                employer_id=current_user.id
+            )
+        except GroupCommitTimeout:
+            return _busy('Your job may still be posted in a moment; check My Jobs before posting it again.',
+                         'main.my_jobs')
         
         flash('Job posted successfully!', 'success')
-        return redirect(url_for('my_jobs'))
+        return redirect(url_for('main.my_jobs'))
+    
+    return render_template('post_jobs.html', form=form)
+
+@bp.route('/my-jobs/import', methods=['GET', 'POST'])
+@login_required
+def import_jobs():
+    if current_user.role not in ['employer', 'admin']:
+        flash('You need to be an employer to import jobs.', 'error')
+        return redirect(url_for('main.dashboard'))
+    
+    form = JobImportForm()
+    if form.validate_on_submit():
+        feed = form.feed.data
+        job_import = JobImport(
+            employer_id=current_user.id,
+            filename=feed.filename[:255],
+            format=feed.filename.rsplit('.', 1)[-1].lower()
+        )
+        path = job_importer.save_upload(feed)
+        with sqlite_mode.immediate(db.session):
+            db.session.add(job_import)
+            db.session.commit()
+        job_importer.submit(job_import.id, path)
+        
+        flash('Your feed is being imported. Progress is shown below.', 'success')
+        return redirect(url_for('main.import_jobs'))
     
-    return render_template('post_job.html', form=form)
+    imports = JobImport.query.filter_by(employer_id=current_user.id)\
+        .order_by(JobImport.created_at.desc()).limit(10).all()
+    return render_template('import_jobs.html', form=form, imports=imports)
 
-@app.route('/jobs')
+@bp.route('/my-jobs/import/<int:import_id>')
+@login_required
+@replica_router.primary  # progress is written moments ago by the importer
+def import_status(import_id):
+    job_import = JobImport.query.get_or_404(import_id)
+    if current_user.role != 'admin' and job_import.employer_id != current_user.id:
+        abort(403)
+    
+    return jsonify({
+        'id': job_import.id,
+        'status': job_import.status,
+        'progress': job_import.progress,
+        'inserted': job_import.rows_inserted,
+        'updated': job_import.rows_updated,
+        'failed': job_import.rows_failed,
+        'errors': json.loads(job_import.errors) if job_import.errors else [],
+    })
+
+def _search_cost():
+    # In rate limit tokens. Keyword and location filters scan text; a
+    # plain listing is one indexed page. Cached pages never get this far
+    return (1 + 4 * bool(request.args.get('keywords', '').strip())
+            + 2 * bool(request.args.get('location', '').strip()))
+
+@bp.route('/jobs')
+@conditional_requests.conditional(listing_validators, max_age=30)
+@page_cache.cached('jobs')
+@rate_limiter.limit('search', cost=_search_cost)
+@query_budget(5)
 def search_jobs():
-    form = SearchForm(request.args)
+    # A GET form needs no CSRF token, and minting one would set a session cookie
+    form = SearchForm(request.args, meta={'csrf': False})
     
     # Build query based on search criteria
     query = Job.query.filter_by(is_active=True)
     
-    if form.keywords.data:
-        query = query.filter(or_(
-            Job.title.contains(form.keywords.data),
-            Job.company.contains(form.keywords.data),
-            Job.description.contains(form.keywords.data)
-        ))
-    
-    if form.location.data:
-        query = query.filter(Job.location.contains(form.location.data))
+    location = normalize_location(form.location.data)
+    if location:
+        query = query.filter(Job.location.contains(location))
     
     if form.category.data:
         query = query.filter(Job.category == form.category.data)
@@ -164,15 +299,45 @@ def search_jobs():
     if form.job_type.data:
         query = query.filter(Job.job_type == form.job_type.data)
     
-    # Pagination
-    page = request.args.get('page', 1, type=int)
-    jobs = query.order_by(Job.posted_date.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    if form.keywords.data:
+        # Relevance-ranked results can only be paged by offset
+        page = request.args.get('page', 1, type=int)
+        if page > MAX_OFFSET_PAGE:
+            abort(404)
+        jobs = job_search.apply(query, form.keywords.data).paginate(
+            page=page, per_page=10, error_out=False
+        )
+    else:
+        # Newest first, with keyset cursors for deep pages
+        jobs = paginate_listing(query, (Job.posted_date, Job.id))
+    
+    # Result counts per category / job type for the current search
+    facets = facet_counts(form.keywords.data, location, form.category.data, form.job_type.data)
     
-    return render_template('search_jobs.html', form=form, jobs=jobs)
+    return render_template('search_jobs.html', form=form, jobs=jobs, facets=facets)
 
-@app.route('/job/<int:job_id>')
+@bp.route('/autocomplete')
+@query_budget(0)
+def autocomplete_suggestions():
+    # Served from the in-memory prefix index; never touches the database
+    field = request.args.get('field', 'keywords')
+    if field not in FIELD_GROUPS:
+        abort(400)
+    limit = max(1, min(request.args.get('limit', 8, type=int), MAX_SUGGESTIONS))
+    query = request.args.get('q', '')
+    suggestions = autocomplete.suggest(field, query, limit)
+    response = jsonify({
+        'field': field,
+        'query': query,
+        'suggestions': [{'value': value, 'count': count} for value, count in suggestions],
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+@bp.route('/job/<int:job_id>')
+@conditional_requests.conditional(job_validators, max_age=300)
+@page_cache.cached('jobs')
 def job_detail(job_id):
     job = Job.query.get_or_404(job_id)
     
@@ -187,12 +352,26 @@ def job_detail(job_id):
     
     return render_template('job_detail.html', job=job, has_applied=has_applied, user_application=user_application)
 
-@app.route('/apply/<int:job_id>', methods=['GET', 'POST'])
+def _create_application(user_id, job_id, employer_id, cover_letter, resume_text):
+    application = Application(
+        user_id=user_id,
+        job_id=job_id,
+        cover_letter=cover_letter,
+        resume_text=resume_text
+    )
+    db.session.add(application)
+    db.session.flush()
+    notify('application.created', application_id=application.id, job_id=job_id,
+           user_id=user_id, employer_id=employer_id)
+    return application.id
+
+@bp.route('/apply/<int:job_id>', methods=['GET', 'POST'])
 @login_required
+@rate_limiter.limit('apply', methods=('POST',))
 def apply_job(job_id):
     if current_user.role != 'job_seeker':
         flash('Only job seekers can apply for jobs.', 'error')
-        return redirect(url_for('job_detail', job_id=job_id))
+        return redirect(url_for('main.job_detail', job_id=job_id))
     
     job = Job.query.get_or_404(job_id)
     
@@ -203,72 +382,127 @@ def apply_job(job_id):
     
     if existing_application:
         flash('You have already applied for this job.', 'info')
-        return redirect(url_for('job_detail', job_id=job_id))
+        return redirect(url_for('main.job_detail', job_id=job_id))
     
     form = ApplicationForm()
     if form.validate_on_submit():
-        application = Application(
-            user_id=current_user.id,
-            job_id=job_id,
-            cover_letter=form.cover_letter.data,
-            resume_text=form.resume_text.data
-        )
-        
-        db.session.add(application)
-        db.session.commit()
+        try:
+            group_commit.run(_create_application, current_user.id, job_id, job.employer_id,
+                             form.cover_letter.data, form.resume_text.data)
+        except GroupCommitTimeout:
+            return _busy('Your application may still be submitted in a moment; '
+                         'check My Applications before applying again.', 'main.my_applications')
         
         flash('Application submitted successfully!', 'success')
-        return redirect(url_for('job_detail', job_id=job_id))
+        return redirect(url_for('main.job_detail', job_id=job_id))
     
     return render_template('job_detail.html', job=job, form=form, applying=True)
 
-@app.route('/my-jobs')
+@bp.route('/my-jobs')
 @login_required
+@query_budget(3)
 def my_jobs():
     if current_user.role not in ['employer', 'admin']:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
-    jobs = Job.query.filter_by(employer_id=current_user.id)\
-        .order_by(Job.posted_date.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    jobs = paginate_listing(Job.query.filter_by(employer_id=current_user.id),
+                            (Job.posted_date, Job.id))
     
     return render_template('my_jobs.html', jobs=jobs)
 
-@app.route('/my-applications')
+@bp.route('/my-applications')
 @login_required
+@query_budget(3)
 def my_applications():
     if current_user.role != 'job_seeker':
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    page = request.args.get('page', 1, type=int)
-    applications = Application.query.filter_by(user_id=current_user.id)\
-        .order_by(Application.applied_date.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    applications = paginate_listing(Application.query.options(APPLICATION_JOB)
+                                    .filter_by(user_id=current_user.id),
+                                    (Application.applied_date, Application.id))
     
     return render_template('applications.html', applications=applications)
 
-@app.route('/job/<int:job_id>/applications')
+@bp.route('/job/<int:job_id>/applications')
 @login_required
+@query_budget(4)
 def job_applications(job_id):
     job = Job.query.get_or_404(job_id)
     
     # Only job owner or admin can view applications
     if current_user.role != 'admin' and job.employer_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+    
+    match_scores = None
+    if request.args.get('sort') == 'match' and job_matcher.available:
+        # Every applicant scored against the job in one pass, best fit first
+        ranked = job_matcher.rank_applications(job)
+        match_scores = dict(ranked)
+        applications = paginate_ranked(
+            [application_id for application_id, score in ranked],
+            lambda ids: Application.query.options(APPLICATION_APPLICANT).filter(Application.id.in_(ids)).all()
+        )
+    else:
+        applications = paginate_listing(Application.query.options(APPLICATION_APPLICANT)
+                                        .filter_by(job_id=job_id),
+                                        (Application.applied_date, Application.id))
+    
+    return render_template('applications.html', applications=applications, job=job,
+                           match_scores=match_scores, matching=job_matcher.available)
+
+@bp.route('/job/<int:job_id>/applications/export.<fmt>')
+@login_required
+def export_job_applications(job_id, fmt):
+    job = Job.query.get_or_404(job_id)
+    
+    # Only job owner or admin can export applications
+    if current_user.role != 'admin' and job.employer_id != current_user.id:
+        flash('Access denied.', 'error')
+        return redirect(url_for('main.dashboard'))
+    if fmt not in exports.FORMATS:
+        abort(404)
+    
+    statement, key = exports.job_applications_export(job_id)
+    return exports.stream_export(statement, key, f'job-{job_id}-applications', fmt,
+                                 gzip=request.args.get('gzip') == '1')
+
+@bp.route('/my-jobs/export.<fmt>')
+@login_required
+def export_my_jobs(fmt):
+    if current_user.role not in ['employer', 'admin']:
+        flash('Access denied.', 'error')
+        return redirect(url_for('main.dashboard'))
+    if fmt not in exports.FORMATS:
+        abort(404)
     
-    page = request.args.get('page', 1, type=int)
-    applications = Application.query.filter_by(job_id=job_id)\
-        .order_by(Application.applied_date.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    statement, key = exports.employer_jobs_export(current_user.id)
+    return exports.stream_export(statement, key, 'my-jobs', fmt, gzip=request.args.get('gzip') == '1')
+
+@bp.route('/admin/export/<dataset>.<fmt>')
+@login_required
+def admin_export(dataset, fmt):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('main.dashboard'))
+    if dataset not in exports.ADMIN_EXPORTS or fmt not in exports.FORMATS:
+        abort(404)
     
-    return render_template('applications.html', applications=applications, job=job)
+    statement, key = exports.ADMIN_EXPORTS[dataset]()
+    return exports.stream_export(statement, key, dataset, fmt, gzip=request.args.get('gzip') == '1')
 
-@app.route('/application/<int:app_id>/update-status/<status>')
+def _set_application_status(app_id, status):
+    application = db.session.get(Application, app_id)
+    application.status = status
+    application.reviewed_date = datetime.utcnow()
+    notify('application.status_changed', application_id=application.id, job_id=application.job_id,
+           user_id=application.user_id, status=status)
+
+@bp.route('/application/<int:app_id>/update-status/<status>')
 @login_required
+@replica_router.primary  # a GET that writes
 def update_application_status(app_id, status):
     application = Application.query.get_or_404(app_id)
     job = application.job
@@ -276,67 +510,129 @@ def update_application_status(app_id, status):
     # Only job owner or admin can update status
     if current_user.role != 'admin' and job.employer_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
-    if status in ['pending', 'reviewed', 'accepted', 'rejected']:
-        application.status = status
-        application.reviewed_date = datetime.utcnow()
-        db.session.commit()
+    if status in APPLICATION_STATUSES:
+        try:
+            group_commit.run(_set_application_status, application.id, status)
+        except GroupCommitTimeout:
+            return _busy('The status may still be updated in a moment.', 'main.job_applications', job_id=job.id)
         flash(f'Application status updated to {status}.', 'success')
     else:
         flash('Invalid status.', 'error')
     
-    return redirect(url_for('job_applications', job_id=job.id))
+    return redirect(url_for('main.job_applications', job_id=job.id))
 
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
+@query_budget(7)
 def admin_panel():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+    
+    # Headline totals from the maintained counters
+    totals = get_counts('users', 'jobs', 'applications')
     
-    # Get statistics and recent data
-    users = User.query.order_by(User.created_at.desc()).all()
-    jobs = Job.query.order_by(Job.posted_date.desc()).all()
-    applications = Application.query.order_by(Application.applied_date.desc()).limit(20).all()
+    # One page of users and jobs at a time, each tab paged independently
+    users = User.query.order_by(User.created_at.desc(), User.id.desc()).paginate(
+        page=request.args.get('users_page', 1, type=int), per_page=ADMIN_PER_PAGE, error_out=False
+    )
+    jobs = Job.query.options(JOB_POSTER)\
+        .order_by(Job.posted_date.desc(), Job.id.desc()).paginate(
+            page=request.args.get('jobs_page', 1, type=int), per_page=ADMIN_PER_PAGE, error_out=False
+        )
+    applications = Application.query.options(APPLICATION_APPLICANT, APPLICATION_JOB)\
+        .order_by(Application.applied_date.desc()).limit(20).all()
     
-    return render_template('admin.html', users=users, jobs=jobs, applications=applications)
+    return render_template('admin.html', users=users, jobs=jobs, applications=applications,
+                           total_users=totals['users'], total_jobs=totals['jobs'],
+                           total_applications=totals['applications'])
 
-@app.route('/admin/toggle-user-status/<int:user_id>')
+@bp.route('/admin/cache-metrics')
 @login_required
+def cache_metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(dict(page_cache.metrics(), conditional=conditional_requests.metrics()))
+
+@bp.route('/admin/rate-limit-metrics')
+@login_required
+def rate_limit_metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(rate_limiter.metrics())
+
+@bp.route('/admin/task-metrics')
+@login_required
+def task_metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(task_queue.metrics())
+
+@bp.route('/admin/db-metrics')
+@login_required
+def db_metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(dict(replica_router.metrics(), sqlite=sqlite_mode.metrics(),
+                        group_commit=group_commit.metrics()))
+
+@bp.route('/admin/sql-metrics')
+@login_required
+def sql_metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return jsonify(sql_instrumentation.snapshot())
+
+def _toggle_active(model, row_id):
+    row = db.session.get(model, row_id)
+    row.is_active = not row.is_active
+    return row.is_active
+
+@bp.route('/admin/toggle-user-status/<int:user_id>')
+@login_required
+@replica_router.primary  # a GET that writes
 def toggle_user_status(user_id):
     if current_user.role != 'admin':
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     user = User.query.get_or_404(user_id)
     if user.id == current_user.id:
         flash('You cannot deactivate your own account.', 'error')
-        return redirect(url_for('admin_panel'))
+        return redirect(url_for('main.admin_panel'))
     
-    user.is_active = not user.is_active
-    db.session.commit()
+    try:
+        is_active = group_commit.run(_toggle_active, User, user.id)
+    except GroupCommitTimeout:
+        return _busy(f'User {user.username} may still be updated in a moment; check before trying again.',
+                     'main.admin_panel')
     
-    status = 'activated' if user.is_active else 'deactivated'
+    status = 'activated' if is_active else 'deactivated'
     flash(f'User {user.username} has been {status}.', 'success')
-    return redirect(url_for('admin_panel'))
+    return redirect(url_for('main.admin_panel'))
 
-@app.route('/admin/toggle-job-status/<int:job_id>')
+@bp.route('/admin/toggle-job-status/<int:job_id>')
 @login_required
+@replica_router.primary  # a GET that writes
 def toggle_job_status(job_id):
     if current_user.role != 'admin':
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     job = Job.query.get_or_404(job_id)
-    job.is_active = not job.is_active
-    db.session.commit()
+    try:
+        is_active = group_commit.run(_toggle_active, Job, job.id)
+    except GroupCommitTimeout:
+        return _busy(f'Job "{job.title}" may still be updated in a moment; check before trying again.',
+                     'main.admin_panel')
     
-    status = 'activated' if job.is_active else 'deactivated'
+    status = 'activated' if is_active else 'deactivated'
     flash(f'Job "{job.title}" has been {status}.', 'success')
-    return redirect(url_for('admin_panel'))
+    return redirect(url_for('main.admin_panel'))
 
-@app.route('/edit-job/<int:job_id>', methods=['GET', 'POST'])
+@bp.route('/edit-job/<int:job_id>', methods=['GET', 'POST'])
 @login_required
 def edit_job(job_id):
     job = Job.query.get_or_404(job_id)
@@ -344,42 +640,53 @@ def edit_job(job_id):
     # Only job owner or admin can edit
     if current_user.role != 'admin' and job.employer_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     form = JobForm(obj=job)
     if form.validate_on_submit():
-        form.populate_obj(job)
-        db.session.commit()
+        # Loaded again, checked and changed under the write lock
+        with sqlite_mode.immediate(db.session):
+            job = Job.query.get_or_404(job_id)
+            if current_user.role != 'admin' and job.employer_id != current_user.id:
+                abort(403)
+            form.populate_obj(job)
+            db.session.commit()
         flash('Job updated successfully!', 'success')
-        return redirect(url_for('my_jobs'))
+        return redirect(url_for('main.my_jobs'))
     
-    return render_template('post_job.html', form=form, job=job, editing=True)
+    return render_template('post_jobs.html', form=form, job=job, editing=True)
 
-@app.route('/delete-job/<int:job_id>')
+@bp.route('/delete-job/<int:job_id>')
 @login_required
+@replica_router.primary  # a GET that writes
 def delete_job(job_id):
     job = Job.query.get_or_404(job_id)
     
     # Only job owner or admin can delete
     if current_user.role != 'admin' and job.employer_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
-    
-    db.session.delete(job)
-    db.session.commit()
+        return redirect(url_for('main.dashboard'))
+    
+    # Hidden right away; the job and its applications are removed in the
+    # background (tasks.delete_job)
+    with sqlite_mode.immediate(db.session):
+        job = Job.query.get_or_404(job_id)
+        job.is_active = False
+        task_queue.enqueue('delete_job', job_id=job.id)
+        db.session.commit()
     flash('Job deleted successfully.', 'success')
-    return redirect(url_for('my_jobs'))
+    return redirect(url_for('main.my_jobs'))
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
 
 # Context processor to make current year available in templates
-@app.context_processor
+@bp.app_context_processor
 def utility_processor():
     return dict(current_year=datetime.now().year)
\ No newline at end of file
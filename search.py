@@ -0,0 +1,213 @@
+import re
+import logging
+from sqlalchemy import event, text, func, literal_column, Float, Integer
+from app import db
+from models import Job
+
+# Words shorter than this are dropped from the full-text query
+MIN_TERM_LENGTH = 2
+
+def parse_terms(keywords):
+    # Split free text into search terms, keeping only word characters so
+    # nothing in the user input can be interpreted as query syntax
+    terms = re.findall(r'\w+', (keywords or '').lower())
+    return [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+
+class LikeSearchBackend:
+    # Fallback for databases without a supported full-text engine
+    name = 'like'
+
+    def setup(self, connection):
+        pass
+
+    def installed(self, connection):
+        return True
+
+    def index_job(self, connection, job):
+        pass
+
+    def remove_job(self, connection, job_id):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def apply(self, query, keywords, ranked=True):
+        for term in parse_terms(keywords):
+            query = query.filter(db.or_(
+                Job.title.contains(term),
+                Job.company.contains(term),
+                Job.description.contains(term)
+            ))
+        return query.order_by(Job.posted_date.desc()) if ranked else query
+
+class SqliteFtsSearchBackend:
+    # SQLite FTS5 table holding the searchable text of every active job,
+    # keyed by rowid = job.id
+    name = 'fts5'
+    table = 'job_fts'
+
+    def installed(self, connection):
+        return connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': self.table}).first() is not None
+
+    def setup(self, connection):
+        if self.installed(connection):
+            return
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+            "title, company, description, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        self.rebuild(connection)
+
+    def index_job(self, connection, job):
+        self.remove_job(connection, job.id)
+        if not job.is_active:
+            return
+        connection.execute(text(
+            f"INSERT INTO {self.table} (rowid, title, company, description) "
+            "VALUES (:id, :title, :company, :description)"
+        ), {'id': job.id, 'title': job.title, 'company': job.company, 'description': job.description})
+
+    def remove_job(self, connection, job_id):
+        connection.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), {'id': job_id})
+
+    def rebuild(self, connection):
+        connection.execute(text(f"DELETE FROM {self.table}"))
+        connection.execute(text(
+            f"INSERT INTO {self.table} (rowid, title, company, description) "
+            "SELECT id, title, company, description FROM job WHERE is_active = 1"
+        ))
+
+    def match_expression(self, terms):
+        # Every term must match (implicit AND), each as a prefix
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def apply(self, query, keywords, ranked=True):
+        terms = parse_terms(keywords)
+        if not terms:
+            return query.order_by(Job.posted_date.desc()) if ranked else query
+        match = self.match_expression(terms)
+        if not ranked:
+            # A plain filter: the MATCH is evaluated once, without scoring every hit
+            matching_ids = text(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH :match")\
+                .bindparams(match=match).columns(rowid=Integer)
+            return query.filter(Job.id.in_(matching_ids))
+        # bm25() is lower for better matches; weight title over company over description
+        matches = text(
+            f"SELECT rowid AS job_id, bm25({self.table}, 10.0, 5.0, 1.0) AS rank "
+            f"FROM {self.table} WHERE {self.table} MATCH :match"
+        ).bindparams(match=match).columns(job_id=Integer, rank=Float).subquery('job_matches')
+        query = query.join(matches, matches.c.job_id == Job.id)
+        return query.order_by(matches.c.rank, Job.posted_date.desc())
+
+class PostgresSearchBackend:
+    # tsvector over title/company/description served by an expression GIN
+    # index, so the index is kept current by Postgres itself
+    name = 'tsvector'
+    config = 'english'
+    index_name = 'ix_job_search_vector'
+
+    def document(self):
+        return func.setweight(func.to_tsvector(self.config, func.coalesce(Job.title, '')), literal_column("'A'"))\
+            .op('||')(func.setweight(func.to_tsvector(self.config, func.coalesce(Job.company, '')), literal_column("'B'")))\
+            .op('||')(func.setweight(func.to_tsvector(self.config, func.coalesce(Job.description, '')), literal_column("'C'")))
+
+    def setup(self, connection):
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {self.index_name} ON job USING GIN (("
+            f"setweight(to_tsvector('{self.config}', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(company, '')), 'B') || "
+            f"setweight(to_tsvector('{self.config}', coalesce(description, '')), 'C')))"
+        ))
+
+    def installed(self, connection):
+        # Queries work without the GIN index, only slower
+        return True
+
+    def index_job(self, connection, job):
+        pass
+
+    def remove_job(self, connection, job_id):
+        pass
+
+    def rebuild(self, connection):
+        connection.execute(text(f"REINDEX INDEX {self.index_name}"))
+
+    def apply(self, query, keywords, ranked=True):
+        terms = parse_terms(keywords)
+        if not terms:
+            return query.order_by(Job.posted_date.desc()) if ranked else query
+        ts_query = func.to_tsquery(self.config, ' & '.join(f'{term}:*' for term in terms))
+        document = self.document()
+        query = query.filter(document.op('@@')(ts_query))
+        return query.order_by(func.ts_rank(document, ts_query).desc(), Job.posted_date.desc()) if ranked else query
+
+BACKENDS = {
+    'sqlite': SqliteFtsSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+class JobSearch:
+    def __init__(self):
+        self.backend = LikeSearchBackend()
+
+    def init_app(self, app):
+        # The index itself is created by `flask init-db` (setup below); a
+        # worker only checks that it is there
+        backend = BACKENDS.get(db.engine.dialect.name, LikeSearchBackend)()
+        try:
+            with db.engine.connect() as connection:
+                installed = backend.installed(connection)
+        except Exception:
+            logging.exception("Could not check the full-text search index")
+            installed = False
+        if not installed:
+            logging.warning(f"No {backend.name} search index (run `flask init-db`); using LIKE search")
+            backend = LikeSearchBackend()
+        self.backend = backend
+        event.listen(db.session, 'after_flush', self._sync_after_flush)
+        app.extensions['job_search'] = self
+
+        @app.cli.command('rebuild-search-index')
+        def rebuild_search_index():
+            self.rebuild()
+            print(f"Rebuilt {self.backend.name} search index")
+
+    def setup(self):
+        backend = BACKENDS.get(db.engine.dialect.name, LikeSearchBackend)()
+        try:
+            with db.engine.begin() as connection:
+                backend.setup(connection)
+        except Exception:
+            logging.exception("Full-text search unavailable, falling back to LIKE search")
+            backend = LikeSearchBackend()
+        self.backend = backend
+        logging.info(f"Job search backend: {self.backend.name}")
+
+    def _sync_after_flush(self, session, flush_context):
+        # Keep the index in the same transaction as the job rows themselves
+        connection = session.connection()
+        for obj in session.new.union(session.dirty):
+            if isinstance(obj, Job):
+                self.backend.index_job(connection, obj)
+        for obj in session.deleted:
+            if isinstance(obj, Job):
+                self.backend.remove_job(connection, obj.id)
+
+    def index_jobs(self, connection, jobs):
+        # For writers that bypass the ORM session; each job needs id, title,
+        # company, description and is_active
+        for job in jobs:
+            self.backend.index_job(connection, job)
+
+    def apply(self, query, keywords, ranked=True):
+        # ranked=False only filters, for aggregate queries that can't carry an ORDER BY
+        return self.backend.apply(query, keywords, ranked)
+
+    def rebuild(self):
+        with db.engine.begin() as connection:
+            self.backend.rebuild(connection)
+
+job_search = JobSearch()
@@ -0,0 +1,232 @@
+import os
+import copy
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import g, has_request_context
+from sqlalchemy import event
+
+_local = threading.local()
+
+def _file_database(engine):
+    # In-memory databases are private to one connection: nothing to tune
+    database = engine.url.database or ''
+    return engine.dialect.name == 'sqlite' and database not in ('', ':memory:') and 'mode=memory' not in database
+
+class SQLiteMode:
+    # Production settings for file-backed SQLite. WAL lets readers run
+    # alongside the one writer; the pragmas below are set on every new
+    # connection. A deferred BEGIN that reads first and then writes fails
+    # at once with "database is locked" if another writer has committed in
+    # between, without waiting out busy_timeout. So code that writes runs
+    # inside immediate(), whose transactions begin with BEGIN IMMEDIATE;
+    # everything else begins deferred
+    def __init__(self):
+        self.enabled = False
+        self.pragmas = {}
+
+    def init_app(self, app, db):
+        app.extensions['sqlite_mode'] = self
+        if not app.config.get('SQLITE_PRODUCTION_MODE', True):
+            return
+        self.pragmas = {
+            'journal_mode': 'WAL',
+            # Safe with WAL: an OS crash may lose the last commits, never corrupt the file
+            'synchronous': 'NORMAL',
+            'busy_timeout': app.config.get('SQLITE_BUSY_TIMEOUT_MS', 10000),
+            'cache_size': -1024 * app.config.get('SQLITE_CACHE_SIZE_MB', 64),  # negative means KiB
+            'mmap_size': 1024 * 1024 * app.config.get('SQLITE_MMAP_SIZE_MB', 256),
+            'temp_store': 'MEMORY',
+            'journal_size_limit': 64 * 1024 * 1024,
+        }
+        with app.app_context():
+            engines = [engine for engine in db.engines.values() if _file_database(engine)]
+        for engine in engines:
+            event.listen(engine, 'connect', self._configure)
+            event.listen(engine, 'begin', self._begin)
+        self.enabled = bool(engines)
+
+    def _configure(self, dbapi_connection, connection_record):
+        # Transactions are begun by _begin rather than by the driver, which
+        # would otherwise always use a deferred BEGIN (and break savepoints)
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    def _begin(self, connection):
+        if connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+            return
+        # Straight to the driver, so query budgets don't count the BEGIN
+        connection.connection.driver_connection.execute(
+            'BEGIN IMMEDIATE' if getattr(_local, 'immediate', False) else 'BEGIN')
+
+    @contextmanager
+    def immediate(self, session=None):
+        # Transactions begun inside take the write lock up front, for code
+        # that reads and then writes based on what it read. A session that
+        # may already have read (a request's, once the user is loaded) is
+        # passed in: its open transaction is committed first, so its next
+        # one begins here. Nothing may be pending in it
+        if session is not None:
+            session.commit()
+        previous = getattr(_local, 'immediate', False)
+        _local.immediate = True
+        try:
+            yield
+        finally:
+            _local.immediate = previous
+
+    def metrics(self):
+        return {'enabled': self.enabled, 'pragmas': self.pragmas}
+
+sqlite_mode = SQLiteMode()
+
+class GroupCommitTimeout(Exception):
+    # The writer thread didn't get to a write within SQLITE_GROUP_COMMIT_TIMEOUT
+    # seconds. It may still be committed later
+    pass
+
+class _Write:
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+
+class GroupCommit:
+    # Short write transactions from concurrent requests, run by one writer
+    # thread per process. Everything queued while the previous batch was
+    # committing goes into the next one: each write in its own savepoint,
+    # the batch under a single BEGIN IMMEDIATE ... COMMIT. SQLite serializes
+    # writers anyway; batching pays for the write lock and the WAL commit
+    # once per batch instead of once per request
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.window = 0
+        self.max_batch = 64
+        self.timeout = 30
+        self.stats = Counter()
+        self.batch_sizes = deque(maxlen=1000)
+        self.waits = deque(maxlen=1000)
+        self._queue = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = sqlite_mode.enabled and app.config.get('SQLITE_GROUP_COMMIT', True)
+        # A window > 0 holds each batch open a little longer for more writes
+        self.window = app.config.get('SQLITE_GROUP_COMMIT_WINDOW_MS', 0) / 1000
+        self.max_batch = app.config.get('SQLITE_GROUP_COMMIT_MAX_BATCH', 64)
+        self.timeout = app.config.get('SQLITE_GROUP_COMMIT_TIMEOUT', 30)
+        app.extensions['group_commit'] = self
+
+    def run(self, function, *args, **kwargs):
+        # Calls function(*args, **kwargs), which writes through db.session
+        # without committing, and returns its result once it is committed.
+        # With group commit on it runs in the writer thread's session: pass
+        # ids rather than the caller's objects, and return plain values
+        from app import db
+        if not self.enabled:
+            with sqlite_mode.immediate(db.session):
+                result = function(*args, **kwargs)
+                db.session.commit()
+            return result
+        write = _Write(function, args, kwargs)
+        self._get_queue().put(write)
+        if not write.done.wait(self.timeout):
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise GroupCommitTimeout()
+        if write.error is not None:
+            raise write.error
+        # Committed on the writer thread, so the replica router's commit
+        # hook never saw this request write; its reads stick to the primary
+        if has_request_context():
+            g.database_written = True
+        return write.result
+
+    def _get_queue(self):
+        # The writer is started lazily in each (possibly forked) worker process
+        with self._lock:
+            if self._queue is None or self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread_pid = os.getpid()
+                threading.Thread(target=self._writer, args=(self._queue,), name='group-commit', daemon=True).start()
+            return self._queue
+
+    def _writer(self, writes):
+        while True:
+            batch = [writes.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(writes.get(timeout=max(0, deadline - time.perf_counter()))
+                                 if self.window else writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self._commit(batch)
+            except Exception as error:
+                logging.exception(f"Group commit of {len(batch)} writes failed")
+                for write in batch:
+                    if write.error is None:
+                        write.error = error
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.stats['batches'] += 1
+                    self.stats['writes'] += len(batch)
+                    self.stats['failed'] += sum(write.error is not None for write in batch)
+                    self.batch_sizes.append(len(batch))
+                    self.waits.extend(finished - write.queued_at for write in batch)
+                for write in batch:
+                    write.done.set()
+
+    def _commit(self, batch):
+        from app import db
+        session = db.session
+        _local.immediate = True
+        try:
+            for write in batch:
+                # Listeners stash pending work in session.info during a
+                # flush; a write that fails must not leave its share behind
+                info = {key: copy.copy(value) for key, value in session.info.items()}
+                try:
+                    with session.begin_nested():
+                        write.result = write.function(*write.args, **write.kwargs)
+                except Exception as error:
+                    # Only this write is undone; the rest of the batch goes ahead
+                    write.error = error
+                    session.info.clear()
+                    session.info.update(info)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            _local.immediate = False
+
+    def metrics(self):
+        with self._lock:
+            sizes, waits, stats = list(self.batch_sizes), sorted(self.waits), dict(self.stats)
+        return dict(
+            stats,
+            enabled=self.enabled,
+            avg_batch=round(sum(sizes) / len(sizes), 2) if sizes else 0,
+            max_batch=max(sizes, default=0),
+            avg_wait_ms=round(sum(waits) / len(waits) * 1000, 3) if waits else 0,
+            p95_wait_ms=round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0,
+        )
+
+group_commit = GroupCommit()
@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import Counter
+from datetime import datetime, timedelta, time as time_of_day
+import click
+from flask import current_app
+from sqlalchemy import event, select, update, delete, func
+from app import db
+from models import Job, Application, Task
+import counters
+from sqlite_mode import sqlite_mode
+
+logger = logging.getLogger('tasks')
+
+DELETE_CHUNK_SIZE = 500
+EXPIRY_BATCH_SIZE = 500
+
+class TaskQueue:
+    # Tasks are rows in the application database, so the queue needs no
+    # broker and an enqueued task commits or rolls back with the request
+    # that created it
+    def __init__(self):
+        self.app = None
+        self.handlers = {}
+        self.periodic_tasks = {}
+        self.workers = 0
+        self.poll_interval = 1.0
+        self.retry_delay = 10
+        self.timeout = 600
+        self.retention = timedelta(days=7)
+        self.stats = Counter()
+        self._next_run = {}
+        self._threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('TASK_WORKERS', 1)
+        self.poll_interval = app.config.get('TASK_POLL_INTERVAL', 1.0)
+        self.retry_delay = app.config.get('TASK_RETRY_DELAY', 10)
+        self.timeout = app.config.get('TASK_TIMEOUT', 600)
+        self.retention = timedelta(days=app.config.get('TASK_RETENTION_DAYS', 7))
+        event.listen(db.session, 'after_commit', self._wake_after_commit)
+        # Worker threads start with the first request, so CLI commands
+        # never pick up tasks they would abandon on exit
+        app.before_request(self._start_workers)
+        app.extensions['task_queue'] = self
+
+        @app.cli.command('run-worker')
+        @click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+        def run_worker(burst):
+            self.work(burst=burst)
+
+    def task(self, name=None, max_attempts=5):
+        def decorator(function):
+            self.handlers[name or function.__name__] = (function, max_attempts)
+            return function
+        return decorator
+
+    def periodic(self, config_key, default_interval, max_attempts=1):
+        # Queued by whichever worker notices it is due; the interval in
+        # seconds comes from app.config[config_key]
+        def decorator(function):
+            self.periodic_tasks[function.__name__] = (config_key, default_interval)
+            return self.task(max_attempts=max_attempts)(function)
+        return decorator
+
+    def enqueue(self, name, delay=0, **payload):
+        function, max_attempts = self.handlers[name]
+        task = Task(name=name, payload=json.dumps(payload), max_attempts=max_attempts,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay))
+        db.session.add(task)
+        db.session.info['tasks_enqueued'] = True
+        return task
+
+    def enqueue_on(self, connection, name, delay=0, **payload):
+        # For session event hooks and Core writers: the task joins the
+        # transaction of `connection` (picked up on the next poll)
+        function, max_attempts = self.handlers[name]
+        now = datetime.utcnow()
+        connection.execute(Task.__table__.insert().values(
+            name=name, payload=json.dumps(payload), status='queued', attempts=0,
+            max_attempts=max_attempts, run_at=now + timedelta(seconds=delay), created_at=now
+        ))
+
+    def _wake_after_commit(self, session):
+        if session.info.pop('tasks_enqueued', False):
+            self._wake.set()
+
+    def _start_workers(self):
+        if self._threads or not self.workers:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work_in_context, name=f'task-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work_in_context(self):
+        with self.app.app_context():
+            self.work()
+
+    def work(self, burst=False):
+        while True:
+            try:
+                self._schedule_periodic()
+                task = self._claim()
+            except Exception:
+                logger.exception("Task queue poll failed")
+                db.session.remove()
+                task = None
+            if task is None:
+                if burst:
+                    return
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._run(task)
+            except Exception:
+                # e.g. the database was unreachable while recording the
+                # outcome; the task is requeued once it goes stale
+                logger.exception(f"Task {task.id} ({task.name}) could not be finished")
+                db.session.remove()
+
+    def _schedule_periodic(self):
+        now = time.monotonic()
+        for name, (config_key, default_interval) in self.periodic_tasks.items():
+            if now < self._next_run.get(name, 0):
+                continue
+            self._next_run[name] = now + self.app.config.get(config_key, default_interval)
+            # Every process schedules, so skip if another one already has
+            with sqlite_mode.immediate(db.session):
+                pending = db.session.execute(select(Task.id).where(
+                    Task.name == name, Task.status.in_(['queued', 'running'])
+                ).limit(1)).first()
+                if pending is None:
+                    self.enqueue(name)
+                db.session.commit()
+
+    def _claim(self):
+        # The conditional UPDATE makes a claim atomic across threads and
+        # processes without relying on SELECT ... FOR UPDATE SKIP LOCKED
+        table = Task.__table__
+        now = datetime.utcnow()
+        with sqlite_mode.immediate(), db.engine.begin() as connection:
+            candidates = connection.execute(
+                select(table.c.id).where(table.c.status == 'queued', table.c.run_at <= now)
+                .order_by(table.c.run_at, table.c.id).limit(5)
+            ).scalars().all()
+            for task_id in candidates:
+                claimed = connection.execute(
+                    update(table).where(table.c.id == task_id, table.c.status == 'queued')
+                    .values(status='running', started_at=now, attempts=table.c.attempts + 1)
+                ).rowcount
+                if claimed:
+                    return connection.execute(select(table).where(table.c.id == task_id)).one()
+        return None
+
+    def _finish(self, task_id, **values):
+        with db.engine.begin() as connection:
+            connection.execute(update(Task.__table__).where(Task.__table__.c.id == task_id).values(**values))
+
+    def _run(self, task):
+        function, max_attempts = self.handlers.get(task.name, (None, 0))
+        try:
+            if function is None:
+                raise LookupError(f"No handler registered for task {task.name}")
+            function(**json.loads(task.payload))
+        except Exception as error:
+            db.session.rollback()
+            now = datetime.utcnow()
+            message = f'{type(error).__name__}: {error}'
+            if task.attempts < task.max_attempts:
+                # Exponential backoff: 10s, 20s, 40s, ... with the default delay
+                delay = self.retry_delay * 2 ** (task.attempts - 1)
+                logger.warning(f"Task {task.id} ({task.name}) attempt {task.attempts} failed, "
+                               f"retrying in {delay}s: {message}")
+                self._finish(task.id, status='queued', run_at=now + timedelta(seconds=delay), last_error=message)
+                self.stats[f'{task.name}.retried'] += 1
+            else:
+                logger.exception(f"Task {task.id} ({task.name}) failed after {task.attempts} attempts")
+                self._finish(task.id, status='failed', finished_at=now, last_error=message)
+                self.stats[f'{task.name}.failed'] += 1
+        else:
+            self._finish(task.id, status='done', finished_at=datetime.utcnow())
+            self.stats[f'{task.name}.done'] += 1
+        finally:
+            db.session.remove()
+
+    def requeue_stale(self):
+        # Tasks left running by a worker that died are retried, or failed
+        # once they are out of attempts
+        table = Task.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=self.timeout)
+        stale = (table.c.status == 'running') & (table.c.started_at < cutoff)
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(stale, table.c.attempts < table.c.max_attempts)
+                               .values(status='queued', last_error='Timed out'))
+            connection.execute(update(table).where(stale)
+                               .values(status='failed', finished_at=datetime.utcnow(), last_error='Timed out'))
+
+    def purge(self):
+        table = Task.__table__
+        cutoff = datetime.utcnow() - self.retention
+        with db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.status == 'done', table.c.finished_at < cutoff))
+
+    def metrics(self):
+        now = datetime.utcnow()
+        depth = dict.fromkeys(['queued', 'running', 'done', 'failed'], 0)
+        depth.update(db.session.execute(select(Task.status, func.count(Task.id)).group_by(Task.status)).all())
+        oldest = db.session.execute(select(func.min(Task.run_at)).where(
+            Task.status == 'queued', Task.run_at <= now
+        )).scalar()
+        recent = db.session.execute(
+            select(Task.run_at, Task.started_at, Task.finished_at)
+            .where(Task.status == 'done', Task.finished_at >= now - timedelta(hours=1))
+            .order_by(Task.finished_at.desc()).limit(1000)
+        ).all()
+        waits = [(started - run_at).total_seconds() for run_at, started, finished in recent]
+        runs = [(finished - started).total_seconds() for run_at, started, finished in recent]
+        return {
+            'depth': depth,
+            'oldest_due_age_s': round((now - oldest).total_seconds(), 3) if oldest else 0,
+            'last_hour': {
+                'completed': len(recent),
+                'avg_wait_s': round(sum(waits) / len(waits), 3) if waits else 0,
+                'max_wait_s': round(max(waits), 3) if waits else 0,
+                'avg_run_s': round(sum(runs) / len(runs), 3) if runs else 0,
+            },
+            'workers_alive': sum(thread.is_alive() for thread in self._threads),
+            'this_process': dict(self.stats),
+        }
+
+task_queue = TaskQueue()
+
+def notify(event_name, **data):
+    # Queue a notification; delivery happens off the request path
+    return task_queue.enqueue('send_notification', event_name=event_name, **data)
+
+@task_queue.task(max_attempts=8)
+def send_notification(event_name, **data):
+    body = json.dumps(dict(data, event=event_name))
+    logger.info(f"Notification {body}")
+    url = current_app.config.get('NOTIFICATION_WEBHOOK_URL')
+    if not url:
+        return
+    request = urllib.request.Request(url, data=body.encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    # Errors, including non-2xx responses, raise and the task is retried
+    with urllib.request.urlopen(request, timeout=current_app.config.get('NOTIFICATION_TIMEOUT', 10)) as response:
+        response.read()
+
+@task_queue.task()
+def delete_job(job_id):
+    # Applications go first, a chunk per short transaction, so deleting a
+    # popular job never holds a long write lock. Safe to retry part-way
+    from analytics import Rollup
+    table = Application.__table__
+    job_table = Job.__table__
+    while True:
+        with sqlite_mode.immediate(), db.engine.begin() as connection:
+            rows = connection.execute(select(table.c.id, table.c.status, table.c.applied_date, table.c.reviewed_date)
+                                      .where(table.c.job_id == job_id).limit(DELETE_CHUNK_SIZE)).all()
+            if not rows:
+                break
+            connection.execute(delete(table).where(table.c.id.in_([row.id for row in rows])))
+            deltas = Counter(f'applications_{row.status or "pending"}' for row in rows)
+            deltas['applications'] = len(rows)
+            counters.apply_deltas(connection, {name: -count for name, count in deltas.items()})
+            # Take the applications out of the analytics rollups, as the
+            # session hooks would have
+            job = connection.execute(select(job_table.c.id, job_table.c.employer_id, job_table.c.category,
+                                            job_table.c.job_type).where(job_table.c.id == job_id)).first()
+            if job is not None:
+                rollup = Rollup()
+                for row in rows:
+                    rollup.count_application(job, row.applied_date, row.status, row.reviewed_date, -1)
+                rollup.write(connection)
+            connection.execute(update(Job.__table__).where(Job.__table__.c.id == job_id)
+                               .values(application_count=Job.__table__.c.application_count - len(rows),
+                                       updated_at=Job.__table__.c.updated_at))
+    # The job itself goes through the session so the counters, search index
+    # and page cache see it
+    with sqlite_mode.immediate(db.session):
+        job = db.session.get(Job, job_id)
+        if job is not None:
+            db.session.delete(job)
+        db.session.commit()
+
+@task_queue.periodic('JOB_EXPIRY_INTERVAL', 300)
+def expire_jobs():
+    # Deactivate jobs once their deadline day has passed
+    cutoff = datetime.combine(datetime.utcnow().date(), time_of_day())
+    while True:
+        with sqlite_mode.immediate(db.session):
+            jobs = Job.query.filter(Job.is_active == True, Job.deadline < cutoff)\
+                .limit(EXPIRY_BATCH_SIZE).all()  # noqa: E712
+            for job in jobs:
+                job.is_active = False
+            # Also when there was nothing to do: the write lock is held until then
+            db.session.commit()
+        if not jobs:
+            return
+
+@task_queue.periodic('TASK_MAINTENANCE_INTERVAL', 60)
+def maintain_task_queue():
+    task_queue.requeue_stale()
+    task_queue.purge()
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import update
+from app import create_app, db
+import counters
+import migrations
+from models import User, Job, Application, StatCounter
+
+# Counters move with every committed change through the session hooks,
+# and repair() recomputes them all from the rows (counters.py)
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        migrations.init_db()
+    return app
+
+def _user(username, role):
+    user = User(username=username, email=f'{username}@example.com', password_hash='-',
+                first_name=username, last_name='Test', role=role)
+    db.session.add(user)
+    return user
+
+def _job(employer, title='Engineer'):
+    job = Job(title=title, company='Acme', description='Builds things', location='Remote',
+              category='Technology', employer_id=employer.id)
+    db.session.add(job)
+    return job
+
+def _counts():
+    return counters.get_counts(*counters.COUNTER_NAMES)
+
+def test_counters_follow_session_changes(app):
+    with app.app_context():
+        employer = _user('employer', 'employer')
+        seekers = [_user(f'seeker{number}', 'job_seeker') for number in range(3)]
+        db.session.flush()
+        job, other = _job(employer), _job(employer, 'Designer')
+        db.session.flush()
+        applications = [Application(user_id=seeker.id, job_id=job.id) for seeker in seekers]
+        db.session.add_all(applications)
+        db.session.commit()
+        counts = _counts()
+        assert (counts['users'], counts['users_active'], counts['jobs'], counts['jobs_active']) == (4, 4, 2, 2)
+        assert (counts['applications'], counts['applications_pending']) == (3, 3)
+        assert job.application_count == 3
+
+        applications[0].status = 'reviewed'
+        other.is_active = False
+        seekers[2].is_active = False
+        db.session.commit()
+        counts = _counts()
+        assert (counts['applications_pending'], counts['applications_reviewed']) == (2, 1)
+        assert (counts['jobs'], counts['jobs_active']) == (2, 1)
+        assert (counts['users'], counts['users_active']) == (4, 3)
+
+        db.session.delete(applications[1])
+        db.session.commit()
+        db.session.refresh(job)
+        assert job.application_count == 2
+        assert _counts()['applications'] == 2
+
+def test_rolled_back_changes_leave_counters_alone(app):
+    with app.app_context():
+        employer = _user('employer', 'employer')
+        db.session.commit()
+        before = _counts()
+        _job(employer)
+        db.session.flush()
+        db.session.rollback()
+        assert _counts() == before
+
+def test_application_count_leaves_updated_at_alone(app):
+    with app.app_context():
+        employer, seeker = _user('employer', 'employer'), _user('seeker', 'job_seeker')
+        db.session.flush()
+        job = _job(employer)
+        db.session.commit()
+        updated_at = job.updated_at
+        db.session.add(Application(user_id=seeker.id, job_id=job.id))
+        db.session.commit()
+        db.session.refresh(job)
+        assert job.application_count == 1
+        assert job.updated_at == updated_at
+
+def test_repair_recomputes_drifted_counters(app):
+    with app.app_context():
+        employer, seeker = _user('employer', 'employer'), _user('seeker', 'job_seeker')
+        db.session.flush()
+        job = _job(employer)
+        db.session.flush()
+        db.session.add(Application(user_id=seeker.id, job_id=job.id, status='accepted'))
+        db.session.commit()
+        expected = _counts()
+        with db.engine.begin() as connection:
+            connection.execute(update(StatCounter.__table__).values(value=99))
+            connection.execute(update(Job.__table__).values(application_count=7))
+        assert _counts()['jobs'] == 99
+
+        with db.engine.begin() as connection:
+            counters.repair(connection)
+        db.session.expire_all()
+        assert _counts() == expected
+        assert db.session.get(Job, job.id).application_count == 1
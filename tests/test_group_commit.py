@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+from app import create_app, db
+import migrations
+from counters import get_count
+from models import User, Job
+from sqlite_mode import group_commit, GroupCommitTimeout
+
+# Writes from concurrent requests share one transaction on the writer
+# thread; a failing write is undone on its own, and a caller that waits
+# too long gets GroupCommitTimeout (sqlite_mode.py)
+
+@pytest.fixture
+def app(tmp_path):
+    # Group commit needs a file-backed database in production mode
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "jobs.db"}',
+                     SQLITE_GROUP_COMMIT=True, SQLITE_GROUP_COMMIT_WINDOW_MS=200,
+                     SQLITE_GROUP_COMMIT_TIMEOUT=5)
+    with app.app_context():
+        migrations.init_db()
+        db.session.add(User(username='employer', email='employer@example.com', password_hash='-',
+                            first_name='E', last_name='Test', role='employer'))
+        db.session.commit()
+    assert group_commit.enabled
+    return app
+
+def _add_job(title, fail=False):
+    employer = User.query.filter_by(username='employer').one()
+    job = Job(title=title, company='Acme', description='Builds things', location='Remote',
+              category='Technology', employer_id=employer.id)
+    db.session.add(job)
+    db.session.flush()
+    if fail:
+        raise ValueError(f'{title} failed')
+    return job.id
+
+def _run_together(app, writes):
+    # Each write from its own thread, all inside one batching window
+    outcomes = {}
+
+    def run(title, fail):
+        with app.app_context():
+            try:
+                outcomes[title] = group_commit.run(_add_job, title, fail=fail)
+            except Exception as error:
+                outcomes[title] = error
+
+    threads = [threading.Thread(target=run, args=write) for write in writes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def test_concurrent_writes_commit_in_one_batch(app):
+    before = dict(group_commit.stats)
+    outcomes = _run_together(app, [('One', False), ('Two', False), ('Three', False)])
+    assert all(isinstance(job_id, int) for job_id in outcomes.values())
+    assert group_commit.stats['batches'] - before.get('batches', 0) == 1
+    with app.app_context():
+        assert {job.title for job in Job.query} == {'One', 'Two', 'Three'}
+
+def test_a_failing_write_is_undone_alone(app):
+    before = dict(group_commit.stats)
+    outcomes = _run_together(app, [('Good', False), ('Bad', True), ('Also good', False)])
+    assert isinstance(outcomes['Bad'], ValueError)
+    assert isinstance(outcomes['Good'], int) and isinstance(outcomes['Also good'], int)
+    assert group_commit.stats['failed'] - before.get('failed', 0) == 1
+    with app.app_context():
+        assert {job.title for job in Job.query} == {'Good', 'Also good'}
+        # The failed write's counter deltas were discarded with it
+        assert get_count('jobs') == 2
+
+def test_a_slow_batch_times_out_the_caller(app, monkeypatch):
+    monkeypatch.setattr(group_commit, 'timeout', 0.05)
+
+    def slow_write():
+        time.sleep(0.5)
+        return _add_job('Slow')
+
+    with app.app_context():
+        with pytest.raises(GroupCommitTimeout):
+            group_commit.run(slow_write)
+    # It may still be committed afterwards
+    time.sleep(1)
+    with app.app_context():
+        assert Job.query.filter_by(title='Slow').count() == 1
+
+def test_a_timed_out_post_redirects_instead_of_failing(app, monkeypatch):
+    def timed_out(*args, **kwargs):
+        raise GroupCommitTimeout()
+
+    monkeypatch.setattr(group_commit, 'run', timed_out)
+    with app.app_context():
+        employer_id = User.query.filter_by(username='employer').one().id
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(employer_id)
+    response = client.post('/post-job', data={
+        'title': 'Engineer', 'company': 'Acme', 'description': 'A role building things',
+        'location': 'Remote', 'category': 'technology', 'job_type': 'full-time',
+    })
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/my-jobs')
+    with client.session_transaction() as session:
+        assert 'The server is busy' in session['_flashes'][0][1]
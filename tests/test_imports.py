@@ -0,0 +1,102 @@
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+from app import create_app, db
+import counters
+import migrations
+from imports import import_jobs, job_importer
+from models import User, Job, JobImport
+
+# Feeds are upserted on (employer, external_ref) in batches; bad rows are
+# reported and skipped (imports.py)
+HEADER = 'external_ref,title,company,description,location,category,job_type\n'
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        migrations.init_db()
+        for username in ('employer', 'other'):
+            db.session.add(User(username=username, email=f'{username}@example.com', password_hash='-',
+                                first_name=username, last_name='Test', role='employer'))
+        db.session.commit()
+    return app
+
+def _row(ref, title, category='technology'):
+    return f'{ref},{title},Acme,A role building things,Remote,{category},full-time\n'
+
+def _import(feed, username='employer', fmt='csv', batch_size=2):
+    employer_id = User.query.filter_by(username=username).one().id
+    return import_jobs(io.BytesIO(feed.encode()), fmt, employer_id, batch_size=batch_size)
+
+def _titles(username='employer'):
+    employer_id = User.query.filter_by(username=username).one().id
+    return {job.external_ref: job.title for job in Job.query.filter_by(employer_id=employer_id)}
+
+def test_new_rows_are_inserted_and_counted(app):
+    with app.app_context():
+        stats = _import(HEADER + _row('a', 'One') + _row('b', 'Two') + _row('c', 'Three'))
+        assert (stats['inserted'], stats['updated'], stats['failed']) == (3, 0, 0)
+        assert _titles() == {'a': 'One', 'b': 'Two', 'c': 'Three'}
+        assert counters.get_counts('jobs', 'jobs_active') == {'jobs': 3, 'jobs_active': 3}
+
+def test_known_references_are_updated_in_place(app):
+    with app.app_context():
+        _import(HEADER + _row('a', 'One') + _row('b', 'Two'))
+        ids = {job.external_ref: job.id for job in Job.query}
+        stats = _import(HEADER + _row('a', 'One again') + _row('c', 'Three'))
+        assert (stats['inserted'], stats['updated']) == (1, 1)
+        db.session.expire_all()
+        assert _titles() == {'a': 'One again', 'b': 'Two', 'c': 'Three'}
+        assert db.session.get(Job, ids['a']).title == 'One again'
+        assert counters.get_count('jobs') == 3
+
+def test_references_are_per_employer(app):
+    with app.app_context():
+        _import(HEADER + _row('a', 'Mine'))
+        _import(HEADER + _row('a', 'Theirs'), username='other')
+        assert _titles() == {'a': 'Mine'}
+        assert _titles('other') == {'a': 'Theirs'}
+
+def test_a_repeated_reference_in_one_feed_keeps_the_last_row(app):
+    with app.app_context():
+        stats = _import(HEADER + _row('a', 'First') + _row('a', 'Second'), batch_size=10)
+        assert (stats['inserted'], stats['updated']) == (1, 1)
+        assert _titles() == {'a': 'Second'}
+
+def test_invalid_rows_are_reported_and_skipped(app):
+    with app.app_context():
+        feed = HEADER + _row('a', 'One') + _row('b', 'Bad', category='nonsense') + _row('c', 'Three')
+        stats = _import(feed)
+        assert (stats['inserted'], stats['failed']) == (2, 1)
+        assert stats['errors'][0]['row'] == 2
+        assert 'category' in stats['errors'][0]['errors']
+        assert set(_titles()) == {'a', 'c'}
+
+def test_jsonl_feeds(app):
+    with app.app_context():
+        record = {'external_ref': 'j', 'title': 'From JSON', 'company': 'Acme', 'description': 'A role',
+                  'location': 'Remote', 'category': 'technology', 'job_type': 'full-time'}
+        stats = _import(json.dumps(record) + '\nnot json\n', fmt='jsonl')
+        assert (stats['inserted'], stats['failed']) == (1, 1)
+        assert _titles() == {'j': 'From JSON'}
+
+def test_stalled_imports_are_marked_failed(app):
+    with app.app_context():
+        employer_id = User.query.filter_by(username='employer').one().id
+        long_ago = datetime.utcnow() - job_importer.stale_after - timedelta(minutes=1)
+        imports = {status: JobImport(employer_id=employer_id, filename=f'{status}.csv', format='csv', status=status)
+                   for status in ('pending', 'running', 'finished')}
+        imports['recent'] = JobImport(employer_id=employer_id, filename='recent.csv', format='csv', status='running')
+        db.session.add_all(imports.values())
+        db.session.flush()
+        for name in ('pending', 'running', 'finished'):
+            imports[name].updated_at = long_ago
+        db.session.commit()
+
+        assert job_importer.fail_stale() == 2
+        db.session.expire_all()
+        assert {name: job_import.status for name, job_import in imports.items()} == \
+            {'pending': 'failed', 'running': 'failed', 'finished': 'finished', 'recent': 'running'}
+        assert 'interrupted' in json.loads(imports['running'].errors)[0]['errors']['import'][0]
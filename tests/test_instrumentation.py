@@ -0,0 +1,58 @@
+import pytest
+from app import create_app, db
+import migrations
+from models import Job
+from instrumentation import query_budget, statement_shape, sql_instrumentation, QueryBudgetExceeded
+
+# Per-request statement counts on the response, N+1 detection and strict
+# query budgets (instrumentation.py)
+
+def _make_app(**overrides):
+    app = create_app('testing', SQL_INSTRUMENTATION='headers', **overrides)
+    with app.app_context():
+        migrations.init_db()
+
+    @app.route('/_test/jobs/<int:count>')
+    @query_budget(2)
+    def run_queries(count):
+        for job_id in range(count):
+            db.session.get(Job, job_id + 1)
+        return 'ok'
+    return app
+
+@pytest.fixture
+def app():
+    return _make_app(SQL_STRICT_BUDGETS=False)
+
+def test_headers_report_the_statements_of_the_request(app):
+    response = app.test_client().get('/_test/jobs/2')
+    assert response.status_code == 200
+    assert response.headers['X-DB-Query-Count'] == '2'
+    assert float(response.headers['X-DB-Time-Ms']) >= 0
+    assert 'X-DB-N-Plus-One' not in response.headers
+
+def test_repeated_statements_are_reported_as_n_plus_one(app):
+    response = app.test_client().get('/_test/jobs/6')
+    assert response.headers['X-DB-Query-Count'] == '6'
+    assert response.headers['X-DB-N-Plus-One'] == '6x from view'
+
+def test_metrics_count_requests_over_budget(app):
+    sql_instrumentation.metrics.clear()
+    client = app.test_client()
+    client.get('/_test/jobs/1')
+    client.get('/_test/jobs/3')
+    stats = sql_instrumentation.snapshot()['run_queries']
+    assert stats['requests'] == 2
+    assert stats['max_queries'] == 3
+    assert stats['over_budget'] == 1
+    assert stats['avg_queries'] == 2
+
+def test_strict_mode_fails_requests_over_budget():
+    client = _make_app(SQL_STRICT_BUDGETS=True).test_client()
+    assert client.get('/_test/jobs/2').status_code == 200
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/_test/jobs/3')
+
+def test_statement_shape_ignores_literal_list_lengths():
+    assert statement_shape('SELECT * FROM job WHERE id IN (?, ?, ?)') == \
+        statement_shape('SELECT *\n  FROM job WHERE id IN (?)')
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+from werkzeug.exceptions import BadRequest
+from itsdangerous import URLSafeSerializer
+from app import create_app, db
+import migrations
+from models import User, Job
+from pagination import encode_cursor, decode_cursor, keyset_paginate
+
+# Keyset cursors are signed, so a client can't forge or edit one to reach
+# rows by a key of its choosing (pagination.py)
+COLUMNS = (Job.posted_date, Job.id)
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        migrations.init_db()
+        employer = User(username='employer', email='employer@example.com', password_hash='-',
+                        first_name='E', last_name='Test', role='employer')
+        db.session.add(employer)
+        db.session.flush()
+        start = datetime(2024, 1, 1)
+        db.session.add_all(Job(title=f'Job {number}', company='Acme', description='Builds things',
+                               location='Remote', category='Technology', employer_id=employer.id,
+                               posted_date=start + timedelta(hours=number))
+                           for number in range(25))
+        db.session.commit()
+    return app
+
+def test_cursor_round_trips(app):
+    with app.test_request_context():
+        job = Job.query.order_by(Job.id).first()
+        direction, values = decode_cursor(encode_cursor(job, COLUMNS, 'next'), COLUMNS)
+    assert direction == 'next'
+    assert values == [job.posted_date, job.id]
+
+def test_tampered_cursor_is_rejected(app):
+    with app.test_request_context():
+        token = encode_cursor(Job.query.first(), COLUMNS, 'next')
+        tampered = token[:-2] + ('AA' if not token.endswith('AA') else 'BB')
+        with pytest.raises(BadRequest):
+            decode_cursor(tampered, COLUMNS)
+
+def test_cursor_signed_with_another_key_is_rejected(app):
+    with app.test_request_context():
+        forged = URLSafeSerializer('not-the-secret', salt='pagination-cursor').dumps(['next', '2030-01-01T00:00:00', 1])
+        with pytest.raises(BadRequest):
+            decode_cursor(forged, COLUMNS)
+
+def test_cursor_for_other_columns_is_rejected(app):
+    with app.test_request_context():
+        token = encode_cursor(Job.query.first(), COLUMNS, 'next')
+        with pytest.raises(BadRequest):
+            decode_cursor(token, (Job.id,))
+
+def test_listing_rejects_a_garbage_cursor(app):
+    assert app.test_client().get('/jobs?cursor=garbage').status_code == 400
+
+def test_keyset_pages_neither_skip_nor_repeat(app):
+    seen = []
+    with app.test_request_context():
+        cursor = None
+        while True:
+            page = keyset_paginate(Job.query, COLUMNS, cursor, per_page=10)
+            seen.extend(job.id for job in page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        back = keyset_paginate(Job.query, COLUMNS, page.prev_cursor, per_page=10)
+    assert len(seen) == len(set(seen)) == 25
+    assert [job.id for job in back.items] == seen[10:20]
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import pytest
+from app import create_app, db
+import migrations
+from models import User, Job, Application
+from identity import identity_cache
+
+# The statement count of each page must not grow with the data behind it
+# (no N+1 queries), as counted by the X-DB-Query-Count header (instrumentation.py)
+PAGES = ('index', 'employer_dashboard', 'view_applications', 'admin_panel')
+N = 4
+
+@pytest.fixture
+def app():
+    app = create_app('testing', SQL_INSTRUMENTATION='headers')
+    with app.app_context():
+        migrations.init_db()
+    # Requests must not share an app context (and with it g) with the test
+    return app
+
+def _user(username, role):
+    user = User(username=username, email=f'{username}@example.com', password_hash='-',
+                first_name=username, last_name='Test', role=role, company_name='Acme')
+    db.session.add(user)
+    return user
+
+def _seed(count, employer_id, start):
+    # count more jobs, seekers and applications, all on the employer's jobs,
+    # with half of the applications on the first job
+    jobs = Job.query.filter_by(employer_id=employer_id).order_by(Job.id).all()
+    for number in range(start, start + count):
+        jobs.append(Job(title=f'Engineer {number}', company='Acme', description='Builds things',
+                        location='Remote', category='Technology', job_type='Full-time',
+                        employer_id=employer_id, posted_date=datetime.utcnow() - timedelta(hours=number)))
+        db.session.add(jobs[-1])
+    db.session.flush()
+    for number in range(start, start + count):
+        seeker = _user(f'seeker{number}', 'job_seeker')
+        db.session.flush()
+        job = jobs[0] if number % 2 else jobs[number]
+        db.session.add(Application(user_id=seeker.id, job_id=job.id, cover_letter='Hello\nthere',
+                                   status='reviewed' if number % 3 else 'pending'))
+    db.session.commit()
+    return jobs[0].id
+
+def _statement_counts(client, employer_id, admin_id, job_id):
+    counts = {}
+    for page, user_id, url in (('index', None, '/'),
+                               ('employer_dashboard', employer_id, '/dashboard'),
+                               ('view_applications', employer_id, f'/job/{job_id}/applications'),
+                               ('admin_panel', admin_id, '/admin')):
+        with client.session_transaction() as session:
+            session.clear()
+            if user_id is not None:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        # Every request pays for loading the user, as on a cold worker
+        identity_cache.invalidate(user_id)
+        response = client.get(url)
+        assert response.status_code == 200, (page, response.headers.get('Location'))
+        counts[page] = int(response.headers['X-DB-Query-Count'])
+    return counts
+
+def test_statement_counts_do_not_grow_with_data(app):
+    with app.app_context():
+        employer = _user('employer', 'employer')
+        admin = _user('admin', 'admin')
+        db.session.commit()
+        employer_id, admin_id = employer.id, admin.id
+        job_id = _seed(N, employer_id, 0)
+    client = app.test_client()
+    small = _statement_counts(client, employer_id, admin_id, job_id)
+
+    with app.app_context():
+        _seed(2 * N, employer_id, N)
+        assert Job.query.count() == 3 * N
+        assert Application.query.count() == 3 * N
+    large = _statement_counts(client, employer_id, admin_id, job_id)
+
+    assert set(small) == set(PAGES)
+    assert large == small
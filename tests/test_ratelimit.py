@@ -0,0 +1,59 @@
+import pytest
+from app import create_app
+import migrations
+from ratelimit import LocalRateLimitBackend
+
+# Token buckets per client, user and route; requests over a limit get 429
+# with Retry-After (ratelimit.py)
+
+def _make_app(limits):
+    app = create_app('testing', RATELIMIT_ENABLED=True, RATELIMITS=limits)
+    with app.app_context():
+        migrations.init_db()
+    return app
+
+def _log_in(client, address='10.0.0.1'):
+    return client.post('/login', data={'username': 'nobody', 'password': 'wrong'},
+                       environ_base={'REMOTE_ADDR': address})
+
+def test_requests_over_the_limit_get_429_with_retry_after():
+    client = _make_app({'login': {'ip': (2, 0.1)}}).test_client()
+    assert _log_in(client).status_code == 200
+    assert _log_in(client).status_code == 200
+    response = _log_in(client)
+    assert response.status_code == 429
+    # One token back at 0.1 per second
+    assert response.headers['Retry-After'] == '10'
+
+def test_limits_are_per_client_address():
+    client = _make_app({'login': {'ip': (1, 0.1)}}).test_client()
+    assert _log_in(client, '10.0.0.1').status_code == 200
+    assert _log_in(client, '10.0.0.1').status_code == 429
+    assert _log_in(client, '10.0.0.2').status_code == 200
+
+def test_only_the_limited_methods_are_counted():
+    client = _make_app({'login': {'ip': (1, 0.1)}}).test_client()
+    for _ in range(3):
+        assert client.get('/login').status_code == 200
+    assert _log_in(client).status_code == 200
+
+def test_a_blocked_request_spends_no_tokens():
+    backend = LocalRateLimitBackend()
+    buckets = [('a', 5, 1), ('b', 1, 1)]
+    assert backend.take(buckets, 1, now=0) == (0.0, None)
+    wait, blocked = backend.take(buckets, 1, now=0)
+    assert (wait, blocked) == (1.0, 1)
+    # Bucket 'a' was not charged for the refused request
+    assert backend.take([('a', 5, 1)], 4, now=0) == (0.0, None)
+
+def test_buckets_refill_over_time():
+    backend = LocalRateLimitBackend()
+    assert backend.take([('a', 2, 0.5)], 2, now=0) == (0.0, None)
+    assert backend.take([('a', 2, 0.5)], 1, now=1)[1] == 0
+    assert backend.take([('a', 2, 0.5)], 1, now=2) == (0.0, None)
+
+
+@pytest.mark.parametrize('limits', [{'login': {'ip': (10, 0)}}, {'login': {'ip': (0, 1)}}])
+def test_limits_must_be_positive(limits):
+    with pytest.raises(ValueError, match=r"RATELIMITS\['login'\]\['ip'\]"):
+        create_app('testing', RATELIMIT_ENABLED=True, RATELIMITS=limits)
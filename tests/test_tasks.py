@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+from app import create_app, db
+import migrations
+from models import Task
+from tasks import task_queue
+
+# Failed tasks are retried with exponential backoff until max_attempts,
+# then marked failed; tasks left running by a dead worker are requeued (tasks.py)
+calls = []
+
+@task_queue.task(name='test_flaky', max_attempts=3)
+def flaky(succeed_on):
+    calls.append(succeed_on)
+    if len(calls) < succeed_on:
+        raise RuntimeError(f'attempt {len(calls)} failed')
+
+@pytest.fixture
+def app(monkeypatch):
+    app = create_app('testing', TASK_RETRY_DELAY=10)
+    with app.app_context():
+        migrations.init_db()
+    # Only the tasks a test enqueues
+    monkeypatch.setattr(task_queue, 'periodic_tasks', {})
+    calls.clear()
+    return app
+
+def _enqueue(**payload):
+    task = task_queue.enqueue('test_flaky', **payload)
+    db.session.commit()
+    return task.id
+
+def _make_due(task_id):
+    with db.engine.begin() as connection:
+        connection.execute(update(Task.__table__).where(Task.__table__.c.id == task_id)
+                           .values(run_at=datetime.utcnow()))
+
+def test_a_successful_task_is_done(app):
+    with app.app_context():
+        task_id = _enqueue(succeed_on=1)
+        task_queue.work(burst=True)
+        task = db.session.get(Task, task_id)
+        assert (task.status, task.attempts) == ('done', 1)
+        assert task.finished_at is not None
+
+def test_failures_are_retried_with_exponential_backoff(app):
+    with app.app_context():
+        task_id = _enqueue(succeed_on=3)
+        delays = []
+        for attempt in (1, 2):
+            started = datetime.utcnow()
+            task_queue.work(burst=True)
+            task = db.session.get(Task, task_id)
+            assert (task.status, task.attempts) == ('queued', attempt)
+            assert task.last_error == f'RuntimeError: attempt {attempt} failed'
+            delays.append((task.run_at - started).total_seconds())
+            db.session.commit()
+            # Not yet due, so a worker leaves it alone
+            task_queue.work(burst=True)
+            assert len(calls) == attempt
+            _make_due(task_id)
+        assert delays[0] == pytest.approx(10, abs=1)
+        assert delays[1] == pytest.approx(20, abs=1)
+
+        task_queue.work(burst=True)
+        task = db.session.get(Task, task_id)
+        assert (task.status, task.attempts) == ('done', 3)
+
+def test_tasks_fail_after_max_attempts(app):
+    with app.app_context():
+        task_id = _enqueue(succeed_on=10)
+        for _ in range(3):
+            task_queue.work(burst=True)
+            _make_due(task_id)
+        task_queue.work(burst=True)
+        task = db.session.get(Task, task_id)
+        assert (task.status, task.attempts) == ('failed', 3)
+        assert task.last_error == 'RuntimeError: attempt 3 failed'
+        assert len(calls) == 3
+
+def test_unknown_tasks_fail_instead_of_stalling_the_queue(app):
+    with app.app_context():
+        db.session.add(Task(name='no_such_task', payload='{}', max_attempts=1, run_at=datetime.utcnow()))
+        db.session.commit()
+        task_queue.work(burst=True)
+        task = Task.query.filter_by(name='no_such_task').one()
+        assert task.status == 'failed'
+        assert task.last_error.startswith('LookupError')
+
+def test_stale_running_tasks_are_requeued(app):
+    with app.app_context():
+        task_id = _enqueue(succeed_on=1)
+        long_ago = datetime.utcnow() - timedelta(seconds=task_queue.timeout + 60)
+        with db.engine.begin() as connection:
+            connection.execute(update(Task.__table__).where(Task.__table__.c.id == task_id)
+                               .values(status='running', attempts=1, started_at=long_ago))
+        task_queue.requeue_stale()
+        task = db.session.get(Task, task_id)
+        assert (task.status, task.last_error) == ('queued', 'Timed out')